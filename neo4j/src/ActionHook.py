@@ -5,10 +5,8 @@ from typing import Set
 from NeoGraph import getGraph
 from ClassStructure import determineObjectType, getClassHierarchy
 from PathAnalyzerHelper import analyzeFunctionSensitivity
-import pandas as pd
 from Settings import HOOK_INFO_STORE_PATH, FN_SENSITIVITY_INFO_PATH
 from NeoHelper import concatTree
-from Detectors.Runtime import PLUGIN_NAME
 import re
 
 global __HOOK_INFO
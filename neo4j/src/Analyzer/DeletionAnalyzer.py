@@ -1,6 +1,5 @@
 from .Analyzer import AbstractAnalyzer, LawType, ComplianceScore
 from typing import List
-from Detectors.Runtime import SECURITY_DETECTOR_MANAGER
 from PathAnalyzerHelper import *
 from .ComplianceFinding import ComplianceFinding
 from Detectors.Scores import ScoreType
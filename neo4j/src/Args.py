@@ -6,7 +6,8 @@
 import argparse
 import os
 import sys
-from typing import Tuple
+import threading
+from typing import NamedTuple, Optional, Tuple
 from NeoGraph import getGraph
 from Settings import ROOT_DIR, SRC_DIR
 import json
@@ -27,7 +28,8 @@ def getPluginName():
     else:
         return 'unknown'
 def handleArgs() -> Tuple[str, str, str, str]:
-    plugin_name = getPluginName()
+    # Only ask the graph for the plugin name if it is not given on the command line.
+    plugin_name = None
     plugin_path = "/var/www/html/"
     results_database = os.path.join(ROOT_DIR, "results", "results.sqlite")
     data_flow_log = os.path.join(ROOT_DIR, "results", "DataFlowTracking.log")
@@ -35,7 +37,7 @@ def handleArgs() -> Tuple[str, str, str, str]:
     # Preemptively exit if we detect that a test harness is being ran.
     if any(["Test.py" in s for s in sys.argv]) or any(["unittest" in s for s in sys.argv]):
         print("Skipping argument handling and assuming defaults...")
-        return (results_database, data_flow_log, plugin_name, plugin_path)
+        return (results_database, data_flow_log, getPluginName(), plugin_path)
 
     try:
         parser = argparse.ArgumentParser(
@@ -59,7 +61,7 @@ def handleArgs() -> Tuple[str, str, str, str]:
             "-p",
             "--pluginname",
             type=str,
-            help="The name of the plugin being analyzed.",
+            help="The name of the plugin being analyzed. Defaults to the name of the graph's top level directory.",
             default=plugin_name,
         )
         parser.add_argument(
@@ -84,8 +86,50 @@ def handleArgs() -> Tuple[str, str, str, str]:
         print("Invalid arguments... continuing with default argument values.")
         pass
 
+    if not plugin_name:
+        plugin_name = getPluginName()
     return (results_database, data_flow_log, plugin_name, plugin_path)
-DATABASE_DIR, DELETION_LOG_FILE, PLUGIN_NAME, PLUGIN_DIR = handleArgs()
+
+
+class AnalysisArgs(NamedTuple):
+    database_dir: str
+    deletion_log_file: str
+    plugin_name: str
+    plugin_dir: str
+
+
+# The arguments are parsed by getArgs() on first use, so importing a module does not parse sys.argv or query the graph.
+global __ARGS, __ARGS_LOCK
+__ARGS: Optional[AnalysisArgs] = None
+__ARGS_LOCK = threading.Lock()
+
+
+def getArgs() -> AnalysisArgs:
+    """Get the command line arguments of the analysis, parsing them on first use.
+
+    Returns:
+        AnalysisArgs: The results database, data flow log, plugin name and plugin directory.
+    """
+    global __ARGS
+    if __ARGS is None:
+        with __ARGS_LOCK:
+            if __ARGS is None:
+                __ARGS = AnalysisArgs(*handleArgs())
+    return __ARGS
+
+
+def __getattr__(name: str):
+    # DATABASE_DIR, DELETION_LOG_FILE, PLUGIN_NAME and PLUGIN_DIR used to be set at import time.
+    fields = {
+        "DATABASE_DIR": "database_dir",
+        "DELETION_LOG_FILE": "deletion_log_file",
+        "PLUGIN_NAME": "plugin_name",
+        "PLUGIN_DIR": "plugin_dir",
+    }
+    if name in fields:
+        return getattr(getArgs(), fields[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 PLUGIN_LINK = None
 PLUGIN_LINK_DATA_DIR = SRC_DIR+'/plugin_link_data.json'
@@ -102,7 +146,7 @@ def getPluginLink():
         del f
         plugin_link = 'http://placeHolderForPluginWebsite.com'
         for p in plugin_link_data:
-            if PLUGIN_NAME==p['LOCAL_NAME']:
+            if getArgs().plugin_name==p['LOCAL_NAME']:
                 plugin_link = p['AUTHOR_URL']
                 break
         PLUGIN_LINK=plugin_link
@@ -0,0 +1,324 @@
+# GDPR Checker project
+# Analyze many plugins concurrently, each in its own process and against its own graph store.
+#
+# Main.py and the modules it imports keep their state at module level (Args, NeoGraph, Detectors.Runtime, the
+# NodeEdgeManager buffers), so every plugin is analyzed by a fresh `python Main.py` process. The process is pointed at
+# one graph store -- a Neo4j server and database, written as [host][:port][/database] -- through the NEO4J_* environment
+# variables. Each store is leased to one plugin at a time, so there are as many concurrent analyses as stores. All
+# processes write to the same results.sqlite, and one summary line per plugin is saved to BatchResults.ResultDatabase.
+
+import argparse
+import ast
+import json
+import os
+import queue
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Dict, List, NamedTuple, Optional
+
+from BatchResults import ResultDatabase
+from Settings import NEO4J_BOLT_PORT, NEO4J_DATABASE, NEO4J_HOST, ROOT_DIR, SRC_DIR
+
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+STATUS_TIMEOUT = "timeout"
+
+
+class GraphStore(NamedTuple):
+    host: str
+    port: str
+    database: str
+
+    @classmethod
+    def parse(cls, spec: str) -> "GraphStore":
+        """Parse a store written as [host][:port][/database], e.g. "localhost:7688" or "/plugin2"."""
+        address, _, database = spec.partition("/")
+        host, _, port = address.partition(":")
+        return cls(host or NEO4J_HOST, port or NEO4J_BOLT_PORT, database or NEO4J_DATABASE)
+
+    def env(self) -> Dict[str, str]:
+        return {"NEO4J_HOST": self.host, "NEO4J_BOLT_PORT": self.port, "NEO4J_DATABASE": self.database}
+
+    def __str__(self) -> str:
+        return f"{self.host}:{self.port}/{self.database}"
+
+
+class PluginJob(NamedTuple):
+    name: str
+    path: str
+    # Directory with the plugin's NAVEX exports, if they are not in the default location.
+    exports: Optional[str] = None
+
+
+@dataclass
+class JobResult:
+    name: str
+    status: str
+    attempts: int
+    seconds: float
+    returncode: Optional[int]
+    store: str
+    log: str
+
+
+def find_plugins(paths: List[str], all_dirs: List[str], exports_dir: Optional[str] = None) -> List[PluginJob]:
+    """Collect the plugins to analyze.
+
+    Args:
+        paths (List[str]): Plugin directories.
+        all_dirs (List[str]): Directories whose subdirectories are all plugins.
+        exports_dir (Optional[str], optional): Directory with one subdirectory of NAVEX exports per plugin name.
+
+    Returns:
+        List[PluginJob]: The plugins, without duplicates.
+    """
+    plugin_dirs = list(paths)
+    for d in all_dirs:
+        plugin_dirs.extend(os.path.join(d, e) for e in sorted(os.listdir(d)) if os.path.isdir(os.path.join(d, e)))
+    jobs: List[PluginJob] = []
+    seen = set()
+    for path in plugin_dirs:
+        path = os.path.realpath(path)
+        if path in seen:
+            continue
+        seen.add(path)
+        name = os.path.basename(path)
+        exports = os.path.join(exports_dir, name) if exports_dir else None
+        jobs.append(PluginJob(name, path, exports))
+    return jobs
+
+
+def _run_process(command, env: Dict[str, str], timeout: Optional[float], log, shell: bool = False) -> Optional[int]:
+    """Run a command with its output appended to log; returns the exit code, or None if it timed out and was killed."""
+    process = subprocess.Popen(
+        command, cwd=SRC_DIR, env=env, stdout=log, stderr=subprocess.STDOUT, shell=shell, start_new_session=True
+    )
+    try:
+        return process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        # Kill the whole process group, including the node workers and subshells the analysis started.
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        process.wait()
+        return None
+
+
+def run_plugin(
+    job: PluginJob,
+    store: GraphStore,
+    database: str,
+    log_dir: str,
+    timeout: Optional[float] = None,
+    retries: int = 0,
+    load_command: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+) -> JobResult:
+    """Load one plugin into a graph store (if a load command is given) and analyze it with Main.py.
+
+    Args:
+        job (PluginJob): The plugin.
+        store (GraphStore): The graph store leased to this plugin.
+        database (str): Path of the shared results database.
+        log_dir (str): Directory for the per-plugin output logs.
+        timeout (Optional[float], optional): Seconds one attempt (load and analysis) may take. Defaults to no limit.
+        retries (int, optional): Additional attempts after a failure or timeout. Only used with a load_command: a
+            failed attempt leaves the store partly preprocessed, so it has to be reloaded first. Defaults to 0.
+        load_command (Optional[str], optional): Shell command that loads the plugin's graph into the store. It is
+            formatted with {plugin}, {path}, {exports}, {host}, {port} and {database}.
+        env (Optional[Dict[str, str]], optional): Additional environment variables for the load command and analysis.
+
+    Returns:
+        JobResult: How the last attempt went.
+    """
+    if retries and not load_command:
+        print(f"{job.name}: not retrying, since there is no load command to reset the store between attempts")
+        retries = 0
+    process_env = dict(os.environ)
+    process_env.update(store.env())
+    if job.exports:
+        process_env["NAVEX_RESULT_DIR"] = job.exports
+    process_env.update(env or dict())
+    log_path = os.path.join(log_dir, f"{job.name}.log")
+    analysis = [
+        sys.executable,
+        os.path.join(SRC_DIR, "Main.py"),
+        "--pluginname", job.name,
+        "--pluginpath", job.path,
+        "--database", database,
+        "--dataflowlog", os.path.join(log_dir, f"{job.name}_DataFlowTracking.log"),
+    ]
+
+    start = time.time()
+    returncode: Optional[int] = None
+    attempt = 0
+    with open(log_path, "w") as log:
+        for attempt in range(1, retries + 2):
+            log.write(f"### Attempt {attempt} on {store}\n")
+            log.flush()
+            deadline = time.time() + timeout if timeout else None
+            returncode = 0
+            if load_command:
+                command = load_command.format(
+                    plugin=job.name, path=job.path, exports=job.exports or "", **store._asdict()
+                )
+                returncode = _run_process(command, process_env, timeout, log, shell=True)
+            if returncode == 0:
+                remaining = max(deadline - time.time(), 0) if deadline else None
+                returncode = _run_process(analysis, process_env, remaining, log)
+            if returncode == 0:
+                break
+            log.write(f"### Attempt {attempt} {'timed out' if returncode is None else f'exited with {returncode}'}\n")
+            log.flush()
+
+    if returncode == 0:
+        status = STATUS_OK
+    elif returncode is None:
+        status = STATUS_TIMEOUT
+    else:
+        status = STATUS_FAILED
+    return JobResult(job.name, status, attempt, time.time() - start, returncode, str(store), log_path)
+
+
+def save_plugin_summary(results: ResultDatabase, database: str, plugin_name: str) -> bool:
+    """Save the summary line of an analyzed plugin, read back from the results database.
+
+    Returns:
+        bool: Whether the plugin was found in the results database.
+    """
+    with sqlite3.connect(database, timeout=60) as conn:
+        row = conn.execute(
+            """SELECT "plugin ID" FROM "Plugins" WHERE "plugin name" = ? ORDER BY "plugin ID" DESC LIMIT 1""",
+            (plugin_name,),
+        ).fetchone()
+        if not row:
+            return False
+        detectors = conn.execute(
+            """SELECT "detector type", "cryptography method", "api endpoint" FROM "Detectors" WHERE "plugin ID" = ?""",
+            (row[0],),
+        ).fetchall()
+
+    storage_nodes = sum(1 for t, _, _ in detectors if t in ("storage", "database"))
+    crypto_nodes = sum(1 for _, c, _ in detectors if c)
+    api_urls = set()
+    for _, _, urls in detectors:
+        try:
+            parsed = ast.literal_eval(urls) if urls else None
+        except (ValueError, SyntaxError):
+            parsed = None
+        if isinstance(parsed, (list, set, tuple)):
+            api_urls.update(str(u) for u in parsed)
+    # Data flow paths only exist as objects inside the analysis process, so they are not part of the summary.
+    results.save(plugin_name, storage_nodes, crypto_nodes, dict(), api_urls)
+    return True
+
+
+def run_batch(
+    jobs: List[PluginJob],
+    stores: List[GraphStore],
+    database: str,
+    output_dir: str,
+    timeout: Optional[float] = None,
+    retries: int = 0,
+    load_command: Optional[str] = None,
+    batch_results: Optional[ResultDatabase] = None,
+) -> List[JobResult]:
+    """Analyze plugins concurrently, one per graph store at a time.
+
+    Returns:
+        List[JobResult]: One result per plugin, in completion order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    free_stores: "queue.Queue[GraphStore]" = queue.Queue()
+    for store in stores:
+        free_stores.put(store)
+
+    def task(job: PluginJob) -> JobResult:
+        store = free_stores.get()
+        try:
+            return run_plugin(job, store, database, output_dir, timeout, retries, load_command)
+        finally:
+            free_stores.put(store)
+
+    results: List[JobResult] = []
+    with ThreadPoolExecutor(max_workers=len(stores)) as executor:
+        futures = [executor.submit(task, job) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result.status == STATUS_OK and batch_results is not None:
+                if not save_plugin_summary(batch_results, database, result.name):
+                    print(f"{result.name}: no results were recorded")
+            print(
+                f"[{len(results)}/{len(jobs)}] {result.name}: {result.status} after {result.attempts} attempt(s), "
+                f"{result.seconds:.1f}s on {result.store}"
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze many WordPress plugins concurrently.")
+    parser.add_argument("plugins", nargs="*", help="Plugin directories to analyze.")
+    parser.add_argument("-a", "--all", action="append", default=[], help="Analyze every subdirectory of this directory.")
+    parser.add_argument(
+        "-g",
+        "--graph",
+        action="append",
+        default=[],
+        help="Graph store as [host][:port][/database]; give it once per concurrent analysis. Defaults to one store.",
+    )
+    parser.add_argument("-e", "--exports", help="Directory with one subdirectory of NAVEX exports per plugin name.")
+    parser.add_argument("-c", "--load-command", help="Shell command that loads a plugin's graph into its store.")
+    parser.add_argument("-t", "--timeout", type=float, default=None, help="Seconds allowed per plugin attempt.")
+    parser.add_argument(
+        "-r", "--retries", type=int, default=0, help="Retries after a failure or timeout; needs --load-command."
+    )
+    parser.add_argument(
+        "-b", "--database", default=os.path.join(ROOT_DIR, "results", "results.sqlite"), help="Results database."
+    )
+    parser.add_argument("-o", "--output", default=os.path.join(ROOT_DIR, "results", "batch"), help="Output directory.")
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="After preprocessing, answer graph lookups from an in-process snapshot of the store. The store is still "
+        "used for loading and preprocessing.",
+    )
+    args = parser.parse_args()
+
+    jobs = find_plugins(args.plugins, args.all, args.exports)
+    if not jobs:
+        parser.error("no plugins to analyze")
+    if args.retries and not args.load_command:
+        parser.error("--retries needs --load-command, since a failed attempt leaves its store partly preprocessed")
+    stores = [GraphStore.parse(s) for s in args.graph] or [GraphStore(NEO4J_HOST, NEO4J_BOLT_PORT, NEO4J_DATABASE)]
+    if args.in_memory:
+        os.environ["IN_MEMORY_GRAPH"] = "1"
+    os.makedirs(os.path.dirname(os.path.realpath(args.database)), exist_ok=True)
+
+    print(f"Analyzing {len(jobs)} plugins on {len(stores)} graph stores")
+    start = time.time()
+    results = run_batch(
+        jobs,
+        stores,
+        os.path.realpath(args.database),
+        args.output,
+        args.timeout,
+        args.retries,
+        args.load_command,
+        ResultDatabase(os.path.join(args.output, "batch_results.csv")),
+    )
+
+    counts = {s: sum(1 for r in results if r.status == s) for s in (STATUS_OK, STATUS_FAILED, STATUS_TIMEOUT)}
+    print(f"Done in {time.time() - start:.1f}s: " + ", ".join(f"{v} {k}" for k, v in counts.items()))
+    with open(os.path.join(args.output, "batch_summary.json"), "w") as f:
+        json.dump([asdict(r) for r in results], f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
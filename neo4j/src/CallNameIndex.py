@@ -0,0 +1,140 @@
+# GDPR Checker project
+# Index of call nodes by the name of the called function or method, shared by the detectors.
+#
+# Detectors look calls up by a regular expression over the call name. Instead of one `=~` scan of the graph per
+# detector, every AST_CALL, AST_STATIC_CALL and AST_METHOD_CALL is loaded once and the patterns are matched against the
+# (much smaller) set of distinct names in memory.
+
+import re
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from NeoGraph import getGraph
+from Settings import CALL_NAME_INDEX
+
+CALL_TYPES = ("AST_CALL", "AST_STATIC_CALL", "AST_METHOD_CALL")
+
+
+class CallEntry(NamedTuple):
+    call: Dict[str, Any]
+    name: Dict[str, Any]
+    # Class name of a static call (Class::method()).
+    class_name: Optional[str]
+
+
+def cypherPatternToPython(pattern: str) -> str:
+    """Undo the string literal escapes Cypher applies to a pattern written inside `=~ "..."`."""
+    escapes = {"t": "\t", "n": "\n", "r": "\r", "b": "\b", "f": "\f"}
+    return re.sub(r"\\(.)", lambda m: escapes.get(m.group(1), m.group(1)), pattern)
+
+
+class CallNameIndex:
+    """Call nodes of one node label, keyed by call name (and static calls also by class name)."""
+
+    def __init__(self, entries: List[CallEntry]) -> None:
+        self.by_name: Dict[str, List[CallEntry]] = dict()
+        self.by_class: Dict[str, List[CallEntry]] = dict()
+        for entry in entries:
+            self.by_name.setdefault(entry.name.get("code", ""), []).append(entry)
+            if entry.class_name is not None:
+                self.by_class.setdefault(entry.class_name, []).append(entry)
+        self._lock = threading.Lock()
+        self._matches: Dict[str, Optional[List[str]]] = dict()
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self.by_name.values())
+
+    def _match_keys(self, pattern: str, keys: List[str]) -> Optional[List[str]]:
+        """Names that fully match a Cypher `=~` pattern, or None if Python cannot compile the pattern."""
+        try:
+            compiled = re.compile(cypherPatternToPython(pattern))
+        except re.error:
+            return None
+        return [k for k in keys if compiled.fullmatch(k)]
+
+    def match(self, pattern: str) -> Optional[List[CallEntry]]:
+        """Get the calls whose name matches a pattern, in the same form the detectors pass to Cypher's `=~`.
+
+        Returns:
+            Optional[List[CallEntry]]: The matching calls, or None if the pattern is not supported by Python's re module
+                (callers should then fall back to querying the graph).
+        """
+        with self._lock:
+            if pattern not in self._matches:
+                self._matches[pattern] = self._match_keys(pattern, list(self.by_name))
+            names = self._matches[pattern]
+        if names is None:
+            return None
+        return [entry for name in names for entry in self.by_name[name]]
+
+    def match_call_ids(self, pattern: str) -> Optional[List[int]]:
+        """Get the ids of calls whose name matches a pattern, and of static calls whose class name matches it."""
+        entries = self.match(pattern)
+        if entries is None:
+            return None
+        classes = self._match_keys(pattern, list(self.by_class))
+        if classes is None:
+            return None
+        output: List[int] = []
+        seen = set()
+        for entry in entries + [e for c in classes for e in self.by_class[c]]:
+            call_id = entry.call["id"]
+            if call_id not in seen:
+                seen.add(call_id)
+                output.append(call_id)
+        return output
+
+    @classmethod
+    def from_neo4j(cls, node_label: str = "AST") -> "CallNameIndex":
+        """Load every call of a node label with a single query."""
+        query = f"""
+        MATCH (call:{node_label}{{type:"AST_CALL"}})-[:PARENT_OF]->
+            (:{node_label}{{type:"AST_NAME", childnum:0}})-[:PARENT_OF]->
+            (name:{node_label}{{type:"string"}})
+        RETURN call, name, null AS class_name
+        UNION
+        MATCH (call:{node_label}{{type:"AST_STATIC_CALL"}})-[:PARENT_OF]->
+            (name:{node_label}{{type:"string", childnum:1}})
+        OPTIONAL MATCH (call)-[:PARENT_OF]->
+            (:{node_label}{{type:"AST_NAME", childnum:0}})-[:PARENT_OF]->
+            (class:{node_label}{{type:"string"}})
+        RETURN call, name, class.code AS class_name
+        UNION
+        MATCH (call:{node_label}{{type:"AST_METHOD_CALL"}})-[:PARENT_OF]->
+            (name:{node_label}{{type:"string", childnum:1}})
+        RETURN call, name, null AS class_name
+        """
+        entries = [CallEntry(dict(r["call"]), dict(r["name"]), r["class_name"]) for r in getGraph().run(query)]
+        return cls(entries)
+
+
+global __CALL_NAME_INDEXES, __CALL_NAME_INDEX_LOCK
+__CALL_NAME_INDEXES: Dict[str, CallNameIndex] = dict()
+__CALL_NAME_INDEX_LOCK = threading.Lock()
+
+
+def getCallNameIndex(node_label: str = "AST") -> Optional[CallNameIndex]:
+    """Get the call name index of a node label, building it on first use.
+
+    Returns:
+        Optional[CallNameIndex]: The index, or None if CALL_NAME_INDEX is disabled.
+    """
+    if not CALL_NAME_INDEX:
+        return None
+    index = __CALL_NAME_INDEXES.get(node_label, None)
+    if index is not None:
+        return index
+    with __CALL_NAME_INDEX_LOCK:
+        index = __CALL_NAME_INDEXES.get(node_label, None)
+        if index is None:
+            print(f"Building call name index for {node_label}... ", end="")
+            index = CallNameIndex.from_neo4j(node_label)
+            print(f"{len(index)} calls, {len(index.by_name)} names")
+            __CALL_NAME_INDEXES[node_label] = index
+    return index
+
+
+def invalidateCallNameIndex() -> None:
+    """Drop the call name indexes, e.g. after new nodes have been committed."""
+    with __CALL_NAME_INDEX_LOCK:
+        __CALL_NAME_INDEXES.clear()
@@ -5,7 +5,15 @@ from NeoGraph import getGraph
 from DataFlows import DataNode
 from NeoHelper import *
 from DataFlowTracking import reverseTrackDataFlowToParamORAssignNoRecord
+import json
+import os
 import signal
+import NodeEdgeManager
+from Settings import CLASS_HIERARCHY_VERSION
+
+# File in the plugin's preprocessing results directory where the class hierarchy is saved, along with the hash of the
+# input graph it was built from and the CLASS_HIERARCHY_VERSION of the code that built it.
+CLASS_HIERARCHY_SNAPSHOT_NAME = "class_hierarchy.json"
 
 #source: https://stackoverflow.com/questions/25027122/break-the-function-after-certain-time
 class TimeoutException(Exception):   # Custom exception class
@@ -154,27 +162,55 @@ class ClassHierarchy:
     def fillClassHierarchy(self):
         print("Start filling class hierarchy information")
         graph = getGraph()
-        #This query gets the class's interface, abstract class, class methods and class variables.
+        #This query gets the class's interfaces and parent class. Class variables and methods are fetched below for all
+        #classes at once and matched to their class in Python.
         classQuery = """
         MATCH (n:AST)-[:PARENT_OF]->(toplevel)
         WHERE n.type = 'AST_CLASS' AND toplevel.type = 'AST_TOPLEVEL'
         OPTIONAL MATCH (n)-[:PARENT_OF]->(m:AST)-[:PARENT_OF]->(astname:AST)-[:PARENT_OF]->(str)
         WHERE m.type = 'AST_NAME_LIST'
+        WITH n, toplevel, COLLECT(str.code) AS interfaces
         OPTIONAL MATCH (n)-[:PARENT_OF]->(astname2:AST)-[:PARENT_OF]->(str2)
         WHERE astname2.type = 'AST_NAME'
-        OPTIONAL MATCH (vars)
-        WHERE vars.funcid = toplevel.id AND vars.type = 'AST_PROP_DECL'
-        OPTIONAL MATCH (method)
-        WHERE method.classname = n.name AND method.type = 'AST_METHOD'
-        RETURN n,COLLECT(str.code) AS interfaces, COLLECT(str2.code) AS parent, COLLECT(vars.id) AS classVars, COLLECT(method) AS methods
+        RETURN n, toplevel.id AS toplevel, interfaces, COLLECT(str2.code) AS parent
         """
         classResult = graph.run(cypher = classQuery).data()
+        #class variables, keyed by the id of the class's toplevel node. The children of the declaration's children are
+        #ordered by childnum: the first is the variable name, the second (if any) its assigned value.
+        varQuery = """
+        MATCH (n:AST)-[:PARENT_OF]->(m)-[:PARENT_OF]->(x)
+        WHERE n.type = 'AST_PROP_DECL' AND n.funcid IN $toplevels
+        WITH n, m, x ORDER BY x.childnum ASC
+        RETURN n.funcid AS toplevel, n.id AS var, COLLECT(m.doccomment)[0] AS doccomment, COLLECT(x) AS xs
+        """
+        classVars: Dict[int, List[Dict[str, Any]]] = dict()
+        for r in graph.run(cypher = varQuery, toplevels = [c['toplevel'] for c in classResult]).data():
+            classVars.setdefault(r['toplevel'], []).append(r)
+        #class methods, keyed by class name, with their strong typed return type
+        methodQuery = """
+        MATCH (method:AST)
+        WHERE method.type = 'AST_METHOD' AND method.classname IN $classnames
+        OPTIONAL MATCH (method)-[:PARENT_OF]->(m:AST{childnum:3,type:'AST_NAME'})-[:PARENT_OF]->(x:AST)
+        RETURN method, COLLECT(x.code) AS returnTypes
+        """
+        classMethods: Dict[str, List[Dict[str, Any]]] = dict()
+        for r in graph.run(cypher = methodQuery, classnames = list({c['n']['name'] for c in classResult})).data():
+            classMethods.setdefault(r['method']['classname'], []).append(r)
+        #strong typed param types of the methods without doc comments
+        paramQuery = """
+        MATCH (x:AST)<-[:PARENT_OF]-(paramType:AST{childnum:0,type:'AST_NAME'})<-[:PARENT_OF]-(n:AST{type:'AST_PARAM'})-[:PARENT_OF]->(paramName:AST{childnum:1})
+        WHERE n.funcid IN $methods
+        RETURN n.funcid AS method, paramName.code, x.code
+        """
+        undocumented = [r['method']['id'] for rows in classMethods.values() for r in rows if not r['method']['doccomment']]
+        paramTypes: Dict[int, List[Dict[str, Any]]] = dict()
+        for r in graph.run(cypher = paramQuery, methods = undocumented).data():
+            paramTypes.setdefault(r['method'], []).append(r)
+
         for classObj in progress_bar(classResult):
             classInfo = classObj['n']
             interfaces = list(classObj['interfaces'])
             parentClass = list(classObj['parent'])
-            classVars = list(classObj['classVars'])
-            classMethods = list(classObj['methods'])
             classFlag = classInfo['flags']
             newClass = ASTClass(classInfo['id'],classInfo['name'])
             #handle interfaces
@@ -191,40 +227,29 @@ class ClassHierarchy:
                 elif 'CLASS_ABSTRACT' in classFlag:
                     newClass.isAbstract = True
             #handle class variables
-            for var in classVars:
-                varQuery = f"""
-                MATCH (n:AST{{id:{var}}})-[:PARENT_OF]->(m)-[:PARENT_OF]->(x)
-                RETURN x ORDER BY x.childnum ASC
-                """
-                varResult = graph.run(cypher = varQuery).data()
-                
-                if varResult:
-                    #This contains the variable name of a class variable
-                    tempNode = DataNode(var,varResult[0]['x']['code'])
-                    #if the length of the result is more than 1, it means that the variable is assigned a value. We store the nodeID of the 
-                    #value and will later make a data flow edge between them
-                    if len(varResult)>1:
-                        tempNode.value = varResult[1]['x']['id']
-                    
-                    #try to get the type of the class variable as written in the comment.
-                    varCommentQuery = f"""
-                    MATCH (n:AST{{id:{var}}})-[:PARENT_OF]->(m)
-                    RETURN m.doccomment
-                    """
-                    varCommentResult = graph.run(cypher = varCommentQuery).data()
-                    if varCommentResult and varCommentResult[0]['m.doccomment']:
-                        
-                        commentString = varCommentResult[0]['m.doccomment'].splitlines()
-                        for string in commentString:
-                            if '@var' in string:
-                                varType = string.split()
-                                if len(varType)>=3:
-                                    varType = varType[2]
-                                    tempNode.type = varType
-                    newClass.classVariables[varResult[0]['x']['code']] = tempNode 
-            for method in classMethods:
+            for varResult in classVars.get(classObj['toplevel'], []):
+                xs = varResult['xs']
+                #This contains the variable name of a class variable
+                tempNode = DataNode(varResult['var'],xs[0]['code'])
+                #if the length of the result is more than 1, it means that the variable is assigned a value. We store the nodeID of the
+                #value and will later make a data flow edge between them
+                if len(xs)>1:
+                    tempNode.value = xs[1]['id']
+
+                #try to get the type of the class variable as written in the comment.
+                if varResult['doccomment']:
+                    commentString = varResult['doccomment'].splitlines()
+                    for string in commentString:
+                        if '@var' in string:
+                            varType = string.split()
+                            if len(varType)>=3:
+                                varType = varType[2]
+                                tempNode.type = varType
+                newClass.classVariables[xs[0]['code']] = tempNode
+            for methodResult in classMethods.get(classInfo['name'], []):
+                method = methodResult['method']
                 tempMethod = ASTMethod(method['id'])
-                #If the method has comments, try to parse it using the PHPDoc format: 
+                #If the method has comments, try to parse it using the PHPDoc format:
                 # reference: https://docs.phpdoc.org/3.0/guide/references/phpdoc/tags/param.html,
                 # https://docs.phpdoc.org/3.0/guide/references/phpdoc/tags/return.html
                 if method['doccomment']:
@@ -233,32 +258,70 @@ class ClassHierarchy:
                         tempMethod.returnType = typeInfo['return']
                     if 'param' in typeInfo:
                         tempMethod.parameterType = typeInfo['param']
-                    
+
                 #if the document is absent, then try to see if the func is strong typed and use that to get the types.
                 else:
                     #get the strong type return type
-                    returnQuery = f"""
-                    MATCH (n:AST{{id:{method['id']}}})-[:PARENT_OF]->(m:AST{{childnum:3,type:'AST_NAME'}})-[:PARENT_OF]->(x:AST)
-                    RETURN x.code
-                    """
-                    returnResult = graph.run(cypher= returnQuery).data()
-                    if returnResult:
-                        tempMethod.returnType = returnResult[0]['x.code']
+                    if methodResult['returnTypes']:
+                        tempMethod.returnType = methodResult['returnTypes'][0]
                     #get the strong type param types
-                    paramQuery = f"""
-                    MATCH (x:AST)<-[:PARENT_OF]-(paramType:AST{{childnum:0,type:'AST_NAME'}})<-[:PARENT_OF]-(n:AST{{type:'AST_PARAM',funcid:{method['id']}}})-[:PARENT_OF]->(paramName:AST{{childnum:1}})
-                    RETURN paramName.code,x.code
-                    """
-                    paramQuery = graph.run(cypher = paramQuery).data()
-                    if paramQuery:
-                        for param in paramQuery:
-                            paramName = param['paramName.code']
-                            typeName = param['x.code']
-                            tempMethod.parameterType[paramName] = typeName
+                    for param in paramTypes.get(method['id'], []):
+                        paramName = param['paramName.code']
+                        typeName = param['x.code']
+                        tempMethod.parameterType[paramName] = typeName
                 newClass.classMethods[method['name']] = tempMethod
-                
+
             self.addClass(newClass)
         print("Finished filling class hierarchy information")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get the class hierarchy as JSON-serializable data, which fromSnapshot() turns back into a ClassHierarchy."""
+        def method(m: ASTMethod):
+            return {"id": m.nodeID, "returnType": m.returnType, "parameterType": m.parameterType}
+
+        classes = []
+        for c in self.classes.values():
+            classes.append({
+                "id": c.id,
+                "classname": c.classname,
+                "classType": c.classType,
+                "parentClass": c.parentClass,
+                "isAbstract": c.isAbstract,
+                "interfaces": list(c.interfaces),
+                "isInterface": c.isInterface,
+                "classVariables": {
+                    name: {"id": v.id, "varName": v.varName, "type": v.type, "value": v.value}
+                    for name, v in c.classVariables.items()
+                },
+                "classMethods": {name: method(m) for name, m in c.classMethods.items()},
+            })
+        return {"classes": classes, "functions": [method(m) for m in self.functions.values()]}
+
+    @staticmethod
+    def fromSnapshot(data: Dict[str, Any]) -> "ClassHierarchy":
+        def method(d: Dict[str, Any]) -> ASTMethod:
+            m = ASTMethod(d["id"])
+            m.returnType = d["returnType"]
+            m.parameterType = d["parameterType"]
+            return m
+
+        hierarchy = ClassHierarchy()
+        for d in data["classes"]:
+            c = ASTClass(d["id"], d["classname"], d["parentClass"], d["interfaces"])
+            c.classType = d["classType"]
+            c.isAbstract = d["isAbstract"]
+            c.isInterface = d["isInterface"]
+            for name, v in d["classVariables"].items():
+                tempNode = DataNode(v["id"], v["varName"])
+                tempNode.type = v["type"]
+                tempNode.value = v["value"]
+                c.classVariables[name] = tempNode
+            c.classMethods = {name: method(m) for name, m in d["classMethods"].items()}
+            hierarchy.addClass(c)
+        for d in data["functions"]:
+            hierarchy.functions[d["id"]] = method(d)
+        return hierarchy
+
     def fillFunctions(self):
         """
         Get the type information of param and returns for functions not within a class
@@ -332,17 +395,54 @@ def getClassHierarchy() -> ClassHierarchy:
     global __HIERARCHY
     if __HIERARCHY:
         return __HIERARCHY
-    else:
-        print("Analzying PHP class hierarchy...")
-        __HIERARCHY = ClassHierarchy()
-        __HIERARCHY.fillClassHierarchy()
-        __HIERARCHY.fillFunctions()
-        return __HIERARCHY
+    snapshotPath = os.path.join(NodeEdgeManager.getResultsPath(), CLASS_HIERARCHY_SNAPSHOT_NAME)
+    inputHash = NodeEdgeManager.INPUT_HASH
+    if inputHash is not None and os.path.isfile(snapshotPath):
+        try:
+            with open(snapshotPath, "r") as f:
+                snapshot = json.load(f)
+            if snapshot.get("input_hash", None) == inputHash and snapshot.get("version", None) == CLASS_HIERARCHY_VERSION:
+                print("Loading PHP class hierarchy from snapshot...")
+                __HIERARCHY = ClassHierarchy.fromSnapshot(snapshot)
+                return __HIERARCHY
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Could not load class hierarchy snapshot {snapshotPath}: {e}")
+    print("Analzying PHP class hierarchy...")
+    hierarchy = ClassHierarchy()
+    hierarchy.fillClassHierarchy()
+    hierarchy.fillFunctions()
+    __HIERARCHY = hierarchy
+    if inputHash is not None:
+        try:
+            os.makedirs(os.path.dirname(snapshotPath), exist_ok=True)
+            with open(snapshotPath, "w") as f:
+                json.dump({"input_hash": inputHash, "version": CLASS_HIERARCHY_VERSION, **hierarchy.snapshot()}, f)
+        except (OSError, TypeError) as e:
+            print(f"Could not write class hierarchy snapshot {snapshotPath}: {e}")
+    return __HIERARCHY
 
-def determineObjectType(obj):
+def getCalledFunctions(callID, pendingCalls=None):
+    """Get the functions a call node has CALLS edges to.
+    Input:
+        callID: id of the call node
+        pendingCalls: optional dict of call id -> list of function ids for CALLS edges that are not in the graph yet
+    Output:
+        list of dictionaries with keys 'm.name', 'm.classname', 'm.id'
+    """
+    if pendingCalls and callID in pendingCalls:
+        functions = [getNode(funcID) for funcID in pendingCalls[callID]]
+        return [{'m.name':f.get('name'),'m.classname':f.get('classname'),'m.id':f['id']} for f in functions if f]
+    funcDefQuery = f"""
+    MATCH (n{{id:{callID}}})-[:CALLS]->(m)
+    RETURN m.name,m.classname,m.id
+    """
+    return getGraph().run(cypher=funcDefQuery).data()
+
+def determineObjectType(obj, pendingCalls=None):
     """This function tries to determine the class type of a node object
     Input:
         dictionary, at minimum with keys: 'type', 'id'
+        pendingCalls: optional dict of call id -> list of function ids for CALLS edges that are not in the graph yet
     Output:
         string: the classname of the object / None: if the object's type cannot be found
     """
@@ -400,11 +500,7 @@ def determineObjectType(obj):
                     #if the assigner is a function call
                     if assignerNodeType in ['AST_METHOD_CALL','AST_STATIC_CALL','AST_CALL']:
                         #get the func definition
-                        funcDefQuery = f"""
-                        MATCH (n{{id:{resultNode['id']}}})-[:CALLS]->(m)
-                        RETURN m.name,m.classname
-                        """
-                        funcDefResult = graph.run(cypher=funcDefQuery).data()
+                        funcDefResult = getCalledFunctions(resultNode['id'], pendingCalls)
                         if funcDefResult:
                             returnType = classHierarchy.lookUpReturnType(funcDefResult[0]['m.classname'],funcDefResult[0]['m.name'])
                                 
@@ -441,11 +537,7 @@ def determineObjectType(obj):
     elif objType in ['AST_METHOD_CALL','AST_STATIC_CALL','AST_CALL']:
 
         #first, we trace to the function definition.
-        funcDefQuery = f"""
-        MATCH (n{{id:{obj['id']}}})-[:CALLS]->(m)
-        RETURN m.name,m.classname,m.id
-        """
-        funcDefResult = graph.run(cypher=funcDefQuery).data()
+        funcDefResult = getCalledFunctions(obj['id'], pendingCalls)
         if funcDefResult:
             returnType = None
             if not funcDefResult[0]['m.classname']:
@@ -460,10 +552,10 @@ def determineObjectType(obj):
             funcName = getCallName(obj['id'])
             if funcName=='get_class':
                 args = getCallArguments(obj['id'])
-                objClassType = determineObjectType(args[0])
+                objClassType = determineObjectType(args[0], pendingCalls)
             elif funcName=='get_parent_class':
                 args = getCallArguments(obj['id'])
-                objClassType = classHierarchy.lookUpParentClass(determineObjectType(args[0]))
+                objClassType = classHierarchy.lookUpParentClass(determineObjectType(args[0], pendingCalls))
     elif objType=='AST_MAGIC_CONST':
         #handle case where class is represented through __CLASS__
         if 'MAGIC_CLASS' in obj['flags']:
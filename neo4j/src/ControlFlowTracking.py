@@ -5,7 +5,7 @@ from ControlFlows import ControlFlowNode, ControlFlowPath, PropositionNode
 from DataFlows import DataFlowPath, DataNode
 from DataFlowTracking import reverseTrackDataFlowFromNode,reverseTrackDataFlowToAssignNoRecord
 from Detectors.FunctionFinding import FunctionFinding
-from Detectors.Runtime import SECURITY_DETECTOR_MANAGER
+from Detectors.Runtime import getSecurityDetectorManager
 from Detectors.Scores import ScoreType
 from Errors import DetectorManagerUninitializedException
 from NeoGraph import getGraph
@@ -509,13 +509,13 @@ class ControlFlowWPFunctions:
 
     @staticmethod
     def getConsentRetrievalCall():
-        if not SECURITY_DETECTOR_MANAGER:
+        if not getSecurityDetectorManager():
             raise DetectorManagerUninitializedException
 
         # Get all function calls that use the function finding interface and are also a retrieval call
         ffs = [
             f
-            for f in SECURITY_DETECTOR_MANAGER.allFindings
+            for f in getSecurityDetectorManager().allFindings
             if isinstance(f, FunctionFinding) and ScoreType.RETRIEVAL == f.score.score_type
         ]
         if not ffs:
@@ -11,6 +11,8 @@ from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
 #from DataFlows import ALL_PATHS, DataFlowGraph, DataFlowPath, DataNode
 
 from Errors import SourceDetectorException
+from MemoryGraph import getMemoryGraph
+from ReachabilityIndex import getReachabilityIndex
 from NeoGraph import getGraph
 # from NeoHelper import (
 #     ASTAssignGetName,
@@ -73,6 +75,12 @@ def hasDataflowPath(nodeID1,nodeID2):
     """
     Check if there exists a dataflow path from node 1 to node 2
     """
+    index = getReachabilityIndex()
+    if index is not None:
+        return index.has_path(nodeID1, nodeID2)
+    memory_graph = getMemoryGraph()
+    if memory_graph is not None:
+        return memory_graph.has_path(nodeID1, nodeID2, RELATIONSHIP_TYPES)
     graph = getGraph()
     query = f"""
     MATCH p = shortestPath((n{{id:{nodeID1}}})-[{allTraversalType()}*]->(m{{id:{nodeID2}}}))
@@ -83,49 +91,75 @@ def hasDataflowPath(nodeID1,nodeID2):
         return True
     return False
 
+def _distinctTerminals(nodes) -> list:
+    """Every node once, ordered by id, so that the index, the in-memory graph and Cypher give the same list."""
+    unique = dict()
+    for node in nodes:
+        unique.setdefault(node['id'], node)
+    return [unique[i] for i in sorted(unique)]
+
 def getSources(nodeID:int,no_constraint=False):
     """
     Track a node until it cannot be backtraced any further.
-    Returns a list of dicts of the traced nodes.
+    Returns a list of dicts of the traced nodes, each once and ordered by id.
     """
+    index = getReachabilityIndex()
+    if index is not None:
+        return _distinctTerminals(index.terminals(nodeID,
+                                                  reverse=True,
+                                                  max_depth=None if no_constraint else maxTraversalLength,
+                                                  include_self=not no_constraint))
+    memory_graph = getMemoryGraph()
+    if memory_graph is not None:
+        return _distinctTerminals(memory_graph.terminals(nodeID,
+                                                         RELATIONSHIP_TYPES,
+                                                         reverse=True,
+                                                         max_depth=None if no_constraint else maxTraversalLength,
+                                                         include_self=not no_constraint))
     graph = getGraph()
     query = None
     if no_constraint:
         query = f"""
         MATCH p=((n:AST)-[{allTraversalType()}*]->(m:AST{{id:{nodeID}}}))
         WHERE NOT ()-[{allTraversalType()}]->(n)
-        RETURN n ORDER BY length(p) ASC
+        RETURN DISTINCT n
         """
     else:
         query = f"""
         MATCH p=((n:AST)-[{allTraversalType()}{getMaxTraversalLength()}]->(m:AST{{id:{nodeID}}}))
         WHERE NOT ()-[{allTraversalType()}]->(n)
-        RETURN n ORDER BY length(p) ASC
+        RETURN DISTINCT n
         """
     result = graph.run(cypher=query).data()
     sources = []
     if result:
         for r in result:
             sources.append(r['n'])
-    return sources
+    return _distinctTerminals(sources)
 
 def getSinks(nodeID:int):
     """
     Track a node until it cannot be traced forward any further.
-    Returns a list of dicts of the traced nodes.
+    Returns a list of dicts of the traced nodes, each once and ordered by id.
     """
+    index = getReachabilityIndex()
+    if index is not None:
+        return _distinctTerminals(index.terminals(nodeID, max_depth=maxTraversalLength))
+    memory_graph = getMemoryGraph()
+    if memory_graph is not None:
+        return _distinctTerminals(memory_graph.terminals(nodeID, RELATIONSHIP_TYPES, max_depth=maxTraversalLength))
     graph = getGraph()
     query = f"""
     MATCH p=((n:AST{{id:{nodeID}}})-[{allTraversalType()}{getMaxTraversalLength()}]->(m:AST))
     WHERE NOT (m)-[{allTraversalType()}]->()
-    RETURN m ORDER BY length(p) ASC
+    RETURN DISTINCT m
     """
     result = graph.run(cypher=query).data()
     sinks = []
     if result:
         for r in result:
             sinks.append(r['m'])
-    return sinks
+    return _distinctTerminals(sinks)
 def reverseTrackDataFlowToAssignNoRecord(nodeID:int):
     """
     Track variable until it reaches where the variable is assigned. Returns the assignee. Does not record the node or the path in the dataflow graph.
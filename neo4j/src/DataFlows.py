@@ -3,7 +3,7 @@ from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 from Detectors.Detectors import AbstractDetector, get_node_filename
 from Detectors.FlowScores import FlowScore, FlowSecurity
-from Detectors.Runtime import SECURITY_DETECTOR_MANAGER
+from Detectors.Runtime import getSecurityDetectorManager
 from Detectors.Scores import ScoreType
 from NeoGraph import getGraph
 from NeoHelper import getCallName, getNode, getNodeName, getNodeType, isNodeAssignee
@@ -42,9 +42,8 @@ def getAllFindings(nodeID) -> List[AbstractDetector.Finding]:
     Returns:
         List[AbstractDetector.Finding]: List of findings.
     """
-    global SECURITY_DETECTOR_MANAGER
-    if SECURITY_DETECTOR_MANAGER:
-        return SECURITY_DETECTOR_MANAGER.lookup_node_id(nodeID)
+    if getSecurityDetectorManager():
+        return getSecurityDetectorManager().lookup_node_id(nodeID)
     else:
         raise Exception("No Security Detector manager initialized.")
 
@@ -230,9 +229,8 @@ class DataNode:
         Returns:
             List[AbstractDetector.Finding]: List of findings.
         """
-        global SECURITY_DETECTOR_MANAGER
-        if SECURITY_DETECTOR_MANAGER:
-            return SECURITY_DETECTOR_MANAGER.lookup_node_id(self.id)
+        if getSecurityDetectorManager():
+            return getSecurityDetectorManager().lookup_node_id(self.id)
         else:
             raise Exception("No Security Detector manager initialized.")
 
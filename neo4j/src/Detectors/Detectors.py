@@ -10,8 +10,9 @@ from traceback import print_exc
 from typing import Any, Dict, List, Optional, Set, Tuple
 
 import py2neo
+from CallNameIndex import getCallNameIndex
 from NeoHelper import getNodeChildren, getStatementSQLInfo
-from Settings import ALL_WORDPRESS_FUNCTIONS
+from Settings import getWordpressFunctions
 
 from .Scores import Score, ScoreType
 from .Utils import find_reaches_relationship, get_node_filename, get_php_uses_map
@@ -137,11 +138,11 @@ class AbstractDetector(ABC):
             """Get the function info dict for the function call.
 
             Returns:
-                dict: Dict of function info. See ALL_WORDPRESS_FUNCTIONS.
+                dict: Dict of function info. See getWordpressFunctions().
             """
             call_name = self.get_call_name()
             if call_name:
-                return ALL_WORDPRESS_FUNCTIONS.get(call_name, dict())
+                return getWordpressFunctions().get(call_name, dict())
             return dict()
 
         def get_call_name(self) -> Optional[str]:
@@ -195,11 +196,17 @@ class AbstractDetector(ABC):
         Returns:
             list: List of nodes whose code property matches the query.
         """
+        index = getCallNameIndex()
+        if index is not None:
+            call_ids = index.match_call_ids(keyword)
+            if call_ids is not None:
+                return call_ids
+
         output: List[int] = []
 
         query = f"""
         MATCH (c:AST)-[:PARENT_OF]->(name:AST{{childnum:1}})
-        WHERE c.type =~ "AST_METHOD_CALL" AND name.code =~ "{keyword}"
+        WHERE c.type =~ "AST_(METHOD|STATIC)_CALL" AND name.code =~ "{keyword}"
         RETURN COLLECT(DISTINCT c.id)
         """
         results = self.graph.evaluate(query)
@@ -2,12 +2,13 @@
 # Patrick Thomas pwt5ca
 # Created 210525
 
-from typing import Any, Dict, List, Set
+from typing import Any, Dict, List, Set, Tuple
 
+from CallNameIndex import getCallNameIndex
 from Functions import FUNCTION_SENSITIVITY
 from NeoHelper import concatTree,getCallArguments
 from py2neo import Graph
-from Settings import ALL_WORDPRESS_FUNCTIONS
+from Settings import getWordpressFunctions
 from ValueResolver import evaluateExpression
 
 from Detectors.Utils import map_args_with_name
@@ -30,7 +31,7 @@ class FunctionFinding(AbstractDetector.Finding):
 
         # Get function info.
         self.function_annotation = FUNCTION_SENSITIVITY.get(name_node["code"], None)
-        self.function_info = ALL_WORDPRESS_FUNCTIONS.get(name_node["code"], dict())
+        self.function_info = getWordpressFunctions().get(name_node["code"], dict())
 
         self.is_wordpress: bool = bool(self.function_info)
         self.code = concatTree(call_node["id"])
@@ -110,6 +111,26 @@ class FunctionFinding(AbstractDetector.Finding):
         node_label: str = "AST",
         data_types: Set[str] = set(),
     ) -> List[AbstractDetector.Finding]:
+        index = getCallNameIndex(node_label)
+        entries = index.match(call_name_pattern) if index is not None else None
+        if entries is not None:
+            pairs = [(entry.call, entry.name) for entry in entries]
+        else:
+            pairs = FunctionFinding.__query_function_name(graph, call_name_pattern, node_label)
+
+        output: List[AbstractDetector.Finding] = []
+        for call_d, name_d in pairs:
+            # recommendation = recommendation_pattern(call_d)
+            score = Score(1, {}, None, score_type)
+            score.store_data_type_info(data_types)
+
+            finding = FunctionFinding(graph, call_d, name_d, score, detector)
+            output.append(finding)
+
+        return output
+
+    @staticmethod
+    def __query_function_name(graph: Graph, call_name_pattern: str, node_label: str) -> List[Tuple[dict, dict]]:
         query = f"""
         MATCH (call:{node_label}{{type:"AST_CALL"}})-[:PARENT_OF]->
             (:{node_label}{{type:"AST_NAME", childnum:0}})-[:PARENT_OF]->
@@ -131,22 +152,7 @@ class FunctionFinding(AbstractDetector.Finding):
         results = graph.run(query)
         if not results:
             return []
-
-        output: List[AbstractDetector.Finding] = []
-        for r in results:
-            if not r:
-                continue
-            call, name = r
-            call_d = dict(call)
-            name_d = dict(name)
-            # recommendation = recommendation_pattern(call_d)
-            score = Score(1, {}, None, score_type)
-            score.store_data_type_info(data_types)
-
-            finding = FunctionFinding(graph, call_d, name_d, score, detector)
-            output.append(finding)
-
-        return output
+        return [(dict(r[0]), dict(r[1])) for r in results if r]
 
     @staticmethod
     def findings_from_node_id(
@@ -3,13 +3,18 @@
 # Created 200528
 
 import os
+import threading
+import time
+from bisect import bisect_right
 from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
+from traceback import format_exception
 from typing import *
 
 import py2neo
 import Results
-from Settings import ENCRYPTION_PARALLEL, LRU_CACHE_SIZE
+from QueryProfiler import getQueryProfiler
+from Settings import DETECTOR_FAIL_FAST, DETECTOR_WORKERS, ENCRYPTION_PARALLEL, LRU_CACHE_SIZE, QUERY_PROFILE
 
 # from .ActivationDetectors import *
 from .DatabaseDetectors import *
@@ -37,6 +42,153 @@ def _detector_sort(x: AbstractDetector) -> str:
     return name
 
 
+class _CountingGraph:
+    """Wrapper around a detector's graph connection that counts the queries made through it.
+
+    Queries of the helper functions a detector calls go through getGraph() instead, so they are not counted here.
+    """
+
+    def __init__(self, graph: py2neo.Graph) -> None:
+        self._graph = graph
+        self._lock = threading.Lock()
+        self.queries = 0
+
+    def _count(self) -> None:
+        with self._lock:
+            self.queries += 1
+
+    def run(self, *args, **kwargs):
+        self._count()
+        return self._graph.run(*args, **kwargs)
+
+    def evaluate(self, *args, **kwargs):
+        self._count()
+        return self._graph.evaluate(*args, **kwargs)
+
+    def query(self, *args, **kwargs):
+        self._count()
+        return self._graph.query(*args, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self._graph, name)
+
+
+class _FindingTree:
+    """The part of the AST that contains findings, with Euler tour intervals for ancestor/descendant checks.
+
+    Only the paths from the file roots down to the findings and the subtrees below the findings are loaded. A node u is
+    an ancestor of v iff enter[u] <= enter[v] <= leave[u], so the findings below a node are a range of the findings
+    sorted by enter time.
+    """
+
+    def __init__(self,
+                 findings_by_node: Dict[int, List[AbstractDetector.Finding]],
+                 edges: Iterable[Tuple[int, int]],
+                 non_ast: Set[int] = set()) -> None:
+        self.findings_by_node = findings_by_node
+        self.parent: Dict[int, int] = dict()
+        children: Dict[int, List[int]] = dict()
+        for parent_id, child_id in edges:
+            # The AST is a tree; ignore any second parent.
+            if child_id in self.parent or child_id == parent_id:
+                continue
+            self.parent[child_id] = parent_id
+            children.setdefault(parent_id, []).append(child_id)
+        self.non_ast = non_ast
+
+        self.enter: Dict[int, int] = dict()
+        self.leave: Dict[int, int] = dict()
+        self.depth: Dict[int, int] = dict()
+        nodes = set(children) | set(self.parent) | set(findings_by_node)
+        clock = 0
+        for root in nodes:
+            if root in self.parent:
+                continue
+            self.depth[root] = 0
+            stack = [(root, False)]
+            while stack:
+                node_id, done = stack.pop()
+                if done:
+                    self.leave[node_id] = clock - 1
+                    continue
+                self.enter[node_id] = clock
+                clock += 1
+                stack.append((node_id, True))
+                for child_id in children.get(node_id, []):
+                    if child_id not in self.enter:
+                        self.depth[child_id] = self.depth[node_id] + 1
+                        stack.append((child_id, False))
+
+        self._finding_nodes = sorted((n for n in findings_by_node if n in self.enter), key=lambda n: self.enter[n])
+        self._finding_enters = [self.enter[n] for n in self._finding_nodes]
+
+    def enclosing_findings(self, node_id: int) -> List[AbstractDetector.Finding]:
+        """Findings of the node itself and of its ancestors, nearest first."""
+        if node_id in self.non_ast:
+            return []
+        output: List[AbstractDetector.Finding] = []
+        current: Optional[int] = node_id
+        while current is not None:
+            output.extend(self.findings_by_node.get(current, []))
+            current = self.parent.get(current, None)
+        return output
+
+    def nearest_contained_finding(self, node_id: int) -> Optional[AbstractDetector.Finding]:
+        """The finding strictly below the node that is closest to it."""
+        if node_id in self.non_ast or node_id not in self.enter:
+            return None
+        low = bisect_right(self._finding_enters, self.enter[node_id])
+        high = bisect_right(self._finding_enters, self.leave[node_id])
+        best: Optional[int] = None
+        for finding_node in self._finding_nodes[low:high]:
+            if best is None or self.depth[finding_node] < self.depth[best]:
+                best = finding_node
+        return self.findings_by_node[best][0] if best is not None else None
+
+    @classmethod
+    def from_neo4j(cls, graph: py2neo.Graph,
+                   findings_by_node: Dict[int, List[AbstractDetector.Finding]]) -> "_FindingTree":
+        """Load the paths above and the subtrees below all findings with two queries."""
+        finding_ids = list(findings_by_node)
+        edges: List[Tuple[int, int]] = []
+        non_ast: Set[int] = set()
+
+        query = """
+        UNWIND $ids AS id
+        MATCH p=(root)-[:PARENT_OF*0..]->(finding:AST{id:id})
+        WHERE NOT ()-[:PARENT_OF]->(root)
+        RETURN [n IN nodes(p) | [n.id, 'AST' IN labels(n)]] AS path
+        """
+        below_finding: Set[int] = set()
+        for r in graph.run(query, ids=finding_ids):
+            path = r["path"]
+            for i, (path_id, is_ast) in enumerate(path):
+                if not is_ast:
+                    non_ast.add(path_id)
+                if i:
+                    edges.append((path[i - 1][0], path_id))
+                    if path[i - 1][0] in findings_by_node:
+                        below_finding.add(path_id)
+                    elif path[i - 1][0] in below_finding:
+                        below_finding.add(path_id)
+
+        # Expand only the findings that are not inside another finding's subtree.
+        top_ids = [i for i in finding_ids if i not in below_finding]
+        query = """
+        MATCH (finding:AST) WHERE finding.id IN $ids
+        WITH collect(finding) AS findings
+        CALL apoc.path.subgraphNodes(findings, {relationshipFilter: 'PARENT_OF>'}) YIELD node
+        MATCH (node)-[:PARENT_OF]->(child)
+        RETURN node.id AS parent, child.id AS child, 'AST' IN labels(child) AS is_ast
+        """
+        if top_ids:
+            for r in graph.run(query, ids=top_ids):
+                edges.append((r["parent"], r["child"]))
+                if not r["is_ast"]:
+                    non_ast.add(r["child"])
+        return cls(findings_by_node, edges, non_ast)
+
+
 class DetectorManager:
 
     detector_dict: Dict[str, AbstractDetector] = {}
@@ -69,14 +221,20 @@ class DetectorManager:
         # Now instantiate detectors.
         self.detectors: List[AbstractDetector] = [detector(graph) for detector in sorted(detector_types, key=lambda x: x.__name__.lower())]  # type: ignore
         self.detectors.sort(key=_detector_sort)
+        for detector in self.detectors:
+            detector.graph = _CountingGraph(graph)
+        # Detector name -> {"run": seconds, "run queries": count, "post": seconds, "post queries": count}. Without
+        # QUERY_PROFILE, only the queries made through the detector's own connection are counted, as "direct queries".
+        self.detector_stats: Dict[str, Dict[str, float]] = {type(d).__name__: dict() for d in self.detectors}
+        # Detector name -> the phase ("run" or "post") in which it raised.
+        self.failed_detectors: Dict[str, str] = dict()
         self.silent = silent
         # print("### Finished instantiating Detectors")
         # Make a dict with the detectors by name for easier lookup.
         DetectorManager.detector_dict = {type(d).__name__: d for d in self.detectors}
 
         self.allFindings: Set[AbstractDetector.Finding] = set()
-        self.__finding_children_map: Dict[int, Set[Tuple[AbstractDetector.Finding, int]]] = dict()
-        self.__parent_finding_map: Dict[int, Set[Tuple[AbstractDetector.Finding, int]]] = dict()
+        self.__finding_tree = _FindingTree(dict(), [])
 
         self.__found: Set[AbstractDetector.Finding] = set()
 
@@ -106,80 +264,110 @@ class DetectorManager:
         )
 
     def run(self):
-        """Run all of the instantiated detectors at once."""
+        """Run all of the instantiated detectors at once.
 
-        if ENCRYPTION_PARALLEL:
-            # Run detectors in parallel. TPE is used instead of multiprocessing. Use Pool since querying the
-            # database is high IO/done in subprocesses (Neo4j itself).
-            with ThreadPoolExecutor() as executor:
-                [executor.submit(detector.run) for detector in self.detectors]
-                [executor.submit(detector.post) for detector in self.detectors]
-        else:
-            for detector in progress_bar(self.detectors):
-                detector.run()
-            for detector in self.detectors:
-                detector.post(self.detectors)
+        Every detector's run() finishes before any post() starts, since post-processing looks at the findings of the
+        other detectors. A detector that raises is reported and left out of the rest of the run; the other detectors
+        carry on. With DETECTOR_FAIL_FAST, the first exception is re-raised once its phase has finished instead.
+        """
+        self._run_phase("run", lambda detector: detector.run())
+        self._run_phase("post", lambda detector: detector.post(self.detectors))
+        if self.failed_detectors:
+            print(f"{len(self.failed_detectors)} detectors failed: " +
+                  ", ".join(f"{name} in {phase}()" for name, phase in self.failed_detectors.items()))
 
         self._rebuild_maps()
         if not self.silent:
             self.print_detectors()
+            self.print_detector_stats()
             # self.print_results()
 
+    def _run_phase(self, phase: str, task: Callable[[AbstractDetector], Any]):
+        """Run one phase on every detector that has not failed yet, and record the wall time and query count of each.
+
+        With QUERY_PROFILE, a detector's queries are the ones the profiler recorded on its thread, including those of
+        the helper functions it calls. Otherwise only its direct queries (see _CountingGraph) are counted.
+        """
+
+        def timed(detector: AbstractDetector):
+            stats = self.detector_stats[type(detector).__name__]
+            counting = isinstance(detector.graph, _CountingGraph)
+            if QUERY_PROFILE:
+                queries = getQueryProfiler().thread_calls()
+            elif counting:
+                queries = detector.graph.queries
+            start = time.perf_counter()
+            try:
+                task(detector)
+            finally:
+                stats[phase] = time.perf_counter() - start
+                if QUERY_PROFILE:
+                    stats[f"{phase} queries"] = getQueryProfiler().thread_calls() - queries
+                elif counting:
+                    stats[f"{phase} direct queries"] = detector.graph.queries - queries
+
+        detectors = [d for d in self.detectors if type(d).__name__ not in self.failed_detectors]
+        errors: List[Tuple[AbstractDetector, BaseException]] = []
+        if ENCRYPTION_PARALLEL:
+            # Run detectors in parallel. TPE is used instead of multiprocessing. Use Pool since querying the
+            # database is high IO/done in subprocesses (Neo4j itself).
+            with ThreadPoolExecutor(max_workers=DETECTOR_WORKERS) as executor:
+                submitted = [(detector, executor.submit(timed, detector)) for detector in detectors]
+            for detector, future in submitted:
+                error = future.exception()
+                if error is not None:
+                    errors.append((detector, error))
+        else:
+            for detector in progress_bar(detectors) if phase == "run" else detectors:
+                try:
+                    timed(detector)
+                except Exception as e:
+                    errors.append((detector, e))
+
+        for detector, error in errors:
+            print(f"Detector {type(detector).__name__} failed in {phase}():")
+            print("".join(format_exception(type(error), error, error.__traceback__)))
+            self.failed_detectors[type(detector).__name__] = phase
+        if errors and DETECTOR_FAIL_FAST:
+            raise errors[0][1]
+
+    def print_detector_stats(self):
+        """Print the time and number of queries each detector took, slowest first."""
+        print("### Detector timing:")
+        kind = "queries" if QUERY_PROFILE else "direct queries"
+        for name, stats in sorted(self.detector_stats.items(),
+                                  key=lambda x: -(x[1].get("run", 0) + x[1].get("post", 0))):
+            print(
+                f"{name}: run {stats.get('run', 0):.2f}s ({stats.get(f'run {kind}', 0)} {kind}), "
+                f"post {stats.get('post', 0):.2f}s ({stats.get(f'post {kind}', 0)} {kind})"
+            )
+
     def _rebuild_maps(self):
         # Save all non-generic findings.
+        findings_by_node: Dict[int, List[AbstractDetector.Finding]] = dict()
         for detector in self.detectors:
             if not type(detector).__name__.startswith("Generic"):
                 self.allFindings.update(detector.findings)
+                for finding in detector.findings:
+                    findings_by_node.setdefault(finding.node["id"], []).append(finding)
 
         # Filter out duplicated findings between generic and non-generic findings.
         for detector in self.detectors:
+            if not type(detector).__name__.startswith("Generic"):
+                continue
+            duplicates: List[AbstractDetector.Finding] = []
             for finding in detector.findings:
-                if type(detector).__name__.startswith("Generic"):
-                    overlap = [
-                        other_finding
-                        for other_finding in self.allFindings
-                        if other_finding.node["id"] == finding.node["id"]
-                    ]
-                    if overlap:
-                        for overlapping in overlap:
-                            if overlapping.score.score_type == finding.score.score_type:
-                                detector.findings.remove(finding)
-                    else:
-                        self.allFindings.add(finding)
-
-        # Now build mappings.
-        for finding in self.allFindings:
-            finding_id = finding.node["id"]
-
-            # Match all children of the finding and cache those.
-            query = f"""
-            MATCH p=(finding:AST{{id: {finding_id}}})-[:PARENT_OF*0..]->(child:AST)
-            RETURN COLLECT(DISTINCT [child.id, LENGTH(p)])
-            """
-            results = self.graph.evaluate(query)
-            if results:
-                for r in results:
-                    if not r:
-                        continue
-                    child_id, parent_child_distance = r
-                    l = self.__finding_children_map.get(child_id, set())
-                    l.add((finding, parent_child_distance))
-                    self.__finding_children_map[child_id] = l
-
-            # Match all parents of the finding and cache those.
-            query = f"""
-            MATCH p=(parent:AST)-[:PARENT_OF*]->(finding:AST{{id: {finding_id}}})
-            RETURN COLLECT(DISTINCT [parent.id, LENGTH(p)])
-            """
-            results = self.graph.evaluate(query)
-            if results:
-                for r in results:
-                    if not r:
-                        continue
-                    parent_id, parent_child_distance = r
-                    l = self.__parent_finding_map.get(parent_id, set())
-                    l.add((finding, parent_child_distance))
-                    self.__parent_finding_map[parent_id] = l
+                overlap = findings_by_node.get(finding.node["id"], [])
+                if overlap:
+                    if any(o.score.score_type == finding.score.score_type for o in overlap):
+                        duplicates.append(finding)
+                else:
+                    self.allFindings.add(finding)
+                    findings_by_node[finding.node["id"]] = [finding]
+            for finding in duplicates:
+                detector.findings.remove(finding)
+
+        self.__finding_tree = _FindingTree.from_neo4j(self.graph, findings_by_node)
 
     def print_results(self):
         """Print a general summary of the results to the screen."""
@@ -219,15 +407,15 @@ class DetectorManager:
             use this node. Otherwise return all related findings.
         """
 
-        child_candidates = list(self.__finding_children_map.get(node_id, []))
-        child_candidates.sort(key=lambda x: x[1])  # Sort by precedence, ascending
+        # Findings on the node or above it, nearest first.
+        child_candidates = self.__finding_tree.enclosing_findings(node_id)
         if child_candidates:
-            return [finding for finding, _ in child_candidates]
+            return child_candidates
 
-        parent_candidates = list(self.__parent_finding_map.get(node_id, []))
-        parent_candidates.sort(key=lambda x: x[1])  # Sort by precedence, ascending
+        # Otherwise the nearest finding below it.
+        parent_candidates = self.__finding_tree.nearest_contained_finding(node_id)
         if parent_candidates:
-            return [parent_candidates[0][0]]
+            return [parent_candidates]
 
         return []
 
@@ -285,3 +473,4 @@ class DetectorManager:
                 api_endpoint=f.score.categories.get("url", None),
                 personal_data=f.score.get_data_types_personal()
             )
+        Results.flush_results()
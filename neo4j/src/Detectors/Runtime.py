@@ -2,6 +2,7 @@
 # Patrick Thomas pwt5ca
 # Created 201208
 
+import threading
 from typing import Dict, Optional, Set, List
 
 from NeoGraph import getGraph
@@ -9,17 +10,24 @@ from NeoGraph import getGraph
 from Detectors.Manager import DetectorManager
 from Detectors.SecurityDetectors import AbstractDetector
 
-from Args import DATABASE_DIR, DELETION_LOG_FILE, PLUGIN_NAME, PLUGIN_DIR
-
-# Get output file locations from arguments -- very important for batch runs.
-# if PLUGIN_NAME:
-#     print(f"Plugin name: {PLUGIN_NAME}, https://wordpress.org/plugins/{PLUGIN_NAME}/")
-
-# SECURITY_DETECTOR_MANAGER handles all encryption, hashing, and database usages.
-SECURITY_DETECTOR_MANAGER: Optional[DetectorManager] = DetectorManager(getGraph())
+# The security detector manager handles all encryption, hashing, and database usages. It is created by
+# getSecurityDetectorManager() on first use.
+global __SECURITY_DETECTOR_MANAGER, __SECURITY_DETECTOR_MANAGER_LOCK
+__SECURITY_DETECTOR_MANAGER: Optional[DetectorManager] = None
+__SECURITY_DETECTOR_MANAGER_LOCK = threading.Lock()
 
 # SECURITY_USES is a set of node IDs that are known to fall under some Security Detector Finding.
 SECURITY_USES: Set[int] = set()
 
 # SECURITY_MAP_USES_TO_FINDINGS is a map from node ID to a finding.
 SECURITY_MAP_USES_TO_FINDINGS: Dict[int, AbstractDetector.Finding] = dict()
+
+
+def getSecurityDetectorManager() -> Optional[DetectorManager]:
+    """Get the detector manager of the analyzed graph, creating it on first use."""
+    global __SECURITY_DETECTOR_MANAGER
+    if __SECURITY_DETECTOR_MANAGER is None:
+        with __SECURITY_DETECTOR_MANAGER_LOCK:
+            if __SECURITY_DETECTOR_MANAGER is None:
+                __SECURITY_DETECTOR_MANAGER = DetectorManager(getGraph())
+    return __SECURITY_DETECTOR_MANAGER
@@ -8,12 +8,12 @@ from typing import List
 import py2neo
 from Functions import FUNCTION_SENSITIVITY
 from Settings import (
-    ALL_WORDPRESS_FUNCTION_RETURN_TYPES,
     DATA_TYPE_ATTACHMENT,
     DATA_TYPE_BLOG,
     DATA_TYPE_FILE,
     DATA_TYPE_POST,
     DATA_TYPE_USER,
+    getWordpressFunctionReturnTypes,
 )
 
 from .Detectors import AbstractDetector
@@ -161,7 +161,6 @@ class WordPressRetrievalDetector(AbstractDetector):
         "the_post",
         "the_title_attribute",
         "the_title",
-        *[str(k) for k, v in ALL_WORDPRESS_FUNCTION_RETURN_TYPES.items() if "WP_Post" in v],
     ]
 
     keywords_pages = [
@@ -191,7 +190,6 @@ class WordPressRetrievalDetector(AbstractDetector):
         "get_users",
         "wp_get_current_user",
         "get_user_meta",
-        *[str(k) for k, v in ALL_WORDPRESS_FUNCTION_RETURN_TYPES.items() if "WP_User" in v],
     ]
 
     keywords_other = [
@@ -227,6 +225,10 @@ class WordPressRetrievalDetector(AbstractDetector):
         """
         super().__init__(graph, date(2021, 5, 25))
         self.finding_type = ScoreType.RETRIEVAL
+        # Also every WordPress function documented to return posts or users.
+        return_types = getWordpressFunctionReturnTypes()
+        self.keywords_posts = [*self.keywords_posts, *[str(k) for k, v in return_types.items() if "WP_Post" in v]]
+        self.keywords_users = [*self.keywords_users, *[str(k) for k, v in return_types.items() if "WP_User" in v]]
 
     def __determine_source(self, s: str) -> List[str]:
         output: List[str] = []
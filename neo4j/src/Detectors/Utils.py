@@ -7,7 +7,7 @@ import re
 from typing import Dict, List, Optional, Set, Tuple
 
 import py2neo
-from Settings import ALL_WORDPRESS_FUNCTIONS
+from Settings import getWordpressFunctions
 
 call_name_pattern = re.compile("^[a-zA-Z_\x80-\xff][a-zA-Z0-9_\x80-\xff]*$")
 
@@ -328,7 +328,7 @@ def map_args(graph: py2neo.Graph, call_node_id: int) -> Dict[int, str]:
     output: Dict[int, str] = dict()
 
     # Lookup the function's info.
-    info = ALL_WORDPRESS_FUNCTIONS.get(name, None)
+    info = getWordpressFunctions().get(name, None)
     if not info:
         return dict()
 
@@ -364,7 +364,7 @@ def map_args_with_name(graph: py2neo.Graph, call_node_id: int, call_name: str) -
     output: Dict[int, str] = dict()
 
     # Lookup the function's info.
-    info = ALL_WORDPRESS_FUNCTIONS.get(call_name, None)
+    info = getWordpressFunctions().get(call_name, None)
     if not info:
         return dict()
 
@@ -1,4 +1,4 @@
-from Naked.toolshed.shell import muterun_js
+from preprocessing.utils.NodeWorkerPool import runJS
 from NodeEdgeManager import *
 import json
 import os
@@ -13,11 +13,10 @@ def parseHTML(fileDir, toplevel_nodeID, handleHTMLinPHP=False):
     response = None
     htmlstring = ''
     if handleHTMLinPHP:
-        htmlstring = fileDir.replace("'", "\\'")
-        htmlstring = f"$'{htmlstring}'"
-        response = muterun_js(str(PARSER), arguments=f"""{htmlstring}""")
+        htmlstring = fileDir
+        response = runJS(str(PARSER), [htmlstring])
     else:
-        response = muterun_js(str(PARSER), arguments=f"""{fileDir} -from_file""")
+        response = runJS(str(PARSER), [fileDir, "-from_file"])
     response = response.stdout.decode("utf-8")
     if response:
         nodeList = json.loads(response)
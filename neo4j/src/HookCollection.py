@@ -5,7 +5,7 @@
 #logic: run preprocess, analyze paths assuming the parameters contain personal info.
 #from Preproccess import preprocess_graph
 import csv
-from Detectors.Runtime import PLUGIN_NAME
+from Args import getArgs
 from ActionHook import ActionHook
 from Settings import HOOK_INFO_STORE_PATH,FN_SENSITIVITY_INFO_PATH
 global hookInfo,fnSensitivityInfo
@@ -23,7 +23,7 @@ def hookCollection():
     print("Storing all hook information in the current plugin...")
     storeHookInformation()
 def locateHooks():
-    plugin_name = PLUGIN_NAME
+    plugin_name = getArgs().plugin_name
     global hookInfo,fnSensitivityInfo
     hookInfo, fnSensitivityInfo = ActionHook.locateAddActionAndFilter(plugin_name)
 def storeHookInformation():
@@ -1,7 +1,6 @@
+from Args import getArgs
 from Detectors.Runtime import (
-    DELETION_LOG_FILE,
-    PLUGIN_NAME,
-    SECURITY_DETECTOR_MANAGER,
+    getSecurityDetectorManager,
     SECURITY_MAP_USES_TO_FINDINGS,
     SECURITY_USES,
 )
@@ -11,6 +10,10 @@ import logging
 from PathAnalyzer import PathAnalyzer, FixReport
 from HookCollection import hookCollection
 from NeoHelper import requiresAnalysis
+from QueryProfiler import getQueryProfiler, printQueryProfile
+from Results import write_query_profile
+from Settings import QUERY_PROFILE, QUERY_PROFILE_DB
+from StageMetrics import stage
 # from NeoGraph import getGraph
 # from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
 #from DataFlows import DataFlowGraph,DataFlowPath, DataNode
@@ -19,13 +22,12 @@ from NeoHelper import requiresAnalysis
 # Log settings
 neo4j_log = logging.getLogger("neo4j.bolt")
 neo4j_log.setLevel(logging.WARNING)
-logging.basicConfig(filename=DELETION_LOG_FILE, level=logging.INFO)
 
 #dataflowGraph = DataFlowGraph()
 
 
 def __run():
-    print(f"Running Main.py on {PLUGIN_NAME}")
+    print(f"Running Main.py on {getArgs().plugin_name}")
     """
 	Preprocessing stage
 
@@ -35,16 +37,19 @@ def __run():
 	-	parse HTML and load the HTML ASTs as well
 	"""
     header_print("Preprocessing stage")
-    preprocess_graph()
+    with stage("preprocessing"):
+        preprocess_graph()
     if not requiresAnalysis():
         print("="*15)
         print('Found no personal data in the plugin. No analysis needed.')
         return
-    if not SECURITY_DETECTOR_MANAGER:
+    if not getSecurityDetectorManager():
         return
-    SECURITY_DETECTOR_MANAGER.write_findings_to_db()
+    with stage("write findings"):
+        getSecurityDetectorManager().write_findings_to_db()
     #collect hook info
-    hookCollection()
+    with stage("hook collection"):
+        hookCollection()
     """
 	Data flows stage
 
@@ -139,7 +144,8 @@ def __run():
     #     # 	l.printPathInfo()
     #     pa = PathAnalyzer(path_list, topic=pii_type)
     #     path_analyzers[pii_type] = pa
-    pa = PathAnalyzer()
+    with stage("path analyzer"):
+        pa = PathAnalyzer()
     # subheader_print(f"Path Analyzer Result")
     for l in pa.log:
         print(l.log_to_str())
@@ -207,5 +213,18 @@ Disclaimer: The sample code provided above is only for reference and does not gu
     print("Done.")
 
 
+def __report_query_profile():
+    header_print("Query profile")
+    printQueryProfile()
+    if QUERY_PROFILE_DB:
+        write_query_profile(getQueryProfiler().report())
+
+
 if __name__ == "__main__":
-    __run()
+    logging.basicConfig(filename=getArgs().deletion_log_file, level=logging.INFO)
+    try:
+        __run()
+    finally:
+        # __run returns early when there is nothing to analyze, so report here to cover every exit.
+        if QUERY_PROFILE:
+            __report_query_profile()
@@ -0,0 +1,319 @@
+# GDPR Checker project
+# In-process, array-backed copy of the code property graph.
+#
+# Most analysis helpers issue one small Cypher query per node. When IN_MEMORY_GRAPH is enabled, the graph is held in
+# this process as typed node columns plus CSR (compressed sparse row) adjacency per edge type, so that lookups such as
+# getNode, getNodeChildren, concatTree2 and the dataflow path queries can be answered without a Bolt round-trip.
+
+import threading
+from array import array
+from collections import deque
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from NeoGraph import getGraph
+from Settings import IN_MEMORY_GRAPH, NODES_HEADER
+
+# Node properties, in NODES_HEADER order, without the id and labels columns.
+_NODE_PROPERTIES: List[str] = [h.split(":")[0] for h in NODES_HEADER[2:]]
+
+
+class MemoryGraph:
+    """Columnar node store and per-type CSR adjacency.
+
+    Node properties are stored column by column (one list per property, indexed by row), and node IDs are mapped to
+    rows with a dictionary. Edges are stored as parallel arrays of start rows, end rows and type codes; the CSR
+    offsets for a given edge type and direction are built lazily on first use and dropped whenever edges are added.
+    """
+
+    def __init__(self) -> None:
+        self.ids = array("q")
+        self.labels: List[FrozenSet[str]] = []
+        self.columns: Dict[str, List[Any]] = {p: [] for p in _NODE_PROPERTIES}
+        self._row: Dict[int, int] = dict()
+
+        self._edge_start = array("q")
+        self._edge_end = array("q")
+        self._edge_type = array("l")
+        self._edge_props: Dict[int, Dict[str, Any]] = dict()
+        self._type_codes: Dict[str, int] = dict()
+        self._csr: Dict[Tuple[int, bool], Tuple[array, array, array]] = dict()
+        self._csr_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self._edge_start)
+
+    # Construction.
+
+    def add_node(self, node_id: int, labels: Iterable[str], properties: Dict[str, Any]) -> None:
+        """Add (or overwrite) a node.
+
+        Args:
+            node_id (int): The node's id property.
+            labels (Iterable[str]): The node's labels.
+            properties (Dict[str, Any]): The node's properties. Missing and None values are treated as absent.
+        """
+        node_id = int(node_id)
+        row = self._row.get(node_id, None)
+        if row is None:
+            row = len(self.ids)
+            self._row[node_id] = row
+            self.ids.append(node_id)
+            self.labels.append(frozenset(labels))
+            for p, column in self.columns.items():
+                column.append(properties.get(p, None))
+            for p in properties.keys() - self.columns.keys() - {"id"}:
+                self.columns[p] = [None] * row + [properties[p]]
+        else:
+            self.labels[row] = frozenset(labels)
+            for p, column in self.columns.items():
+                column[row] = properties.get(p, None)
+            for p in properties.keys() - self.columns.keys() - {"id"}:
+                self.columns[p] = [None] * len(self.ids)
+                self.columns[p][row] = properties[p]
+
+    def add_edge(self, start_id: int, end_id: int, edge_type: str, properties: Optional[Dict[str, Any]] = None) -> bool:
+        """Add an edge between two existing nodes.
+
+        Returns:
+            bool: False if either endpoint is unknown, in which case the edge is skipped.
+        """
+        start = self._row.get(int(start_id), None)
+        end = self._row.get(int(end_id), None)
+        if start is None or end is None:
+            return False
+        code = self._type_codes.setdefault(edge_type, len(self._type_codes))
+        if properties:
+            properties = {k: v for k, v in properties.items() if v not in (None, "")}
+            if properties:
+                self._edge_props[len(self._edge_start)] = properties
+        self._edge_start.append(start)
+        self._edge_end.append(end)
+        self._edge_type.append(code)
+        self._csr.clear()
+        return True
+
+    @classmethod
+    def from_neo4j(cls, graph=None) -> "MemoryGraph":
+        """Snapshot the current Neo4j graph with two bulk queries."""
+        graph = graph if graph else getGraph()
+        mg = cls()
+        for r in graph.run("""MATCH (n) WHERE EXISTS(n.id) RETURN n.id AS id, labels(n) AS labels, properties(n) AS props"""):
+            mg.add_node(r["id"], r["labels"], r["props"])
+        for r in graph.run("""
+        MATCH (a)-[r]->(b) WHERE EXISTS(a.id) AND EXISTS(b.id)
+        RETURN a.id AS start, b.id AS end, type(r) AS type, properties(r) AS props
+        """):
+            mg.add_edge(r["start"], r["end"], r["type"], r["props"])
+        return mg
+
+    # CSR adjacency.
+
+    def _adjacency(self, edge_type: str, reverse: bool = False) -> Optional[Tuple[array, array, array]]:
+        """Get (offsets, neighbor rows, edge indices) for one edge type and direction.
+
+        Neighbors of a row r are neighbors[offsets[r]:offsets[r + 1]], ordered by the neighbor's childnum.
+        """
+        code = self._type_codes.get(edge_type, None)
+        if code is None:
+            return None
+        key = (code, reverse)
+        csr = self._csr.get(key, None)
+        if csr is not None:
+            return csr
+
+        with self._csr_lock:
+            csr = self._csr.get(key, None)
+            if csr is not None:
+                return csr
+            src, dst = (self._edge_end, self._edge_start) if reverse else (self._edge_start, self._edge_end)
+            childnum = self.columns["childnum"]
+            edges = [i for i, t in enumerate(self._edge_type) if t == code]
+            edges.sort(key=lambda i: (src[i], childnum[dst[i]] if childnum[dst[i]] is not None else -1))
+
+            offsets = array("q", [0]) * (len(self.ids) + 1)
+            for i in edges:
+                offsets[src[i] + 1] += 1
+            for r in range(len(self.ids)):
+                offsets[r + 1] += offsets[r]
+            neighbors = array("q", (dst[i] for i in edges))
+            edge_index = array("q", edges)
+            csr = (offsets, neighbors, edge_index)
+            self._csr[key] = csr
+            return csr
+
+    def _neighbor_rows(self, row: int, edge_types: Iterable[str], reverse: bool = False) -> List[int]:
+        out: List[int] = []
+        for t in edge_types:
+            csr = self._adjacency(t, reverse)
+            if csr is None:
+                continue
+            offsets, neighbors, _ = csr
+            out.extend(neighbors[offsets[row]:offsets[row + 1]])
+        return out
+
+    # Queries.
+
+    def has_node(self, node_id: int) -> bool:
+        return node_id in self._row
+
+    def has_label(self, node_id: int, label: str) -> bool:
+        row = self._row.get(node_id, None)
+        return row is not None and label in self.labels[row]
+
+    def _node_at(self, row: int) -> Dict[str, Any]:
+        node: Dict[str, Any] = {"id": self.ids[row]}
+        for p, column in self.columns.items():
+            value = column[row]
+            if value is not None:
+                node[p] = value
+        return node
+
+    def getNode(self, node_id: int) -> Dict[str, Any]:
+        """Same contract as NeoHelper.getNode: an empty dictionary if the node does not exist."""
+        row = self._row.get(node_id, None)
+        if row is None:
+            return {}
+        return self._node_at(row)
+
+    def getNodeChildren(self, node_id: int, edge_type: str = "PARENT_OF") -> List[Dict[str, Any]]:
+        """Same contract as NeoHelper.getNodeChildren: distinct children ordered by childnum."""
+        row = self._row.get(node_id, None)
+        if row is None:
+            return []
+        seen: Set[int] = set()
+        output = []
+        for c in self._neighbor_rows(row, (edge_type, )):
+            if c not in seen:
+                seen.add(c)
+                output.append(self._node_at(c))
+        return output
+
+    def subtree(self, node_id: int, edge_type: str = "PARENT_OF") -> Tuple[Dict[int, Dict[str, Any]], Dict[int, List[int]]]:
+        """Get every node reachable from node_id via edge_type.
+
+        Returns:
+            Tuple[Dict[int, Dict[str, Any]], Dict[int, List[int]]]: The node dictionary and the ordered child ID lists,
+            in the format _concatTree2 expects.
+        """
+        node_dict: Dict[int, Dict[str, Any]] = dict()
+        rels_dict: Dict[int, List[int]] = dict()
+        row = self._row.get(node_id, None)
+        if row is None:
+            return node_dict, rels_dict
+        stack = [row]
+        visited = {row}
+        while stack:
+            r = stack.pop()
+            nid = self.ids[r]
+            node_dict[nid] = self._node_at(r)
+            children = self._neighbor_rows(r, (edge_type, ))
+            rels_dict[nid] = [self.ids[c] for c in children]
+            for c in children:
+                if c not in visited:
+                    visited.add(c)
+                    stack.append(c)
+        return node_dict, rels_dict
+
+    def has_path(self, start_id: int, end_id: int, edge_types: Iterable[str]) -> bool:
+        """Whether there is a path of at least one edge from start_id to end_id over edge_types."""
+        start = self._row.get(start_id, None)
+        end = self._row.get(end_id, None)
+        if start is None or end is None:
+            return False
+        edge_types = tuple(edge_types)
+        visited = {start}
+        queue = deque([start])
+        while queue:
+            r = queue.popleft()
+            for n in self._neighbor_rows(r, edge_types):
+                if n == end:
+                    return True
+                if n not in visited:
+                    visited.add(n)
+                    queue.append(n)
+        return False
+
+    def terminals(self,
+                  node_id: int,
+                  edge_types: Iterable[str],
+                  reverse: bool = False,
+                  max_depth: Optional[int] = None,
+                  label: Optional[str] = "AST",
+                  include_self: bool = True) -> List[Dict[str, Any]]:
+        """Get the ends of the paths starting at node_id, i.e. getSinks (forward) or getSources (reverse).
+
+        A terminal is a reachable node (possibly node_id itself) with no further edge of edge_types in the traversal
+        direction. Terminals are distinct and ordered by their shortest distance from node_id.
+
+        Args:
+            node_id (int): The node to start from.
+            edge_types (Iterable[str]): Edge types to traverse.
+            reverse (bool, optional): Traverse edges backwards. Defaults to False.
+            max_depth (Optional[int], optional): Maximum path length; unbounded if None.
+            label (Optional[str], optional): The start node and the terminals must have this label. Defaults to "AST".
+            include_self (bool, optional): Whether node_id itself may be returned (zero-length path). Defaults to True.
+        """
+        start = self._row.get(node_id, None)
+        if start is None or (label and label not in self.labels[start]):
+            return []
+        edge_types = tuple(edge_types)
+        output = []
+        visited = {start}
+        queue = deque([(start, 0)])
+        while queue:
+            r, depth = queue.popleft()
+            neighbors = self._neighbor_rows(r, edge_types, reverse)
+            if not neighbors:
+                if (not label or label in self.labels[r]) and (include_self or r != start):
+                    output.append(self._node_at(r))
+                continue
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for n in neighbors:
+                if n not in visited:
+                    visited.add(n)
+                    queue.append((n, depth + 1))
+        return output
+
+
+global __MEMORY_GRAPH, __MEMORY_GRAPH_LOCK
+__MEMORY_GRAPH: Optional[MemoryGraph] = None
+__MEMORY_GRAPH_LOCK = threading.Lock()
+
+
+def getMemoryGraph() -> Optional[MemoryGraph]:
+    """Get the in-memory graph, or None if the in-memory backend is disabled or not loaded yet.
+
+    Callers fall back to Neo4j when this returns None.
+    """
+    return __MEMORY_GRAPH
+
+
+def loadMemoryGraph() -> Optional[MemoryGraph]:
+    """Snapshot the preprocessed graph in Neo4j into memory if IN_MEMORY_GRAPH is enabled.
+
+    Preprocessing adds nodes, edges, labels and properties with Cypher as well as through the step files, so the
+    NAVEX exports do not describe the graph the analysis reads. The snapshot is always taken from Neo4j.
+
+    Returns:
+        Optional[MemoryGraph]: The loaded graph, or None if the backend is disabled.
+    """
+    global __MEMORY_GRAPH
+    if not IN_MEMORY_GRAPH:
+        return None
+    with __MEMORY_GRAPH_LOCK:
+        print("Loading in-memory graph from neo4j... ", end="")
+        __MEMORY_GRAPH = MemoryGraph.from_neo4j()
+        print(f"{len(__MEMORY_GRAPH)} nodes, {__MEMORY_GRAPH.edge_count} edges")
+    return __MEMORY_GRAPH
+
+
+def invalidateMemoryGraph() -> None:
+    """Drop the in-memory graph, e.g. after the Neo4j graph has been written to."""
+    global __MEMORY_GRAPH
+    with __MEMORY_GRAPH_LOCK:
+        __MEMORY_GRAPH = None
@@ -1,15 +1,28 @@
+import threading
+from typing import Optional
+
 from py2neo import Graph
 
-from Settings import NEO4J_BOLT_CONNECTION_STRING, NEO4J_PASSWORD, NEO4J_USER
+from QueryProfiler import ProfilingGraph, getQueryProfiler
+from Settings import NEO4J_BOLT_CONNECTION_STRING, NEO4J_DATABASE, NEO4J_PASSWORD, NEO4J_USER, QUERY_PROFILE
 
-global __GRAPH
-__GRAPH: Graph = Graph(auth=(NEO4J_USER, NEO4J_PASSWORD), uri=NEO4J_BOLT_CONNECTION_STRING)
+global __GRAPH, __GRAPH_LOCK
+__GRAPH: Optional[Graph] = None
+__GRAPH_LOCK = threading.Lock()
 
 
 def getGraph() -> Graph:
-    """Connect to the Neo4j database that contains the AST.
+    """Connect to the Neo4j database that contains the AST. The connection is opened on first use.
+
+    With QUERY_PROFILE enabled, the graph is wrapped in a ProfilingGraph that times every query.
 
     Returns:
         Graph: Neo4j Graph.
     """
+    global __GRAPH
+    if __GRAPH is None:
+        with __GRAPH_LOCK:
+            if __GRAPH is None:
+                graph = Graph(auth=(NEO4J_USER, NEO4J_PASSWORD), uri=NEO4J_BOLT_CONNECTION_STRING, name=NEO4J_DATABASE)
+                __GRAPH = ProfilingGraph(graph, getQueryProfiler()) if QUERY_PROFILE else graph
     return __GRAPH
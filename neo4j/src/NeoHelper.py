@@ -8,14 +8,13 @@ from typing import Any, Dict, List, Optional, Set, Tuple
 
 import py2neo
 from py2neo import cypher
-from bs4 import BeautifulSoup
-from selenium import webdriver
 from Args import getPluginLink
 
+from MemoryGraph import getMemoryGraph
 from NeoGraph import getGraph
+from NodeCache import getNodeCache
+from ValueCache import debug_value_cache_info, persistent_cache
 from Settings import LRU_CACHE_SIZE, MAX_NODE_CODE_LENGTH, ROOT_DIR
-import tldextract
-import validators
 
 
 def requiresAnalysis():
@@ -40,6 +39,8 @@ def isURLThirdParty(url):
 def compareURLDomain(url1, url2):
     """Compare if two given urls have the same domain.
     """
+    import tldextract
+
     domain1 = tldextract.extract(url1)[1]
     domain2 = tldextract.extract(url2)[1]
     return domain1 == domain2
@@ -49,6 +50,8 @@ def isUrlValid(string):
     """Check if a string is a valid URL
     
     """
+    import validators
+
     if validators.url(string):
         return True
     return False
@@ -134,16 +137,10 @@ def unique(l: List[Any]) -> List[Any]:
     return list(set(l))
 
 
-global __node_cache, __lru_cache_miss, __manual_cache_hit
-__node_cache: Dict[int, Dict[str, Any]] = dict()
-__lru_cache_miss: int = 0
-__manual_cache_hit: int = 0
-
-
 def getNode(node_id: int) -> Dict[str, Any]:
     """Get a node given a node's ID.
 
-    Nodes returned by this function are cached for speed at the expense of memory. This function also assumes accesses are spatially close, so nearby nodes are cached when a single node is accessed.
+    Nodes returned by this function are cached (see NodeCache) for speed. This function also assumes accesses are spatially close, so nearby nodes are fetched along with a node that is not cached yet; the size of that window adapts to how many of the prefetched nodes end up being used.
 
     Args:
             node_id (int): The ID of the node to lookup in Neo4j.
@@ -151,37 +148,35 @@ def getNode(node_id: int) -> Dict[str, Any]:
     Returns:
             Dict[str, Any]: Empty dictionary if the node could not be found. Otherwise returns a dictionary of the node's values, where each key is a string.
     """
-    global __node_cache, __lru_cache_miss, __manual_cache_hit
-
-    if node_id in __node_cache.keys():
-        __manual_cache_hit += 1
-        return __node_cache[node_id]
-
-    graph = getGraph()
-
-    start = max(node_id - 15, 0)
-    end = node_id + 15
-    to_fetch = [str(x) for x in range(start, end) if x not in __node_cache.keys()]
-    query = f'MATCH (a) WHERE a.id in [{", ".join(to_fetch)}] RETURN a'
-
-    node_result = graph.run(query)
-    for result in node_result:
-        node = dict(result['a'])
-        nid = node['id']
-        __node_cache[nid] = node
+    memory_graph = getMemoryGraph()
+    if memory_graph is not None:
+        return memory_graph.getNode(node_id)
 
-    __lru_cache_miss += 1
-    return __node_cache.get(node_id, {})
+    cache = getNodeCache()
+    node = cache.getNode(node_id)
+    if node is not None:
+        return node
 
-
-global __node_children_cache
-__node_children_cache: Dict[Tuple[int, str], List[Dict[str, Any]]] = {}
+    query = """
+    MATCH (a) WHERE a.id IN $ids
+    RETURN a
+    """
+    output = {}
+    for result in getGraph().run(query, ids=cache.windowIds(node_id)):
+        fetched = dict(result['a'])
+        if fetched['id'] == node_id:
+            output = fetched
+            cache.putNode(fetched)
+        else:
+            cache.putNode(fetched, prefetch_kind="window")
+    return output
 
 
-@lru_cache(maxsize=LRU_CACHE_SIZE)
 def getNodeChildren(nodeID: int, edge_type: str = "PARENT_OF") -> List[Dict[str, Any]]:
     """Get a node's children, ordered by child number.
 
+    The children are cached, and their own children are fetched in the same query while that keeps paying off.
+
     Args:
             nodeID (int): The parent node's ID.
             edge_type (str, optional): Specific edge type to traverse. Defaults to "PARENT_OF".
@@ -189,33 +184,59 @@ def getNodeChildren(nodeID: int, edge_type: str = "PARENT_OF") -> List[Dict[str,
     Returns:
             List[Dict[str, Any]]: List of nodes converted to dicts. Should be order from lowest childnum to highest.
     """
-    global __node_children_cache
-    if (nodeID, edge_type) in __node_children_cache.keys():
-        return __node_children_cache[(nodeID, edge_type)]
+    memory_graph = getMemoryGraph()
+    if memory_graph is not None:
+        return memory_graph.getNodeChildren(nodeID, edge_type)
+
+    cache = getNodeCache()
+    child_ids = cache.getChildren(nodeID, edge_type)
+    if child_ids is not None:
+        return [getNode(i) for i in child_ids]
 
     graph = getGraph()
-    query = f"""
-    MATCH (a{{id:{nodeID}}})-[:{edge_type}]->(b)
-    WITH b ORDER BY b.childnum
-    RETURN COLLECT(DISTINCT b.id)
-    """
-    results = graph.evaluate(query)
+    prefetch = cache.shouldPrefetch("subtree")
+    if prefetch:
+        query = f"""
+        MATCH (a{{id:{nodeID}}})-[:{edge_type}]->(b)
+        OPTIONAL MATCH (b)-[:{edge_type}]->(c)
+        WITH b, c ORDER BY c.childnum
+        WITH b, COLLECT(DISTINCT c) AS grandchildren
+        RETURN b, grandchildren ORDER BY b.childnum
+        """
+    else:
+        query = f"""
+        MATCH (a{{id:{nodeID}}})-[:{edge_type}]->(b)
+        WITH DISTINCT b
+        RETURN b, [] AS grandchildren ORDER BY b.childnum
+        """
     output = []
-    for i in results if results else []:
-        output.append(getNode(i))
+    for result in graph.run(query):
+        child = dict(result['b'])
+        cache.putNode(child)
+        output.append(child)
+        if prefetch:
+            grandchildren = [dict(c) for c in result['grandchildren']]
+            for grandchild in grandchildren:
+                cache.putNode(grandchild, prefetch_kind="subtree")
+            cache.putChildren(child['id'], edge_type, [c['id'] for c in grandchildren])
+    cache.putChildren(nodeID, edge_type, [c['id'] for c in output])
     return output
 
 
-global __explicitly_cached_nodes
-__explicitly_cached_nodes: Set[Tuple[int, str]] = set()
-
+def cacheAllNodeChildren(node_id: int, edge_type: str = "PARENT_OF", node_label: str = "AST", prefetch_kind: Optional[str] = None):
+    """Fetch a whole subtree with one query and cache its nodes and children lists.
 
-def cacheAllNodeChildren(node_id: int, edge_type: str = "PARENT_OF", node_label: str = "AST"):
-    global __node_cache, __node_children_cache, __explicitly_cached_nodes
-
-    if node_id in __explicitly_cached_nodes:
+    Args:
+            node_id (int): Root of the subtree.
+            edge_type (str, optional): Edge type of the tree. Defaults to "PARENT_OF".
+            node_label (str, optional): Label of the nodes in the tree. Defaults to "AST".
+            prefetch_kind (Optional[str], optional): Count the fetched nodes as this kind of prefetch. Defaults to None.
+    """
+    if getMemoryGraph() is not None:
+        return
+    cache = getNodeCache()
+    if cache.hasChildren(node_id, edge_type):
         return
-    __explicitly_cached_nodes.add((node_id, edge_type))
 
     query = f"""
     MATCH (n:{node_label}{{id:{node_id}}})-[:{edge_type}*0..]->(p:{node_label})-[:{edge_type}]->(c:{node_label})
@@ -227,16 +248,14 @@ def cacheAllNodeChildren(node_id: int, edge_type: str = "PARENT_OF", node_label:
     try:
         for parent_node, children_nodes in results:
             parent_dict = dict(parent_node)
-            __node_cache[parent_dict["id"]] = parent_dict
-            __explicitly_cached_nodes.add(parent_dict["id"])
+            cache.putNode(parent_dict, prefetch_kind=prefetch_kind)
 
             children_dict = [dict(c) for c in children_nodes]
             children_dict.sort(key=lambda x: x["childnum"])
             for child in children_dict:
-                __node_cache[child["id"]] = child
-                __explicitly_cached_nodes.add(parent_node["id"])
+                cache.putNode(child, prefetch_kind=prefetch_kind)
 
-            __node_children_cache[(parent_dict["id"], edge_type)] = children_dict
+            cache.putChildren(parent_dict["id"], edge_type, [c["id"] for c in children_dict])
     except:
         return
 
@@ -327,6 +346,13 @@ def escapeQuotes(s: str) -> str:
 
 @lru_cache(maxsize=LRU_CACHE_SIZE)
 def concatTree2(nodeID: int, nodeLabel: str = "AST") -> str:
+    memory_graph = getMemoryGraph()
+    if memory_graph is not None:
+        if not memory_graph.has_label(nodeID, nodeLabel):
+            return ""
+        node_dict, rels_dict = memory_graph.subtree(nodeID)
+        return _concatTree2(nodeID, node_dict, rels_dict)
+
     graph = getGraph()
     query = f"""
     MATCH p=(n:{nodeLabel}{{id:{nodeID}}})-[:PARENT_OF*0..]->(m{nodeLabel})
@@ -479,6 +505,7 @@ def _concatTree2(start: int, node_dict: Dict[int, Dict[str, Any]], rels_dict: Di
 
 
 @lru_cache(maxsize=LRU_CACHE_SIZE)
+@persistent_cache
 def concatTree(nodeID: int, nodeLabel: str = "AST") -> str:
     return escapeQuotes(concatTree2(nodeID, nodeLabel=nodeLabel))
 
@@ -782,7 +809,11 @@ def getRootOfLine(node_id: int) -> Optional[Dict[str, Any]]:
     result = graph.evaluate(queryParent)
     if not result:
         return None
-    return dict(result)
+    root = dict(result)
+    # Detectors usually go on to look at the rest of the line.
+    if getNodeCache().shouldPrefetch("line"):
+        cacheAllNodeChildren(root["id"], prefetch_kind="line")
+    return root
 
 
 def getMaxNodeID() -> int:
@@ -834,6 +865,9 @@ def binary_concat(entry_id: int, all_nodes: List[Tuple[Dict[str, Any], Dict[str,
 
 def scrape(websiteURL):
     """Web scraper for privacy policy"""
+    from bs4 import BeautifulSoup
+    from selenium import webdriver
+
     driver = webdriver.Chrome(ROOT_DIR + "neo4j/src/chromedriver")
     driver.get(websiteURL)
 
@@ -1014,9 +1048,20 @@ def traverse_cfg(node_id: int) -> Tuple[int, List[Tuple[int, int, str]], bool]:
 
 
 def debug_cache_info():
-    """Print debug info about the cached functions."""
+    """Print debug info about the node cache and the cached functions."""
+    info = getNodeCache().info()
+    for name in ("nodes", "children"):
+        c = info[name]
+        ratio = c["hits"] / max(c["hits"] + c["misses"], 1)
+        print(f"{name} cache ({c['policy']})")
+        print(f"hits={c['hits']}, misses={c['misses']} ({ratio:.1%} hit rate), evictions={c['evictions']}, "
+              f"entries={c['entries']}, bytes={c['bytes']}/{c['max_bytes']}")
+        print()
+    print(f"prefetch window: +-{info['window']} ids")
+    for kind, p in info["prefetch"].items():
+        print(f"{kind} prefetch: {p['used']}/{p['prefetched']} used{'' if p['enabled'] else ' (disabled)'}")
+    print()
     cached_functions = [
-        getNode,
         getNodeType,
         getVarAssignLocation,
         getNodeName,
@@ -1029,3 +1074,4 @@ def debug_cache_info():
         print(f.__name__)
         print(f.cache_info())
         print()
+    debug_value_cache_info()
@@ -0,0 +1,313 @@
+# GDPR Checker project
+# Bounded caches for the nodes and node children that NeoHelper fetches from Neo4j.
+#
+# Entries are weighed by an estimate of their size in bytes and evicted with LRU or ARC (adaptive replacement cache)
+# once NODE_CACHE_MAX_BYTES is exceeded. NeoHelper also prefetches nodes it expects to be used soon (an id window
+# around a missed node, a node's grandchildren, the subtree of a line's root); each kind of prefetch is tracked and
+# turned down or off when the prefetched nodes are not used.
+
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from Settings import NODE_CACHE_MAX_BYTES, NODE_CACHE_POLICY, NODE_CACHE_PREFETCH
+
+# Bounds of the half-width of the id window fetched around a missed node.
+_MIN_WINDOW = 4
+_MAX_WINDOW = 256
+# Prefetched ids of each kind to observe before adapting, and the used fractions that turn prefetching up or down.
+_PREFETCH_SAMPLE = 2000
+_PREFETCH_GOOD = 0.5
+_PREFETCH_POOR = 0.1
+
+
+def estimateSize(value: Any) -> int:
+    """Rough size in bytes of a cached node dictionary or list of node ids."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for v in value.values():
+            size += sys.getsizeof(v)
+    elif isinstance(value, (list, tuple)):
+        size += 28 * len(value)
+    return size
+
+
+class BoundedCache:
+    """Thread-safe mapping bounded by the estimated size of its values, with LRU or ARC eviction.
+
+    ARC keeps recently used entries (T1) apart from frequently used ones (T2) and remembers the keys recently evicted
+    from each (the ghost lists B1 and B2). A miss on a ghost key moves the target size of T1 towards the list that
+    would have kept it, so long scans over the AST do not flush the nodes that are used over and over.
+    """
+
+    def __init__(self,
+                 max_bytes: int,
+                 policy: str = "lru",
+                 on_evict: Optional[Callable[[Hashable], None]] = None) -> None:
+        if policy not in ("lru", "arc"):
+            raise ValueError(f"Unknown cache policy {policy}")
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._on_evict = on_evict
+        self._lock = threading.Lock()
+        # key -> (value, size). With LRU only t1 is used.
+        self._t1: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._t2: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        # Ghost entries: key -> size.
+        self._b1: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._b2: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._t1_bytes = 0
+        self._t2_bytes = 0
+        self._b1_bytes = 0
+        self._b2_bytes = 0
+        self._target = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._t1) + len(self._t2)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._t1 or key in self._t2
+
+    @property
+    def bytes(self) -> int:
+        return self._t1_bytes + self._t2_bytes
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value, counting the hit or miss and marking the entry as used."""
+        with self._lock:
+            if key in self._t1:
+                value, size = self._t1[key]
+                if self.policy == "arc":
+                    del self._t1[key]
+                    self._t1_bytes -= size
+                    self._t2[key] = (value, size)
+                    self._t2_bytes += size
+                else:
+                    self._t1.move_to_end(key)
+                self.hits += 1
+                return value
+            if key in self._t2:
+                self._t2.move_to_end(key)
+                self.hits += 1
+                return self._t2[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None) -> None:
+        """Insert or replace a value, evicting other entries if the cache grows over its bound."""
+        if size is None:
+            size = estimateSize(value)
+        evicted: List[Hashable] = []
+        with self._lock:
+            self._remove(key)
+            if self.policy == "arc" and key in self._b1:
+                ratio = max(1, self._b2_bytes // max(self._b1_bytes, 1))
+                self._target = min(self.max_bytes, self._target + ratio * size)
+                self._b1_bytes -= self._b1.pop(key)
+                self._t2[key] = (value, size)
+                self._t2_bytes += size
+            elif self.policy == "arc" and key in self._b2:
+                ratio = max(1, self._b1_bytes // max(self._b2_bytes, 1))
+                self._target = max(0, self._target - ratio * size)
+                self._b2_bytes -= self._b2.pop(key)
+                self._t2[key] = (value, size)
+                self._t2_bytes += size
+            else:
+                self._t1[key] = (value, size)
+                self._t1_bytes += size
+            while self.bytes > self.max_bytes and len(self) > 1:
+                evicted.append(self._evict())
+            while self._b1_bytes + self._b2_bytes > self.max_bytes:
+                if self._b1_bytes >= self._b2_bytes:
+                    self._b1_bytes -= self._b1.popitem(last=False)[1]
+                else:
+                    self._b2_bytes -= self._b2.popitem(last=False)[1]
+        if self._on_evict:
+            for k in evicted:
+                self._on_evict(k)
+
+    def _evict(self) -> Hashable:
+        if self._t1 and (self.policy == "lru" or self._t1_bytes > self._target or not self._t2):
+            key, (_, size) = self._t1.popitem(last=False)
+            self._t1_bytes -= size
+            if self.policy == "arc":
+                self._b1[key] = size
+                self._b1_bytes += size
+        else:
+            key, (_, size) = self._t2.popitem(last=False)
+            self._t2_bytes -= size
+            self._b2[key] = size
+            self._b2_bytes += size
+        self.evictions += 1
+        return key
+
+    def _remove(self, key: Hashable) -> bool:
+        if key in self._t1:
+            self._t1_bytes -= self._t1.pop(key)[1]
+            return True
+        if key in self._t2:
+            self._t2_bytes -= self._t2.pop(key)[1]
+            return True
+        return False
+
+    def discard(self, key: Hashable) -> None:
+        """Remove an entry (but keep it as a ghost, which carries no stale value)."""
+        with self._lock:
+            self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            for d in (self._t1, self._t2, self._b1, self._b2):
+                d.clear()
+            self._t1_bytes = self._t2_bytes = self._b1_bytes = self._b2_bytes = 0
+            self._target = 0
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class NodeCache:
+    """Node and children caches plus the bookkeeping for adaptive prefetching.
+
+    Nodes are keyed by id. Children are keyed by (parent id, edge type) and stored as lists of ids, so a node is only
+    stored once however it was fetched.
+    """
+
+    def __init__(self,
+                 max_bytes: int = NODE_CACHE_MAX_BYTES,
+                 policy: str = NODE_CACHE_POLICY,
+                 prefetch: bool = NODE_CACHE_PREFETCH) -> None:
+        self.nodes = BoundedCache(max_bytes * 3 // 4, policy, on_evict=self._forget_prefetched)
+        self.children = BoundedCache(max_bytes // 4, policy)
+        self.prefetch = prefetch
+        self.window = 15
+        self._lock = threading.Lock()
+        # Prefetched node id -> kind of prefetch, until the node is used or evicted.
+        self._prefetched: Dict[int, str] = dict()
+        # kind -> [ids prefetched, ids used] since the last adaptation, and totals for reporting.
+        self._prefetch_stats: Dict[str, List[int]] = dict()
+        self._prefetch_totals: Dict[str, List[int]] = dict()
+        self._disabled: Dict[str, bool] = dict()
+
+    # Nodes.
+
+    def getNode(self, node_id: int) -> Optional[Dict[str, Any]]:
+        node = self.nodes.get(node_id)
+        if node is not None and self._prefetched:
+            with self._lock:
+                kind = self._prefetched.pop(node_id, None)
+                if kind is not None:
+                    self._prefetch_stats[kind][1] += 1
+                    self._prefetch_totals[kind][1] += 1
+        return node
+
+    def putNode(self, node: Dict[str, Any], prefetch_kind: Optional[str] = None) -> None:
+        node_id = node["id"]
+        if prefetch_kind is not None and node_id not in self.nodes:
+            with self._lock:
+                self._prefetched[node_id] = prefetch_kind
+                self._record_prefetch(prefetch_kind)
+        self.nodes.put(node_id, node)
+
+    def hasNode(self, node_id: int) -> bool:
+        return node_id in self.nodes
+
+    def _forget_prefetched(self, node_id: Hashable) -> None:
+        with self._lock:
+            self._prefetched.pop(node_id, None)
+
+    # Children.
+
+    def getChildren(self, node_id: int, edge_type: str) -> Optional[List[int]]:
+        return self.children.get((node_id, edge_type))
+
+    def putChildren(self, node_id: int, edge_type: str, child_ids: List[int]) -> None:
+        self.children.put((node_id, edge_type), list(child_ids))
+
+    def hasChildren(self, node_id: int, edge_type: str) -> bool:
+        return (node_id, edge_type) in self.children
+
+    # Prefetch policy.
+
+    def shouldPrefetch(self, kind: str) -> bool:
+        """Whether prefetching of this kind is still paying off."""
+        return self.prefetch and not self._disabled.get(kind, False)
+
+    def windowIds(self, node_id: int) -> List[int]:
+        """Ids around a missed node that are not cached yet, including the node itself."""
+        window = self.window if self.shouldPrefetch("window") else 0
+        start = max(node_id - window, 0)
+        return [i for i in range(start, node_id + window + 1) if i == node_id or i not in self.nodes]
+
+    def _record_prefetch(self, kind: str) -> None:
+        stats = self._prefetch_stats.setdefault(kind, [0, 0])
+        totals = self._prefetch_totals.setdefault(kind, [0, 0])
+        stats[0] += 1
+        totals[0] += 1
+        if stats[0] < _PREFETCH_SAMPLE:
+            return
+        used = stats[1] / stats[0]
+        if kind == "window":
+            if used >= _PREFETCH_GOOD:
+                self.window = min(self.window * 2, _MAX_WINDOW)
+            elif used <= _PREFETCH_POOR:
+                self.window = max(self.window // 2, _MIN_WINDOW)
+        elif used <= _PREFETCH_POOR:
+            print(f"Node cache: disabling {kind} prefetch ({used:.0%} of prefetched nodes used)")
+            self._disabled[kind] = True
+        stats[0] = stats[1] = 0
+
+    # Invalidation.
+
+    def invalidate(self, node_ids: Iterable[int] = (), edges: Iterable[Tuple[int, str]] = ()) -> None:
+        """Drop the given nodes and the children lists of the given (start id, edge type) pairs."""
+        for node_id in node_ids:
+            self.nodes.discard(node_id)
+        for start_id, edge_type in edges:
+            self.children.discard((start_id, edge_type))
+
+    def clear(self) -> None:
+        self.nodes.clear()
+        self.children.clear()
+        with self._lock:
+            self._prefetched.clear()
+
+    def info(self) -> Dict[str, Any]:
+        prefetch = {
+            kind: {
+                "prefetched": totals[0],
+                "used": totals[1],
+                "enabled": not self._disabled.get(kind, False)
+            } for kind, totals in self._prefetch_totals.items()
+        }
+        return {"nodes": self.nodes.info(), "children": self.children.info(), "window": self.window, "prefetch": prefetch}
+
+
+global __NODE_CACHE
+__NODE_CACHE = NodeCache()
+
+
+def getNodeCache() -> NodeCache:
+    return __NODE_CACHE
+
+
+def invalidateNodeCache(node_ids: Iterable[int] = (), edges: Iterable[Tuple[int, str]] = ()) -> None:
+    """Drop cached entries that a commit changes: its new nodes, and the children lists of its edges' start nodes."""
+    __NODE_CACHE.invalidate(node_ids, edges)
+
+
+def clearNodeCache() -> None:
+    """Drop every cached entry, e.g. after the database was rebuilt."""
+    __NODE_CACHE.clear()
@@ -1,32 +1,58 @@
-import pandas as pd
-import numpy as np
-from Settings import ROOT_DIR, MAX_NODE_CODE_LENGTH
+from Settings import (
+    CPG_EDGES_CSV_FILE_LOC,
+    EDGES_CSV_FILE_LOC,
+    IMPORT_BATCH_SIZE,
+    MAX_NODE_CODE_LENGTH,
+    NEO4J_DATABASE,
+    NEO4J_HOME,
+    NODES_CSV_FILE_LOC,
+    OFFLINE_IMPORT_START_TIMEOUT,
+    ROOT_DIR,
+)
+from Utls import readCSVbyTab
 import csv
+import hashlib
+import itertools
+import json
+import math
 import os
+import subprocess
 from NeoGraph import getGraph
-from Args import PLUGIN_NAME
-from typing import Dict, List, Optional
+from MemoryGraph import invalidateMemoryGraph
+from NodeCache import clearNodeCache, invalidateNodeCache
+from ReachabilityIndex import invalidateReachabilityIndex
+from CallNameIndex import invalidateCallNameIndex
+from ValueResolver import clearValueResolverCache
+from Args import getArgs
+from preprocessing.utils.NodeIdGenerator import NodeIdGenerator
+from typing import Dict, List, Optional, Tuple
 from py2neo.bulk import create_relationships
 import threading
-from itertools import groupby
+import time
 
 # Globals.
-global NODE_DF, EDGE_DF, __step, NODE_FILE_NAME, EDGE_FILE_NAME, ID_COUNTER, EDGE_PAIR, ID_COUNTER_LOCK
+global NODE_DF, EDGE_DF, __step, NODE_FILE_NAME, EDGE_FILE_NAME, EDGE_PAIR
 
 # Constants.
-RESULTS_PATH = os.path.join(ROOT_DIR, "results", "navex", PLUGIN_NAME + "_preprocess")
 NODE_FILE_NAME = 'node.csv'
 EDGE_FILE_NAME = 'edge.csv'
 HTML_NODE_FILE_NAME = 'html_node.csv'
 SQL_NODE_FILE_NAME = 'sql_node.csv'
+CPG_EDGE_FILE_NAME = 'cpg_edge.csv'
+CHECKPOINT_FILE_NAME = 'checkpoint.json'
+
+# Content hash of the input graph; step files are only reused if they were written from the same input.
+INPUT_HASH = None
+# Tag of the code of the current step; step files are only reused if they were written by the same code.
+STEP_TAG = None
 
 #NODE_DF = pd.DataFrame({"id":[],"label":[],"type":[],"flags":[],"lineno":[], "code":[],"childnum":[],"funcid":[],"classname":[],"namespace":[],"endlineno":[],"name":[],"doccomment":[]})
 #EDGE_DF = pd.DataFrame({"start_id":[],"start_label":[],"end_id":[],"end_label":[],"type":[],"var":[]})
 #HTML_NODE_DF = pd.DataFrame({"id":[],"label":[],"type":[],"startIndex":[],"endIndex":[], "code":[],"childnum":[],"name":[]})
 #SQL_NODE_DF = pd.DataFrame({"id":[],"label":[],"type":[],"table":[],"columns":[],"lineno":[], "code":[],"childnum":[]})
 
-ID_COUNTER = 0
-ID_COUNTER_LOCK = threading.Lock()
+# Look the largest id up only when the first id is needed, so importing this module does not connect to Neo4j.
+NodeIdGenerator.allocator.use_start_provider(lambda: getGraph().evaluate('MATCH (n) RETURN MAX(n.id)'))
 
 NODE_DF = []
 NODE_DF_LOCK = threading.Lock()
@@ -45,13 +71,18 @@ EDGE_PAIR = set()
 __step = 0
 
 
+def getResultsPath() -> str:
+    """Get the directory the preprocessing steps of the analyzed plugin are saved in."""
+    return os.path.join(ROOT_DIR, "results", "navex", getArgs().plugin_name + "_preprocess")
+
+
 def setUp():
     global __step
     createDirectory(__step)
 
 
 def createDirectory(step):
-    directory = RESULTS_PATH
+    directory = getResultsPath()
     if not os.path.exists(directory):
         os.makedirs(directory)
     stepDir = getStepDirectory(step)
@@ -62,7 +93,7 @@ def createDirectory(step):
 def isFieldNull(field):
     if not field:
         return True
-    if pd.isnull(field):
+    if isinstance(field, float) and math.isnan(field):
         return True
     elif field in ['""', "''", '']:
         return True
@@ -71,34 +102,86 @@ def isFieldNull(field):
 
 def getMaxID():
     #This function manages the IDs assigned to newly created nodes
-    #Returns a node ID for a new node.
-    global ID_COUNTER, ID_COUNTER_LOCK
-    ID_COUNTER_LOCK.acquire()
-
-    if not ID_COUNTER:
-        try:
-            graph = getGraph()
-            result = graph.evaluate("""MATCH (n) RETURN MAX(n.id)""")
-            max_id: int = result if result else 0
-            ID_COUNTER = max_id + 1
-        finally:
-            ID_COUNTER_LOCK.release()
-            return ID_COUNTER
-    else:
-        try:
-            ID_COUNTER += 1
-        finally:
-            ID_COUNTER_LOCK.release()
-            return ID_COUNTER
+    #Returns a node ID for a new node. IDs come from the allocator shared with the preprocessing pipeline, which starts
+    #after the largest ID in the graph and hands each thread a contiguous block.
+    return NodeIdGenerator.generate_id()
 
 
 def isPreprocessed():
-    #check if the current step is preprocessed (files already in the results folder)
+    #check if the current step is preprocessed (files already in the results folder, written from the same input graph)
     global __step, NODE_FILE_NAME, EDGE_FILE_NAME
     directory = getStepDirectory(__step)
     nodeDir = os.path.join(directory, NODE_FILE_NAME)
     edgeDir = os.path.join(directory, EDGE_FILE_NAME)
-    return os.path.exists(directory) and os.path.isfile(nodeDir) and os.path.isfile(edgeDir)
+    if not (os.path.exists(directory) and os.path.isfile(nodeDir) and os.path.isfile(edgeDir)):
+        return False
+    try:
+        with open(os.path.join(directory, CHECKPOINT_FILE_NAME), "r") as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (INPUT_HASH is not None and checkpoint.get("input_hash", None) == INPUT_HASH
+            and checkpoint.get("step_tag", None) == STEP_TAG)
+
+
+def computeInputHash() -> str:
+    """Get a content hash of the graph preprocessing starts from.
+
+    The hash covers the NAVEX exports (nodes.csv, edges.csv and cpg_edges.csv). If they are not available, a summary
+    of the graph in Neo4j is hashed instead.
+    """
+    sha = hashlib.sha256(getArgs().plugin_name.encode())
+    files = [f for f in (NODES_CSV_FILE_LOC, EDGES_CSV_FILE_LOC, CPG_EDGES_CSV_FILE_LOC) if os.path.isfile(f)]
+    if files:
+        for file in files:
+            with open(file, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(chunk)
+    else:
+        summary = getGraph().run("""
+        MATCH (n) WITH COUNT(n) AS nodes, MAX(n.id) AS max_id
+        MATCH ()-[r]->() RETURN nodes, max_id, COUNT(r) AS edges
+        """).data()
+        sha.update(json.dumps(summary, sort_keys=True, default=str).encode())
+    return sha.hexdigest()
+
+
+def computeInputMaxId() -> Optional[int]:
+    """Get the largest node id of the graph preprocessing starts from.
+
+    The ids are read from the NAVEX nodes.csv. If any of the NAVEX exports is missing, None is returned: computeInputHash
+    then only summarizes the graph in Neo4j, which is too weak a fingerprint for the value cache, so it stays disabled.
+    """
+    if not all(os.path.isfile(f) for f in (NODES_CSV_FILE_LOC, EDGES_CSV_FILE_LOC, CPG_EDGES_CSV_FILE_LOC)):
+        return None
+    max_id = None
+    for row in readCSVbyTab(NODES_CSV_FILE_LOC):
+        try:
+            node_id = int(row[0])
+        except (IndexError, ValueError):
+            # The header row.
+            continue
+        if max_id is None or node_id > max_id:
+            max_id = node_id
+    return max_id
+
+
+def setInputHash(input_hash: Optional[str]):
+    """Set the input graph hash that step checkpoints are written with and validated against."""
+    global INPUT_HASH
+    INPUT_HASH = input_hash
+
+
+def setStepTag(step_tag: Optional[str]):
+    """Set the tag of the code of the current step, which its checkpoint is written with and validated against."""
+    global STEP_TAG
+    STEP_TAG = step_tag
+
+
+def _write_checkpoint():
+    global __step
+    with open(os.path.join(getStepDirectory(__step), CHECKPOINT_FILE_NAME), "w") as f:
+        json.dump({"step": __step, "input_hash": INPUT_HASH, "step_tag": STEP_TAG}, f)
 
 
 def addNode(label,
@@ -188,14 +271,34 @@ def addHTMLNode(label, type, startIndex, endIndex, code, childnum, name):
 
 
 # Take in a collection of edges.
-def addEdgeBulk(edges):
+def addEdgeBulk(edges, unique=False):
+    """Add a list of edge rows (in the format built by addEdge).
+
+    Args:
+        edges (list): Edge rows to add.
+        unique (bool, optional): Apply addEdge's rules: skip self-loops and edges that were already added, and record
+            the new edges so later addEdge calls skip them too. Defaults to False.
+
+    Returns:
+        int: The number of edges added.
+    """
     assert isinstance(edges, list)
 
-    global EDGE_DF, EDGE_DF_LOCK
+    global EDGE_DF, EDGE_DF_LOCK, EDGE_PAIR
     EDGE_DF_LOCK.acquire()
     try:
+        if unique:
+            new_edges = []
+            for edge in edges:
+                key = (edge["start_id"], edge["end_id"], edge["type"])
+                if key in EDGE_PAIR or edge["start_id"] == edge["end_id"]:
+                    continue
+                EDGE_PAIR.add(key)
+                new_edges.append(edge)
+            edges = new_edges
         EDGE_DF.extend(edges)
         print(f"Number of rows: {len(EDGE_DF)}")
+        return len(edges)
     except:
         print("Warning! Edges not successfully added to the NodeEdgeManager!")
         return 0
@@ -236,19 +339,70 @@ def addEdge(startID, startLabel, endID, endLabel, type, var=None):
         return edge_added
 
 
-def _to_csv(outfile, data):
-    if not data:
-        return
+# Headers of the per-step files, in the format expected by `neo4j-admin import --id-type=INTEGER`.
+ADMIN_NODE_HEADER = [
+    "id:ID", ":LABEL", "type", "flags:string[]", "lineno:int", "code", "childnum:int", "funcid:int", "classname",
+    "namespace", "endlineno:int", "name", "doccomment"
+]
+ADMIN_HTML_NODE_HEADER = ["id:ID", ":LABEL", "type", "startIndex:int", "endIndex:int", "code", "childnum:int", "name"]
+ADMIN_SQL_NODE_HEADER = ["id:ID", ":LABEL", "type", "table", "columns:string[]", "lineno:int", "code", "childnum:int"]
+# The node labels of an edge are only needed to replay the step, so neo4j-admin is told to ignore them.
+ADMIN_EDGE_HEADER = [":START_ID", ":END_ID", ":TYPE", "var", "start_label:IGNORE", "end_label:IGNORE"]
+ADMIN_CPG_EDGE_HEADER = [":START_ID", ":END_ID", ":TYPE", "var", "taint_src", "taint_dst", "flowLabel"]
+ADMIN_ARRAY_DELIMITER = ";"
+BASE_DIRECTORY_NAME = "base"
+
+
+def _admin_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return ADMIN_ARRAY_DELIMITER.join(str(v) for v in value)
+    return str(value)
 
+
+def _to_csv(outfile, header, rows):
+    """Write rows (lists of values ordered like header) as a neo4j-admin import file."""
     with open(outfile, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=list(data[0].keys()))
-        writer.writeheader()
-        writer.writerows(data)
+        writer = csv.writer(csvfile)
+        writer.writerow(header)
+        writer.writerows([_admin_value(v) for v in row] for row in rows)
+
+
+def _node_admin_row(header, label, properties) -> List:
+    row = [properties.get(h.split(":")[0], None) for h in header]
+    row[1] = str(label).replace(":", ADMIN_ARRAY_DELIMITER)
+    return row
+
+
+def _take_buffers():
+    """Atomically take the buffered rows and replace them with empty buffers.
+
+    Returns:
+        Tuple of the node, edge, HTML node and SQL node rows.
+    """
+    global NODE_DF, EDGE_DF, HTML_NODE_DF, SQL_NODE_DF
+    with NODE_DF_LOCK, EDGE_DF_LOCK, HTML_NODE_DF_LOCK, SQL_NODE_DF_LOCK:
+        buffers = (NODE_DF, EDGE_DF, HTML_NODE_DF, SQL_NODE_DF)
+        NODE_DF = []
+        EDGE_DF = []
+        HTML_NODE_DF = []
+        SQL_NODE_DF = []
+    return buffers
+
+
+def writeToCSV(buffers=None):
+    """Write the buffered nodes and edges of the current step into its step directory.
 
+    The files can be loaded into a fresh database with offlineImport().
 
-def writeToCSV():
+    Args:
+        buffers (optional): Rows taken with _take_buffers(). Defaults to the current buffers.
+    """
     global NODE_FILE_NAME, EDGE_FILE_NAME, __step, NODE_DF, EDGE_DF, HTML_NODE_DF, SQL_NODE_DF
+    node_df, edge_df, html_node_df, sql_node_df = buffers if buffers else (NODE_DF, EDGE_DF, HTML_NODE_DF, SQL_NODE_DF)
 
+    createDirectory(__step)
     directory = getStepDirectory(__step)
 
     nodeDir = os.path.join(directory, NODE_FILE_NAME)
@@ -256,15 +410,221 @@ def writeToCSV():
     htmlNodeDir = os.path.join(directory, HTML_NODE_FILE_NAME)
     sqlNodeDir = os.path.join(directory, SQL_NODE_FILE_NAME)
 
-    _to_csv(nodeDir, NODE_DF)
-    _to_csv(edgeDir, EDGE_DF)
-    _to_csv(htmlNodeDir, HTML_NODE_DF)
-    _to_csv(sqlNodeDir, SQL_NODE_DF)
+    _to_csv(nodeDir, ADMIN_NODE_HEADER,
+            [_node_admin_row(ADMIN_NODE_HEADER, row['label'], _node_properties(row)) for row in node_df])
+    _to_csv(htmlNodeDir, ADMIN_HTML_NODE_HEADER,
+            [_node_admin_row(ADMIN_HTML_NODE_HEADER, row['label'], _html_node_properties(row)) for row in html_node_df])
+    _to_csv(sqlNodeDir, ADMIN_SQL_NODE_HEADER,
+            [_node_admin_row(ADMIN_SQL_NODE_HEADER, row['label'], _sql_node_properties(row)) for row in sql_node_df])
+    _to_csv(edgeDir, ADMIN_EDGE_HEADER,
+            [[
+                row['start_id'], row['end_id'], row['type'],
+                _edge_properties(row).get("var", None), row['start_label'], row['end_label']
+            ] for row in edge_df])
+
+
+def _admin_column_name(header: str) -> str:
+    special = {":LABEL": "label", ":START_ID": "start_id", ":END_ID": "end_id", ":TYPE": "type"}
+    return special.get(header, header.split(":")[0])
+
+
+def _read_csv(infile) -> List[Dict]:
+    """Read a file written by writeToCSV back into buffer rows (the dictionaries built by addNode, addEdge, etc.)."""
+    if not os.path.isfile(infile):
+        return []
+    rows = []
+    with open(infile, 'r', newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader, None)
+        if not header:
+            return []
+        for values in reader:
+            row = dict()
+            for h, v in zip(header, values):
+                name = _admin_column_name(h)
+                if h.endswith("[]"):
+                    row[name] = v.split(ADMIN_ARRAY_DELIMITER) if v else None
+                elif name == "label":
+                    row[name] = v.replace(ADMIN_ARRAY_DELIMITER, ":")
+                elif name in ("start_id", "end_id", "id"):
+                    row[name] = int(v)
+                else:
+                    row[name] = v if v != "" else None
+            rows.append(row)
+    return rows
+
+
+def _reserve_replayed(nodes: List[Dict], edges: List[Dict]):
+    """Make sure IDs and edges replayed from a step directory are not handed out or added again."""
+    global EDGE_PAIR, EDGE_DF_LOCK
+    if nodes:
+        NodeIdGenerator.allocator.reserve_above(max(row['id'] for row in nodes))
+    with EDGE_DF_LOCK:
+        for row in edges:
+            EDGE_PAIR.add((row['start_id'], row['end_id'], row['type']))
+
+
+def _count_replayed_in_graph(graph, nodes: List[Dict], edges: List[Dict], sample_size: int = 100) -> Tuple[int, int]:
+    """Look a sample of the nodes and edges of a replayed step up in the graph.
+
+    Returns:
+        Tuple[int, int]: How many of the sampled rows are already in the graph, and how many were sampled.
+    """
+    found = 0
+    node_sample = set((row['label'], row['id']) for row in nodes[:sample_size // 2] + nodes[-(sample_size // 2):])
+    for label, rows in itertools.groupby(sorted(node_sample), key=lambda r: r[0]):
+        found += graph.evaluate(f"""
+        UNWIND $ids AS id
+        MATCH (n:{label}{{id:id}})
+        RETURN COUNT(DISTINCT n.id)
+        """, ids=[r[1] for r in rows]) or 0
+    edge_sample = set((row['start_label'], row['end_label'], row['type'], row['start_id'], row['end_id'])
+                      for row in edges[:sample_size // 2] + edges[-(sample_size // 2):])
+    for (start_label, end_label, edge_type), rows in itertools.groupby(sorted(edge_sample), key=lambda r: r[:3]):
+        found += graph.evaluate(f"""
+        UNWIND $pairs AS pair
+        MATCH (a:{start_label}{{id:pair[0]}})-[:{edge_type}]->(b:{end_label}{{id:pair[1]}})
+        RETURN COUNT(DISTINCT pair)
+        """, pairs=[[r[3], r[4]] for r in rows]) or 0
+    return found, len(node_sample) + len(edge_sample)
+
+
+def writeBaseCSV():
+    """Convert the NAVEX exports (nodes.csv, edges.csv and cpg_edges.csv) into neo4j-admin import files.
+
+    Fields that isFieldNull() treats as missing are written empty, and offlineImport() tells neo4j-admin to skip empty
+    fields, so the imported nodes have the same properties as nodes created through transactions.
+
+    Returns:
+        str: The directory the converted files were written to.
+    """
+    directory = os.path.join(getResultsPath(), BASE_DIRECTORY_NAME)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    nodes = []
+    for row in readCSVbyTab(NODES_CSV_FILE_LOC):
+        if len(row) < 2:
+            continue
+        # NODES_HEADER and ADMIN_NODE_HEADER have the same column order.
+        nodes.append(["" if isFieldNull(v) else v for v in row[:len(ADMIN_NODE_HEADER)]])
+    _to_csv(os.path.join(directory, NODE_FILE_NAME), ADMIN_NODE_HEADER, nodes)
+    _to_csv(os.path.join(directory, EDGE_FILE_NAME), ADMIN_EDGE_HEADER,
+            [row[:3] + ["", "", ""] for row in readCSVbyTab(EDGES_CSV_FILE_LOC) if len(row) >= 3])
+    _to_csv(os.path.join(directory, CPG_EDGE_FILE_NAME), ADMIN_CPG_EDGE_HEADER,
+            [(row + [""] * len(ADMIN_CPG_EDGE_HEADER))[:len(ADMIN_CPG_EDGE_HEADER)]
+             for row in readCSVbyTab(CPG_EDGES_CSV_FILE_LOC)
+             if len(row) >= 3])
+    return directory
+
+
+def offlineImport(database: str = NEO4J_DATABASE, include_base: bool = True, up_to_step: Optional[int] = None) -> bool:
+    """Build a fresh database from CSV files with the offline `neo4j-admin import` tool.
+
+    The database server must be stopped (or the database offline) while this runs, and any existing data in the
+    database is overwritten. Transactional writes are skipped entirely, which is much faster for large graphs.
+
+    Args:
+        database (str, optional): Name of the database to (re)create. Defaults to NEO4J_DATABASE.
+        include_base (bool, optional): Convert and include the NAVEX exports. Defaults to True.
+        up_to_step (Optional[int], optional): Only include step directories before this step. Defaults to all.
+
+    Returns:
+        bool: Whether the import succeeded.
+    """
+    node_files: List[str] = []
+    edge_files: List[str] = []
+
+    directories = []
+    if include_base:
+        base = writeBaseCSV()
+        directories.append(base)
+        edge_files.append(os.path.join(base, CPG_EDGE_FILE_NAME))
+    step = 0
+    while os.path.exists(getStepDirectory(step)) and (up_to_step is None or step < up_to_step):
+        directories.append(getStepDirectory(step))
+        step += 1
+
+    for directory in directories:
+        for name in (NODE_FILE_NAME, HTML_NODE_FILE_NAME, SQL_NODE_FILE_NAME):
+            if os.path.isfile(os.path.join(directory, name)):
+                node_files.append(os.path.join(directory, name))
+        if os.path.isfile(os.path.join(directory, EDGE_FILE_NAME)):
+            edge_files.append(os.path.join(directory, EDGE_FILE_NAME))
+
+    neo4j_admin = os.path.join(NEO4J_HOME, "bin", "neo4j-admin") if NEO4J_HOME else "neo4j-admin"
+    command = [
+        neo4j_admin,
+        "import",
+        f"--database={database}",
+        "--force",
+        "--id-type=INTEGER",
+        "--multiline-fields=true",
+        # Missing properties are written as empty fields; create no property for them, like isFieldNull() does.
+        "--ignore-empty-strings=true",
+        f"--array-delimiter={ADMIN_ARRAY_DELIMITER}",
+        *[f"--nodes={f}" for f in node_files],
+        *[f"--relationships={f}" for f in edge_files],
+    ]
+    print(f"Running offline import of {len(node_files)} node files and {len(edge_files)} edge files into {database}")
+    try:
+        result = subprocess.run(command, capture_output=True, text=True)
+    except FileNotFoundError:
+        print(f"Offline import failed: could not find {neo4j_admin}. Set NEO4J_HOME.")
+        return False
+    if result.returncode != 0:
+        print("Offline import failed:")
+        print(result.stdout)
+        print(result.stderr)
+        return False
+    clearNodeCache()
+    return True
+
+
+def offlineLoadBaseGraph(database: str = NEO4J_DATABASE, timeout: float = OFFLINE_IMPORT_START_TIMEOUT) -> bool:
+    """Replace the database with the NAVEX exports through offlineImport(), stopping Neo4j around the import.
+
+    This is what OFFLINE_IMPORT runs before preprocessing. The server is controlled with $NEO4J_HOME/bin/neo4j.
+
+    Args:
+        database (str, optional): Name of the database to rebuild. Defaults to NEO4J_DATABASE.
+        timeout (float, optional): Seconds to wait for the restarted server to answer queries.
+
+    Returns:
+        bool: Whether the graph was imported and the server is answering again.
+    """
+    neo4j = os.path.join(NEO4J_HOME, "bin", "neo4j") if NEO4J_HOME else "neo4j"
+    try:
+        subprocess.run([neo4j, "stop"], capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Offline import failed: could not stop Neo4j with {neo4j} ({e}). Set NEO4J_HOME.")
+        return False
+    imported = offlineImport(database, include_base=True, up_to_step=0)
+    try:
+        subprocess.run([neo4j, "start"], capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Could not start Neo4j with {neo4j} after the offline import ({e}).")
+        return False
+    deadline = time.time() + timeout
+    while True:
+        try:
+            getGraph().evaluate("RETURN 1")
+            break
+        except Exception as e:
+            if time.time() > deadline:
+                print(f"Neo4j did not come back within {timeout:.0f}s after the offline import ({e}).")
+                return False
+            time.sleep(1)
+    invalidateMemoryGraph()
+    invalidateReachabilityIndex()
+    invalidateCallNameIndex()
+    clearValueResolverCache()
+    return imported
 
 
 def getStepDirectory(step):
     stepname = f"step{step}"
-    directory = os.path.join(RESULTS_PATH, stepname)
+    directory = os.path.join(getResultsPath(), stepname)
     return directory
 
 
@@ -273,11 +633,24 @@ def neo4j_escape(s: str) -> str:
 
 
 def commit(read=False):
+    """Flush the buffered nodes and edges of the current step and move on to the next step.
+
+    Args:
+        read (bool, optional): Import the step from its previously written files instead of the buffers.
+    """
+    # Any in-memory copy of the graph is stale once this commit is written to Neo4j.
+    invalidateMemoryGraph()
+    invalidateReachabilityIndex()
+    invalidateCallNameIndex()
+    clearValueResolverCache()
     if read:
         importToNeo4j(True)
-    else:
-        # writeToCSV()
-        importToNeo4j(False)
+        return
+
+    # Persist every step so that a later run from the same input can replay it.
+    buffers = _take_buffers()
+    writeToCSV(buffers)
+    importToNeo4j(False, buffers)
 
 
 def incrementStep():
@@ -288,16 +661,12 @@ def incrementStep():
     __step += 1
 
 
-def importToNeo4j(read=False):
-    global __step, NODE_DF, EDGE_DF, HTML_NODE_DF, SQL_NODE_DF
+def importToNeo4j(read=False, buffers=None):
+    global __step
     graph = getGraph()
 
     #determine if the node and edge info should be read from file (previously generated) or from python DF
     if read:
-        # TODO
-        print('READING FROM FILE IS NOT IMPLEMENTED')
-        assert False
-
         global NODE_FILE_NAME, EDGE_FILE_NAME
         directory = getStepDirectory(__step)
 
@@ -306,174 +675,185 @@ def importToNeo4j(read=False):
         html_node_dir = os.path.join(directory, HTML_NODE_FILE_NAME)
         sql_node_dir = os.path.join(directory, SQL_NODE_FILE_NAME)
 
-        node_df = pd.read_csv(nodeDir)
-        edge_df = pd.read_csv(edgeDir)
-        html_node_df = pd.read_csv(html_node_dir)
-        sql_node_df = pd.read_csv(sql_node_dir)
+        node_df = _read_csv(nodeDir)
+        edge_df = _read_csv(edgeDir)
+        html_node_df = _read_csv(html_node_dir)
+        sql_node_df = _read_csv(sql_node_dir)
+        _reserve_replayed(node_df + html_node_df + sql_node_df, edge_df)
+        # Replaying only works on a database that does not have the step yet, e.g. one rebuilt from the NAVEX exports.
+        found, sampled = _count_replayed_in_graph(graph, node_df + html_node_df + sql_node_df, edge_df)
+        if sampled and found == sampled:
+            print(f"Step {__step} from {directory} is already in the graph, not importing it again")
+            incrementStep()
+            return
+        if found:
+            raise RuntimeError(
+                f"Step {__step} from {directory} is partly in the graph ({found} of {sampled} sampled rows). "
+                "Reload the database before resuming preprocessing.")
+        print(f"Replaying step {__step} from {directory}")
     else:
-        node_df = NODE_DF
-        edge_df = EDGE_DF
-        html_node_df = HTML_NODE_DF
-        sql_node_df = SQL_NODE_DF
+        node_df, edge_df, html_node_df, sql_node_df = buffers if buffers else _take_buffers()
 
+    # New edges change the children of their start nodes; new node ids may have been looked up (and missed) before.
+    invalidateNodeCache([int(row['id']) for row in node_df + html_node_df + sql_node_df],
+                        [(int(row['start_id']), row['type']) for row in edge_df])
     importNodeToNeo4j(graph, node_df)
     importHTMLNodeToNeo4j(graph, html_node_df)
     importSQLNodeToNeo4j(graph, sql_node_df)
     importEdgeToNeo4j(graph, edge_df)
+    if not read:
+        _write_checkpoint()
 
-    #clean up the current commit
-    NODE_DF = []
-    EDGE_DF = []
-    HTML_NODE_DF = []
-    SQL_NODE_DF = []
     incrementStep()
 
 
-def importNodeToNeo4j(graph, node_df):
-    count = 1
-    tx = graph.begin()
-
-    for row in node_df:
-        node_info_list = [f"""id: {int(row['id'])}, type: "{neo4j_escape(row['type'])}" """]
-
-        if not isFieldNull(row['flags']):
-            quoted_flags = [f'"{neo4j_escape(f)}"' for f in row['flags']]
-            node_info_list.append(f"""flags: [{", ".join(quoted_flags)}]""")
-        if not isFieldNull(row['lineno']) and int(row['lineno']) >= 0:
-            node_info_list.append(f"""lineno: {row['lineno']}""")
-        if not isFieldNull(row['childnum']) and int(row['childnum']) >= 0:
-            node_info_list.append(f"""childnum: {int(row['childnum'])}""")
-        if not isFieldNull(row['code']):
-            code_clean = neo4j_escape(row['code'])
-            if len(code_clean) > MAX_NODE_CODE_LENGTH:
-                code_clean = code_clean[:MAX_NODE_CODE_LENGTH - 3] + "..."
-            node_info_list.append(f"""code: "{code_clean}" """)
-        if not isFieldNull(row['funcid']):
-            try:
-                node_info_list.append(f"""funcid: {int(row['funcid'])}""")
-            except:
-                pass
-        if not isFieldNull(row['name']):
-            node_info_list.append(f"""name: "{neo4j_escape(row['name'])}" """)
-        if not isFieldNull(row['classname']):
-            node_info_list.append(f"""classname: "{neo4j_escape(row['classname'])}" """)
-        if not isFieldNull(row['namespace']):
-            node_info_list.append(f"""namespace: "{neo4j_escape(row['namespace'])}" """)
-        if not isFieldNull(row['endlineno']):
-            node_info_list.append(f"""endlineno: {row['endlineno']}""")
-        if not isFieldNull(row['doccomment']):
-            node_info_list.append(f"""doccomment: "{neo4j_escape(row['doccomment'])}" """)
-        node_info_str = ", ".join([s.strip() for s in node_info_list])
-
-        # Now insert node at newly open spot.
-        query = f"""
-        CREATE (:{row['label']}{{{node_info_str}}})
-        """
-        tx.run(query)
+def _truncate_code(code) -> str:
+    code = str(code)
+    if len(code) > MAX_NODE_CODE_LENGTH:
+        code = code[:MAX_NODE_CODE_LENGTH - 3] + "..."
+    return code
 
-        if count % 1000 == 0 or count == len(node_df):
-            print(str(count) + " Nodes Created")
-            graph.commit(tx)
-            tx = graph.begin()
-        count += 1
 
+def _node_properties(row) -> Dict:
+    """Convert a buffered NODE_DF row into the typed property map of the node to create."""
+    properties = {"id": int(row['id']), "type": str(row['type'])}
 
-def importHTMLNodeToNeo4j(graph, html_node_df):
-    count = 1
-    tx = graph.begin()
-    for row in html_node_df:
-        node_info_list = [
-            f"""id: {int(row['id'])}, type: "{neo4j_escape(row['type'])}", childnum: {int(row['childnum'])}"""
-        ]
-        if not isFieldNull(row['startIndex']):
-            node_info_list.append(f"""startIndex: {int(row['startIndex'])}""")
-        if not isFieldNull(row['endIndex']):
-            node_info_list.append(f"""endIndex: {int(row['endIndex'])}""")
-        if not isFieldNull(row['code']):
-            code_clean = neo4j_escape(row['code'])
-            if len(code_clean) > MAX_NODE_CODE_LENGTH:
-                code_clean = code_clean[:MAX_NODE_CODE_LENGTH - 3] + "..."
-            node_info_list.append(f"""code: "{code_clean}" """)
-        if not isFieldNull(row['name']):
-            node_info_list.append(f"""name: "{neo4j_escape(row['name'])}" """)
-        node_info_str = ", ".join([s.strip() for s in node_info_list])
-
-        # Now insert node at newly open spot.
+    if not isFieldNull(row['flags']):
+        properties["flags"] = [str(f) for f in row['flags']]
+    if not isFieldNull(row['lineno']) and int(row['lineno']) >= 0:
+        properties["lineno"] = int(row['lineno'])
+    if not isFieldNull(row['childnum']) and int(row['childnum']) >= 0:
+        properties["childnum"] = int(row['childnum'])
+    if not isFieldNull(row['code']):
+        properties["code"] = _truncate_code(row['code'])
+    if not isFieldNull(row['funcid']):
+        try:
+            properties["funcid"] = int(row['funcid'])
+        except:
+            pass
+    if not isFieldNull(row['name']):
+        properties["name"] = str(row['name'])
+    if not isFieldNull(row['classname']):
+        properties["classname"] = str(row['classname'])
+    if not isFieldNull(row['namespace']):
+        properties["namespace"] = str(row['namespace'])
+    if not isFieldNull(row['endlineno']):
+        properties["endlineno"] = int(row['endlineno'])
+    if not isFieldNull(row['doccomment']):
+        properties["doccomment"] = str(row['doccomment'])
+    return properties
+
+
+def _html_node_properties(row) -> Dict:
+    """Convert a buffered HTML_NODE_DF row into the typed property map of the node to create."""
+    properties = {"id": int(row['id']), "type": str(row['type']), "childnum": int(row['childnum'])}
+
+    if not isFieldNull(row['startIndex']):
+        properties["startIndex"] = int(row['startIndex'])
+    if not isFieldNull(row['endIndex']):
+        properties["endIndex"] = int(row['endIndex'])
+    if not isFieldNull(row['code']):
+        properties["code"] = _truncate_code(row['code'])
+    if not isFieldNull(row['name']):
+        properties["name"] = str(row['name'])
+    return properties
+
+
+def _sql_node_properties(row) -> Dict:
+    """Convert a buffered SQL_NODE_DF row into the typed property map of the node to create."""
+    properties = {
+        "id": int(row['id']),
+        "type": str(row['type']),
+        "childnum": int(row['childnum']),
+        "table": str(row['table']),
+    }
+
+    if row['columns'] is not None:
+        convertedStr = str(row['columns'])
+        convertedLst = convertedStr.strip('][').split(', ')
+        convertedLst = [f.strip("'") for f in convertedLst]
+        convertedLst = [f.strip('"') for f in convertedLst]
+        properties["columns"] = convertedLst
+    if not isFieldNull(row['lineno']) and int(row['lineno']) >= 0:
+        properties["lineno"] = int(row['lineno'])
+    if not isFieldNull(row['code']):
+        properties["code"] = _truncate_code(row['code'])
+    return properties
+
+
+def _importNodesByLabel(graph, rows, to_properties, description: str):
+    """Create nodes with one parameterized UNWIND query per label and batch.
+
+    The query text only depends on the label, so Neo4j can reuse its plan across batches and commits.
+
+    Args:
+        graph: The graph to import into.
+        rows: Buffered node rows; each must have a 'label' key.
+        to_properties: Function converting a row into the node's property map.
+        description (str): Node kind used in the progress output.
+    """
+    by_label: Dict[str, List[Dict]] = dict()
+    for row in rows:
+        by_label.setdefault(row['label'], []).append(to_properties(row))
+
+    count = 0
+    for label, properties in by_label.items():
         query = f"""
-        CREATE (:{row['label']}{{{node_info_str}}})
+        UNWIND $rows AS row
+        CREATE (n:{label})
+        SET n = row
         """
-        tx.run(query)
-
-        if count % 1000 == 0 or count == len(html_node_df):
-            print(str(count) + " HTML Nodes Created")
-            graph.commit(tx)
+        for i in range(0, len(properties), IMPORT_BATCH_SIZE):
+            batch = properties[i:i + IMPORT_BATCH_SIZE]
             tx = graph.begin()
-        count += 1
+            tx.run(query, rows=batch)
+            graph.commit(tx)
+            count += len(batch)
+            print(f"{count} {description}Nodes Created")
 
 
-def importSQLNodeToNeo4j(graph, sql_node_df):
-    count = 1
-    tx = graph.begin()
-    for row in sql_node_df:
-        node_info_list = [
-            f"""id: {int(row['id'])}, type: "{neo4j_escape(row['type'])}", childnum: {int(row['childnum'])}, table: "{neo4j_escape(row['table'])}" """
-        ]
-        if row['columns'] is not None:
-            convertedStr = str(row['columns'])
-            convertedLst = convertedStr.strip('][').split(', ')
-            convertedLst = [f.strip("'") for f in convertedLst]
-            convertedLst = [f.strip('"') for f in convertedLst]
-            quoted_columns = [f'"{neo4j_escape(f)}"' for f in convertedLst]
-            node_info_list.append(f"""columns: [{", ".join(quoted_columns)}]""")
-        if not isFieldNull(row['lineno']) and int(row['lineno']) >= 0:
-            node_info_list.append(f"""lineno: {row['lineno']}""")
-        if not isFieldNull(row['childnum']) and int(row['childnum']) >= 0:
-            node_info_list.append(f"""childnum: {int(row['childnum'])}""")
-        if not isFieldNull(row['code']):
-            code_clean = neo4j_escape(row['code'])
-            if len(code_clean) > MAX_NODE_CODE_LENGTH:
-                code_clean = code_clean[:MAX_NODE_CODE_LENGTH - 3] + "..."
-            node_info_list.append(f"""code: "{code_clean}" """)
-
-        node_info_str = ", ".join([s.strip() for s in node_info_list])
-
-        # Now insert node at newly open spot.
-        query = f"""
-        CREATE (:{row['label']}{{{node_info_str}}})
-        """
-        tx.run(query)
+def importNodeToNeo4j(graph, node_df):
+    _importNodesByLabel(graph, node_df, _node_properties, "")
 
-        if count % 1000 == 0 or count == len(sql_node_df):
-            print(str(count) + " SQL Nodes Created")
-            graph.commit(tx)
-            tx = graph.begin()
-        count += 1
+
+def importHTMLNodeToNeo4j(graph, html_node_df):
+    _importNodesByLabel(graph, html_node_df, _html_node_properties, "HTML ")
+
+
+def importSQLNodeToNeo4j(graph, sql_node_df):
+    _importNodesByLabel(graph, sql_node_df, _sql_node_properties, "SQL ")
 
 
 def _grouper(k):
     return k['start_label'], k['end_label'], k['type']
 
 
+def _edge_properties(row) -> Dict:
+    """Properties recorded for an edge by addEdge/addEdgeBulk; empty values are dropped."""
+    var = row.get('var', None)
+    if isFieldNull(var):
+        return {}
+    return {"var": var}
+
+
 def importEdgeToNeo4j(graph, edge_df):
-    for name, group in groupby(edge_df, _grouper):
-        data = []
-        count = 1
-
-        group = list(group)
-        for row in group:
-            data.append(((row['start_id']), {}, (row['end_id'])))
-            if count % 1000 == 0 or count == len(group):
-                #print(row)
-                #print(data)
-                #print(name)
-                print(str(count) + f" {name[2]} edges created")
-                create_relationships(graph.auto(),
-                                     data,
-                                     name[2],
-                                     start_node_key=(name[0], 'id'),
-                                     end_node_key=(name[1], 'id'))
-                data = []
-            count += 1
+    # Group every edge of a (start label, end label, type) key together regardless of the order they were added in, so
+    # each key is sent in as few create_relationships calls as possible.
+    groups: Dict[tuple, List] = dict()
+    for row in edge_df:
+        groups.setdefault(_grouper(row), []).append((row['start_id'], _edge_properties(row), row['end_id']))
+
+    for name, data in groups.items():
+        start = time.perf_counter()
+        for i in range(0, len(data), IMPORT_BATCH_SIZE):
+            create_relationships(graph.auto(),
+                                 data[i:i + IMPORT_BATCH_SIZE],
+                                 name[2],
+                                 start_node_key=(name[0], 'id'),
+                                 end_node_key=(name[1], 'id'))
+        elapsed = time.perf_counter() - start
+        rate = len(data) / elapsed if elapsed > 0 else float("inf")
+        print(f"{len(data)} {name[2]} edges created ({name[0]} -> {name[1]}) in {elapsed:.2f}s, {rate:.0f} edges/s")
 
     print(f"{len(edge_df)} edges imported to Neo4j")
 
@@ -1,14 +1,11 @@
 from dataclasses import dataclass
-from distutils.command import check
 from functools import partial
 from re import T
 from typing import Dict, Iterable, List, Set, Tuple
-from js2py import require
-
-from numpy import isin
 
 #from DataFlows import DataNode
-from Detectors.Runtime import SECURITY_DETECTOR_MANAGER,PLUGIN_NAME
+from Args import getArgs
+from Detectors.Runtime import getSecurityDetectorManager
 from Detectors.Scores import ScoreType
 from Errors import DetectorManagerUninitializedException
 from PersonalData import PersonalDataMatcher
@@ -18,7 +15,6 @@ from AdminAccessChecker import isNodeAdmin
 from PathAnalyzerHelper import *
 from ActionHook import checkWPDataDeletionHook,checkWPDataAccessHook,getInvokedFnID,getWPExportedData
 from DataFlowTracking import allTraversalType,hasDataflowPath
-import pandas as pd
 from Detectors.Utils import get_node_filename
 from DataFlows import DataFlowPath
 from ControlFlowTracking import ControlFlowTracking
@@ -101,8 +97,8 @@ def find_api_calls() -> Set[str]:
             Set[str]: Set of URLs called.
     """
     urls: Set[str] = set()
-    if SECURITY_DETECTOR_MANAGER:
-        for finding in SECURITY_DETECTOR_MANAGER.allFindings:
+    if getSecurityDetectorManager():
+        for finding in getSecurityDetectorManager().allFindings:
             score = finding.score
             if score.score_type == ScoreType.API:
                 url = score.categories.get("url", "")
@@ -256,7 +252,7 @@ class PathAnalyzer:
         pii_types = set()
         ffs = [
             f
-            for f in SECURITY_DETECTOR_MANAGER.allFindings
+            for f in getSecurityDetectorManager().allFindings
             if ScoreType.API == f.score.score_type
         ]
         
@@ -331,7 +327,7 @@ class PathAnalyzer:
         #search for storage nodes and check encryption. Note that storage nodes contain database storage and api nodes.
         ffs = [
             f
-            for f in SECURITY_DETECTOR_MANAGER.allFindings
+            for f in getSecurityDetectorManager().allFindings
             if f.score.is_storage()
         ]
        
@@ -476,7 +472,7 @@ class PathAnalyzer:
         """
         log = partial(self.report_log, "Art.17, Right to erasure")
         access_level = {self.HAS_DELETION_NONE_BUT_NOT_REQUIRED}
-        if not SECURITY_DETECTOR_MANAGER:
+        if not getSecurityDetectorManager():
             raise DetectorManagerUninitializedException()
 
 
@@ -782,7 +778,7 @@ class PathAnalyzer:
         """
         log = partial(self.report_log, "Art.15, Right to access")
         access_level = {self.HAS_ACCESS_NONE_BUT_NOT_REQUIRED}
-        if not SECURITY_DETECTOR_MANAGER:
+        if not getSecurityDetectorManager():
             raise DetectorManagerUninitializedException()
         has_custom = False
         wp_access_hook = checkWPDataAccessHook()
@@ -968,7 +964,7 @@ class PathAnalyzer:
         """
         ffs = [
             f
-            for f in SECURITY_DETECTOR_MANAGER.allFindings
+            for f in getSecurityDetectorManager().allFindings
             if f.score.is_input() and f.score.is_personal()
         ]
         if ffs:
@@ -982,7 +978,7 @@ class PathAnalyzer:
         """
         ffs = [
             f
-            for f in SECURITY_DETECTOR_MANAGER.allFindings
+            for f in getSecurityDetectorManager().allFindings
             if f.score.is_retrieval() and f.score.is_personal()
         ]
         if ffs:
@@ -1010,12 +1006,12 @@ class PathAnalyzer:
         #need to remove findings that are part of deletion detector
         deletionID = [
             f.node["id"]
-            for f in SECURITY_DETECTOR_MANAGER.allFindings
+            for f in getSecurityDetectorManager().allFindings
             if ScoreType.DELETION == f.score.score_type
         ]
         ffs = [
             f
-            for f in SECURITY_DETECTOR_MANAGER.allFindings
+            for f in getSecurityDetectorManager().allFindings
             if f.score.is_storage() and not (ScoreType.API == f.score.score_type or f.node["id"] in deletionID)
         ]
         for finding in ffs:
@@ -1156,6 +1152,7 @@ class FixReport:
         """
 
         handbook_url = "https://developer.wordpress.org/plugins/privacy/adding-the-personal-data-eraser-to-your-plugin/"
+        PLUGIN_NAME = getArgs().plugin_name
 
         filter = f"""
 add_filter( 'wp_privacy_personal_data_erasers', '{PLUGIN_NAME}_register_privacy_erasers' );
@@ -1252,6 +1249,7 @@ is based on guidelines provided by Wordpress. Refer to {handbook_url} for more d
 
         """
         handbook_url = 'https://developer.wordpress.org/plugins/privacy/adding-the-personal-data-exporter-to-your-plugin/'
+        PLUGIN_NAME = getArgs().plugin_name
 
         filter = f"""
 add_filter( 'wp_privacy_personal_data_exporters', '{PLUGIN_NAME}_register_user_data_exporter' );
@@ -1365,6 +1363,7 @@ is based on guidelines provided by Wordpress. Refer to {handbook_url} for more d
 
         """
         handbook_url = 'https://developer.wordpress.org/plugins/privacy/suggesting-text-for-the-site-privacy-policy/'
+        PLUGIN_NAME = getArgs().plugin_name
 
         function = f"""
 /**
@@ -6,10 +6,9 @@
 
 from NeoHelper import ASTMethodGetParameterList
 from NeoGraph import getGraph
-from Detectors.Runtime import PLUGIN_NAME,SECURITY_DETECTOR_MANAGER
+from Detectors.Runtime import getSecurityDetectorManager
 from Detectors.Scores import ScoreType
 from typing import List
-import pandas as pd
 from Settings import *
 
 from Detectors.FunctionFinding import FunctionFinding
@@ -29,11 +28,11 @@ def getTableCreationFindings():
     """Finds all table creation findings
     Returns: a list of findings that are table creation
     """
-    if not SECURITY_DETECTOR_MANAGER:
+    if not getSecurityDetectorManager():
         return []
     ffs = [
         f
-        for f in SECURITY_DETECTOR_MANAGER.allFindings
+        for f in getSecurityDetectorManager().allFindings
         if f.score.score_type == ScoreType.DATABASE
     ]
     findings = []
@@ -47,11 +46,11 @@ def getTableDeletionFindings():
     """Finds all table creation findings
     Returns: a list of findings that are table creation
     """
-    if not SECURITY_DETECTOR_MANAGER:
+    if not getSecurityDetectorManager():
         return []
     ffs = [
         f
-        for f in SECURITY_DETECTOR_MANAGER.allFindings
+        for f in getSecurityDetectorManager().allFindings
         if f.score.score_type == ScoreType.DATABASE
     ]
     findings = []
@@ -66,11 +65,11 @@ def getPersonalDataStorageFindings():
     Returns: a list of tuples in the form of (finding, personalTypes), where finding is a Detector finding and personalTypes a list of personal data types.
     """
     #returns a list of tuples
-    if not SECURITY_DETECTOR_MANAGER:
+    if not getSecurityDetectorManager():
         return []
     ffs = [
         f
-        for f in SECURITY_DETECTOR_MANAGER.allFindings
+        for f in getSecurityDetectorManager().allFindings
         if f.score.is_storage()
     ]
     sensitive_storage_findings = []
@@ -143,11 +142,11 @@ def findRetrievalOfTable(tableName:str):
     """
     Find data access of a database table
     """
-    if not SECURITY_DETECTOR_MANAGER:
+    if not getSecurityDetectorManager():
         return (None,None)
     ffs = [
         f
-        for f in SECURITY_DETECTOR_MANAGER.allFindings
+        for f in getSecurityDetectorManager().allFindings
         if f.score.is_database() and f.score.categories.get("table_name", None)==tableName and f.score.categories.get("operations",None)=='select'
     ]
     return ffs
@@ -157,9 +156,9 @@ def findDeletionOfTable(tableName:str):
     """
     Find data deletion of a database table
     """
-    if not SECURITY_DETECTOR_MANAGER:
+    if not getSecurityDetectorManager():
         return (None,None)
-    deletion_detector = SECURITY_DETECTOR_MANAGER.get_detector("DeletionDetector")
+    deletion_detector = getSecurityDetectorManager().get_detector("DeletionDetector")
     hasDeletionOfRecord = []
     hasDropOfTable = []
     if deletion_detector:
@@ -188,7 +187,7 @@ def findDeletionOfWPFn(finding:FunctionFinding):
     #finding corresponding deletion funciton for a given finding of a Wordpress storage method.
     deletionFindings = []
     if finding:
-        deletion_detector = SECURITY_DETECTOR_MANAGER.get_detector("DeletionDetector")
+        deletion_detector = getSecurityDetectorManager().get_detector("DeletionDetector")
         keyValue = finding.keyValue
         data_type = finding.function_annotation.data_type
         #try to find another call with the same data type and same keyValue (if present)
@@ -340,6 +339,8 @@ def analyze_privacy_policy():
     if not os.path.exists(analysis_result_path):
         return (2,None)
     
+    import pandas as pd
+
     df = pd.read_csv(analysis_result_path)
 
     #clean up
@@ -3,12 +3,16 @@
 # Created 201216
 from PersonalData import PersonalDataMatcher
 from concurrent import futures
+import functools
+import hashlib
+import inspect
 from grp import getgrall
 from os import name, setuid
 import sys
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, Dict, List, Set, Tuple, Union
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+import threading
 
 from preprocessing.Pipeline import Pipeline
 from preprocessing.filesystem.FileSystemPreprocessor import FileSystemPreprocessor
@@ -21,17 +25,32 @@ from visualize.Dotifier import Dotifier
 
 # NB: Detectors detect node of interests. A node of interest is not necessarily a violation right away.
 from Detectors.Detectors import AbstractDetector
-from Detectors.Runtime import DATABASE_DIR, PLUGIN_NAME, SECURITY_DETECTOR_MANAGER, PLUGIN_DIR
+from Args import getArgs
+from Detectors.Runtime import getSecurityDetectorManager
 from HTMLParser import HTMLNode, PhpHtmlParser
 from NeoHelper import *
 from Results import register_plugin, write_source_sink
-from Settings import USEFUL_NODES
+from Settings import (
+    IMPORT_BATCH_SIZE,
+    OFFLINE_IMPORT,
+    PREPROCESS_RESUME,
+    PREPROCESS_STEP_VERSION,
+    PREPROCESS_WORKERS,
+    SET_BASED_CALL_EDGES,
+    USEFUL_NODES,
+)
 from SourcesSinks import SourceSinkManager
+from TaintPropagation import BitSet, TaintGraph
 from Utls import progress_bar
 from ClassStructure import getClassHierarchy, determineObjectType
 from ValueResolver import evaluateExpression, evaluateExpressionUnjoined
-from SQLParser import SQLToAST1, getSQLParentNodes
-from DataFlowTracking import allTraversalTypeAPOC
+from SQLParser import SQLToAST1, debug_sql_parse_cache_info, getSQLParentNodes
+from DataFlowTracking import RELATIONSHIP_TYPES
+from MemoryGraph import loadMemoryGraph
+from NodeEdgeManager import offlineLoadBaseGraph
+from ValueCache import setCacheFingerprint
+from ReachabilityIndex import buildReachabilityIndex
+from StageMetrics import stage
 from ActionHook import getHookedFnToWPAJAX
 from jQuerySelectorParser import getSelectedHTMLFormInputs
 
@@ -59,6 +78,7 @@ __OPTIONS = {
 }
 
 _step_counter: int = 0
+_step_counter_lock = threading.Lock()
 
 _IDs_with_preprocessed_edges = set()
 _ID_pairs_with_preprocessed_edges = set()
@@ -70,10 +90,13 @@ def _preprocess_step(step_name: str):
 
     def _inner(function):
 
+        @functools.wraps(function)
         def _wrapper(*args, **kwargs):
             global _step_counter
-            _step_counter += 1
-            print(f"""╔[{_step_counter}] Preprocessing step "{step_name}" ({function.__name__}) begin.""")
+            with _step_counter_lock:
+                _step_counter += 1
+                step_number = _step_counter
+            print(f"""╔[{step_number}] Preprocessing step "{step_name}" ({function.__name__}) begin.""")
             start = datetime.now()
             try:
                 result = function(*args, **kwargs)
@@ -84,7 +107,7 @@ def _preprocess_step(step_name: str):
                 raise e
             delta = datetime.now() - start
             print(
-                f"""╚[{_step_counter}] Preprocessing step "{step_name}" ({function.__name__}) finished successfully in {delta}.\n"""
+                f"""╚[{step_number}] Preprocessing step "{step_name}" ({function.__name__}) finished successfully in {delta}.\n"""
             )
             return result
 
@@ -93,19 +116,99 @@ def _preprocess_step(step_name: str):
     return _inner
 
 
+def _task_access(reads: Iterable[str] = (), writes: Iterable[str] = (), thread_safe: bool = True):
+    """Declare what a preprocessing task reads from and writes to the graph, so it can be scheduled with other tasks.
+
+    Reads and writes are node labels and edge types. Only changes made directly in Neo4j count as writes: nodes and
+    edges added through NodeEdgeManager are buffered until the step's commit(), so tasks of the same step never see
+    each other's buffered output. Tasks without a declaration are assumed to conflict with every other task.
+
+    Args:
+        reads (Iterable[str], optional): Labels and edge types the task queries.
+        writes (Iterable[str], optional): Labels and edge types the task changes directly in Neo4j.
+        thread_safe (bool, optional): False if the task has to run on the main thread (e.g. it relies on SIGALRM).
+    """
+
+    def _inner(function):
+        function.reads = frozenset(reads)
+        function.writes = frozenset(writes)
+        function.thread_safe = thread_safe
+        return function
+
+    return _inner
+
+
+def _tasks_conflict(a, b) -> bool:
+    if not hasattr(a, "writes") or not hasattr(b, "writes"):
+        return True
+    return bool(a.writes & (b.reads | b.writes)) or bool(b.writes & a.reads)
+
+
+def _run_step_tasks(tasks: List, workers: int = PREPROCESS_WORKERS):
+    """Run the tasks of one preprocessing step, concurrently where their declared accesses allow it.
+
+    A task starts once every earlier task in the list that it conflicts with has finished, so running with one worker
+    (or with no declarations) is the same as running the tasks in order. Tasks that are not thread safe run on the
+    calling thread. The graph connection is shared; py2neo hands each concurrent query its own pooled connection.
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            task()
+        return
+
+    dependencies = [{j for j in range(i) if _tasks_conflict(tasks[i], tasks[j])} for i in range(len(tasks))]
+    pending = list(range(len(tasks)))
+    finished: Set[int] = set()
+    running: Dict[futures.Future, int] = dict()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            ready = [i for i in pending if dependencies[i] <= finished]
+            for i in ready:
+                if getattr(tasks[i], "thread_safe", False):
+                    pending.remove(i)
+                    running[executor.submit(tasks[i])] = i
+            main_thread = [i for i in ready if i in pending]
+            if main_thread:
+                i = main_thread[0]
+                pending.remove(i)
+                tasks[i]()
+                finished.add(i)
+                continue
+            if not running:
+                continue
+            done, _ = futures.wait(running.keys(), return_when=futures.FIRST_COMPLETED)
+            for f in done:
+                f.result()
+                finished.add(running.pop(f))
+
+
+def _step_tag(tasks: List) -> str:
+    """Hash the source code of a step's tasks, so a step is not replayed from files that older code wrote.
+
+    Only the tasks themselves are hashed; bump PREPROCESS_STEP_VERSION when code they call changes what they write.
+    """
+    sha = hashlib.sha256(PREPROCESS_STEP_VERSION.encode())
+    for task in tasks:
+        function = inspect.unwrap(task)
+        try:
+            sha.update(inspect.getsource(function).encode())
+        except (OSError, TypeError):
+            sha.update(function.__qualname__.encode())
+    return sha.hexdigest()
+
+
 def preprocess_graph(only_encryption: bool = False, skip_preprocessing=False):
     """Run commands that finalize the AST in Neo4j.
 
     This includes operations like adding the parent-to-self edges, converting SQL into ASTs, and also converting HTML to ASTs.
     """
-    global SECURITY_DETECTOR_MANAGER
     if only_encryption:
         __OPTIONS["skip_sql"] = True
 
     print("### Starting preproccessing!")
 
     print("Registering plugin to plugin database... ", end="")
-    register_plugin(DATABASE_DIR, PLUGIN_NAME)
+    register_plugin(getArgs().database_dir, getArgs().plugin_name)
     print("Plugin registration done")
 
     #This part is merged to the SECURITY_DETECTOR_MANAGER's constructor
@@ -116,11 +219,23 @@ def preprocess_graph(only_encryption: bool = False, skip_preprocessing=False):
         # node_count = getGraph().evaluate("""MATCH (n) WHERE EXISTS(n.preprocessed) RETURN COUNT(n)""")
         # if node_count or skip_preprocessing:
         print("SKIPPING ALL OF PREPROCESSING")
-        if not SECURITY_DETECTOR_MANAGER:
+        if not getSecurityDetectorManager():
             sys.exit(1)
-        SECURITY_DETECTOR_MANAGER.run()
+        inputHash = computeInputHash()
+        setInputHash(inputHash)
+        # Without the NAVEX exports the hash only summarizes the preprocessed graph, and the value cache stays disabled.
+        setCacheFingerprint(inputHash, computeInputMaxId())
+        loadMemoryGraph()
+        buildReachabilityIndex(RELATIONSHIP_TYPES)
+        getSecurityDetectorManager().run()
         return
 
+    if OFFLINE_IMPORT:
+        # Start from the NAVEX exports rather than whatever the database holds, e.g. an earlier plugin.
+        with stage("offline import"):
+            if not offlineLoadBaseGraph():
+                sys.exit(1)
+
     # Remove old preprocessed nodes.
     # getGraph().run("""MATCH (n) WHERE EXISTS(n.preprocessed) DETACH DELETE n""")
     # getGraph().run("""MATCH ()-[r]->() WHERE EXISTS(r.preprocessed) DELETE r""")
@@ -128,6 +243,12 @@ def preprocess_graph(only_encryption: bool = False, skip_preprocessing=False):
     getGraph().run("""MATCH (s:SINK) REMOVE s:SINK RETURN COUNT(s)""")
     getGraph().run("""MATCH (s:SOURCE) REMOVE s:SOURCE RETURN COUNT(s)""")
 
+    # Every step's nodes and edges are saved along with a hash of the input graph, so later runs can resume from them.
+    # Resolved values are cached on disk under the same hash.
+    inputHash = computeInputHash()
+    setInputHash(inputHash)
+    setCacheFingerprint(inputHash, computeInputMaxId())
+
     preprocess_start = datetime.now()
     #the preprocessing tasks are done in steps. For each steps, the order in which the tasks are completed does not matter. However, each step depends on the previous step/steps to be completed.
     #Note that if the plugin is preprocessed before, some steps can be skipped by just reading from previously generated node/edge files, but some steps are still required,
@@ -136,13 +257,14 @@ def preprocess_graph(only_encryption: bool = False, skip_preprocessing=False):
     pipeline = Pipeline()
     pipeline.register(
         DeletePreprocessor('delete', 'Filesystem'),
-        FileSystemPreprocessor('filesystem', PLUGIN_DIR),
+        FileSystemPreprocessor('filesystem', getArgs().plugin_dir),
         FileSystemToAstPreprocessor('filesystemtoast'),
         HTMLPreprocessor('html'),
         PHPAsHTMLPreprocessor('phphtml'),
         HTMLToJSPreprocessor('htmltojs'),
     )
-    pipeline.trigger(getGraph())
+    with stage("preprocessing pipeline"):
+        pipeline.trigger(getGraph())
 
     stepTasks = [
         ([__label_js_nodes], True),
@@ -151,23 +273,41 @@ def preprocess_graph(only_encryption: bool = False, skip_preprocessing=False):
         ([
             __handle_class_properties, __connect_ASTPARAM_to_var, __php_reach_edges, __parent_self_edges,
             __class_constant_hierarchy, __ast_assign_function_edges, __build_php_js_hierarchical_edges, js_to_wp_ajax
-        ], False),
+        ], True),
         ([__remove_wrong_hierarchical_edges], True),
         ([__iterated_create_call_edges, __html_to_php_reaches, html_form_input_to_jquery_find], False),
-        ([__overtaintFunctionCalls], False),
-        ([__add_sql_ast, __build_html_ast_in_php, __connect_html_php_ast, __do_action_to_function], False),
+        ([__overtaintFunctionCalls], True),
+        ([__add_sql_ast, __build_html_ast_in_php, __connect_html_php_ast, __do_action_to_function], True),
         ([__security_detectors], True),
         ([__storage_to_retrieval, __add_source_sink_to_db], True),
         ([remove_edge_from_key_to_sink], True),
         ([__taint_nodes], True),
     ]
 
-    for step, required in stepTasks:
+    # With PREPROCESS_RESUME, steps that are not required are replayed from their step directory if a previous run
+    # saved them from the same input graph and the same task code. Required steps also change the graph (or in-process
+    # state) in ways that are not captured by the step files, e.g. direct SETs and DELETEs, so they always run. A step
+    # with a task that declares direct writes (see _task_access) is required even if it is not marked as such. Once a
+    # step has to be recomputed, every later step is recomputed as well since its saved output may depend on it.
+    replaying = PREPROCESS_RESUME
+    for index, (step, required) in enumerate(stepTasks):
         print(f'starting step')
-        setUp()
-        for task in step:
-            task()
-        commit()
+        required = required or any(getattr(task, "writes", None) for task in step)
+        with stage(f"step {index}: {', '.join(task.__name__ for task in step)}"):
+            setStepTag(_step_tag(step))
+            setUp()
+            if replaying and not required:
+                if isPreprocessed():
+                    commit(read=True)
+                    continue
+                replaying = False
+            _run_step_tasks(step)
+            commit()
+
+    # The analysis stages after preprocessing only read the graph, so they can use the in-memory copy if enabled.
+    with stage("memory graph and reachability index"):
+        loadMemoryGraph()
+        buildReachabilityIndex(RELATIONSHIP_TYPES)
 
 
 def __fill_class_hierarchy():
@@ -175,6 +315,7 @@ def __fill_class_hierarchy():
     classHierarchy = getClassHierarchy()
 
 
+@_task_access(reads=("AST", "AST_JS", "PARENT_OF"))
 @_preprocess_step(step_name="Connect JS jquery calls to PHP callbacks")
 def js_to_wp_ajax():
     """
@@ -300,20 +441,22 @@ def wp_localize_script_to_js():
     print(f"Added {count} PHP_TO_JS_REACHES edges.")
 
 
+@_task_access(reads=("AST", "PARENT_OF", "CALLS", "PHP_REACHES", "FLOWS_TO", "ENTRY"), thread_safe=False)
 def __iterated_create_call_edges():
-    iteration = 0
-    while True:
-        iteration += 1
-        #set a safe bound in case there's an infinite loop
-        if iteration > 200:
-            break
-        callEdgeCount = __handle_class_hierarchy()
-        functionCallEdgeCount = __function_call_edges()
-        __ast_call_return_edges()
-        if callEdgeCount == 0 and functionCallEdgeCount == 0:
-            break
-
-
+    # Resolving method calls through the class hierarchy is the only part that feeds back into itself (a receiver's
+    # type can come from the return type of another call), so __handle_class_hierarchy runs its own worklist until no
+    # more calls resolve. Argument and return edges are then built once for the calls that already had CALLS edges and
+    # once for the newly resolved ones, which are still buffered and so not visible to queries on CALLS.
+    newCalls = __handle_class_hierarchy()
+    __function_call_edges()
+    __ast_call_return_edges()
+    if newCalls:
+        calls = [{"call": callID, "callee": methodID} for callID, methodIDs in newCalls.items() for methodID in methodIDs]
+        __function_call_edges__set_based(calls)
+        __call_return_edges(calls)
+
+
+@_task_access(reads=("AST_JS", "AST_HTML", "PARENT_OF"))
 @_preprocess_step(step_name="Building edges from HTML form inputs to jquery .find functions")
 def html_form_input_to_jquery_find():
     # find .find() usages and get the selector statement
@@ -350,6 +493,7 @@ def __build_html_ast(graph=None):
     if not graph:
         graph = getGraph()
 
+    PLUGIN_DIR = getArgs().plugin_dir
     listOfFiles = list()
     for (dirpath, _, filenames) in os.walk(PLUGIN_DIR):
         listOfFiles += [
@@ -392,6 +536,7 @@ def __build_html_ast(graph=None):
     print(f'build_html_as_php completed in {delta.total_seconds() * 1000} seconds')
 
 
+@_task_access(reads=("AST", "PARENT_OF", "FLOWS_TO", "PHP_REACHES"))
 @_preprocess_step(step_name="Build HTML AST for HTML embedded in PHP code (HTML to PHP traversal)")
 def __build_html_ast_in_php():
     # find php code 'echo xxx' and parse the echoed HTML code
@@ -417,6 +562,7 @@ def __build_html_ast_in_php():
                 parseHTML(r['x.code'], r['x.id'], True)
 
 
+@_task_access(reads=("AST", "AST_HTML", "PARENT_OF", "FLOWS_TO"))
 @_preprocess_step(step_name="Connect HTML AST and PHP AST trees (PHP to HTML traversal)")
 def __connect_html_php_ast():
     #this function connects inline traversal from PHP to HTML (e.g., <p> <?php echo $foo ?> </p>)
@@ -537,11 +683,13 @@ def help_build_hierarchy_from_root(nodeID):
     return count
 
 
+@_task_access(reads=("AST", "PARENT_OF"), writes=("SOURCE", "SINK"))
 def __add_source_sink_to_db():
     ssm = SourceSinkManager()
     ssm.add_labels_to_database()
 
 
+@_task_access(reads=("AST", "PARENT_OF"))
 @_preprocess_step(step_name="Connect data flows for class constants")
 def __class_constant_hierarchy():
     count = 0
@@ -567,7 +715,7 @@ def __class_constant_hierarchy():
 
 @_preprocess_step(step_name="Label all of the personal data nodes and encrypted nodes")
 def __taint_nodes():
-    if not SECURITY_DETECTOR_MANAGER:
+    if not getSecurityDetectorManager():
         print("security detector not initialized")
         sys.exit(1)
     status = __taint_personal_nodes()
@@ -576,148 +724,85 @@ def __taint_nodes():
     __taint_encrypted_nodes()
 
 
+def __write_taint_labels(label: str, properties: str, rows: List[Dict[str, Any]]):
+    """Set a label and taint properties on nodes with batched UNWIND queries.
+
+    Args:
+        label (str): Label to add to the nodes.
+        properties (str): SET clause for the properties, reading from `row`.
+        rows (List[Dict[str, Any]]): One dictionary per node with its id and the properties.
+    """
+    graph = getGraph()
+    query = f"""
+    UNWIND $rows AS row
+    MATCH (n{{id:row.id}})
+    SET n :{label}
+    SET {properties}
+    """
+    for i in range(0, len(rows), IMPORT_BATCH_SIZE):
+        graph.run(query, rows=rows[i:i + IMPORT_BATCH_SIZE])
+        print(f"Tainted {min(i + IMPORT_BATCH_SIZE, len(rows))} nodes as {label}")
+
+
 def __taint_personal_nodes():
     #taint all nodes that contain PII in the graph
-    graph = getGraph()
-    #dictionary of personal data nodes and their personal data types
-    #key: nodeID of personal data node. value: a set that contains all personal data types
-    allIDs = {}
-    for f in SECURITY_DETECTOR_MANAGER.allFindings:
+    #personal data types and sources are propagated as bitmasks over the condensed data flow graph (see TaintPropagation)
+    seedTypes = {}
+    for f in getSecurityDetectorManager().allFindings:
         if f.score.is_personal():
-            allIDs[f.node['id']] = set(f.score.get_data_types_personal())
-    remainingNodes = list(allIDs.keys())
-    if len(remainingNodes) == 0:
+            seedTypes.setdefault(f.node['id'], set()).update(f.score.get_data_types_personal())
+    if len(seedTypes) == 0:
         return 0
-    allSourceSinkPair = set()
-    allSources = {}
-    #for all source nodes, their sources are themselves.
-    for id in allIDs:
-        allSources[id] = set([id])
-    #print(remainingNodes)
-    #propagate the personal data label, and merge personal data types if two nodes join into a same path.
-    while remainingNodes:
-        newNodes = []
-        for id in progress_bar(remainingNodes):
-            query = f"""
-            MATCH (n{{id:{id}}})
-            CALL apoc.path.subgraphNodes(n, {{
-                relationshipFilter: "{allTraversalTypeAPOC()}"
-            }})
-            YIELD node
-            RETURN node;
-            """
-            result = graph.run(cypher=query).data()
-            #print("Finished query")
-            for i in result:
-                mid = i['node']['id']
-                if not id == mid:
-                    allSourceSinkPair.add((id, mid))
-                    if mid in allSources:
-                        allSources[mid].add(id)
-                    else:
-                        allSources[mid] = set([id])
-                    if mid in allIDs:
-                        previousCopy = len(allIDs[mid])
-                        #update personal data type
-                        allIDs[mid].update(allIDs[id])
-                        if not previousCopy == len(allIDs[mid]):
-                            newNodes.append(mid)
-                    else:
-                        allIDs[mid] = allIDs[id]
-        remainingNodes = newNodes
+    taintGraph = TaintGraph.from_neo4j(seedTypes.keys(), RELATIONSHIP_TYPES)
+    types = BitSet()
+    sources = BitSet(taintGraph.seeds)
+    initial = {id: (types.encode(t), sources.encode([id])) for id, t in seedTypes.items()}
+    allIDs = taintGraph.propagate(initial, lambda a, b: (a[0] | b[0], a[1] | b[1]))
     print("Finished collecting propagation info for personal nodes")
+
+    allSourceSinkPair = set()
+    rows = []
+    for id, (typeMask, sourceMask) in allIDs.items():
+        nodeSources = sources.decode(sourceMask)
+        for source in nodeSources:
+            if not source == id:
+                allSourceSinkPair.add((source, id))
+        rows.append({"id": id, "personal_types": types.decode(typeMask), "sources": nodeSources})
     write_source_sink(list(allSourceSinkPair))
     print("Wrote source sink information to database")
-    #print(allIDs)
     #at this point the data types for the nodes have converged. Now we put personal data label and data type property to the neo4j graph
-    count = 1
-    tx = graph.begin()
-    for id in allIDs:
-
-        query = f"""
-        MATCH (n{{id:{id}}})
-        SET n :PERSONAL
-        SET n.personal_types = {list(allIDs[id])}, n.sources = {list(allSources[id])}
-        """
-
-        tx.run(query)
-        if count % 1000 == 0 or count == len(allIDs):
-            print(f"Tainted {count} nodes as PERSONAL")
-            graph.commit(tx)
-            tx = graph.begin()
-        count += 1
-        # graph.run(cypher=query)
+    __write_taint_labels("PERSONAL", "n.personal_types = row.personal_types, n.sources = row.sources", rows)
     print(f"In total, tainted {len(allIDs)} nodes as PERSONAL")
     return 1
 
 
 def __taint_encrypted_nodes():
-    graph = getGraph()
     #taint cryptography nodes
-    allIDs = {}
-    for f in SECURITY_DETECTOR_MANAGER.allFindings:
+    #a node's encryption score is the minimum of the scores of the encrypted nodes reaching it, its methods the union
+    methods = BitSet()
+    initial = {}
+    for f in getSecurityDetectorManager().allFindings:
         if f.score.score_type == ScoreType.CRYPTOGRAPHY:
-            allIDs[f.node['id']] = [
-                f.score.value,
-                set([f.score.encryption_method if f.score.encryption_method else "generic"])
-            ]
-    remainingNodes = list(allIDs.keys())
-    allSourceSinkPair = set()
-    #print(remainingNodes)
-    #propagate the personal data label, and
-    while remainingNodes:
-        newNodes = []
-        for id in progress_bar(remainingNodes):
-            query = f"""
-            MATCH (n{{id:{id}}})
-            CALL apoc.path.subgraphNodes(n, {{
-                relationshipFilter: "{allTraversalTypeAPOC()}"
-            }})
-            YIELD node
-            RETURN node;
-            """
-            result = graph.run(cypher=query).data()
-            #print("Finished query")
-            for i in result:
-                mid = i['node']['id']
-                if not id == mid:
-                    allSourceSinkPair.add((id, mid))
-                    if mid in allIDs:
-                        previousCopy = len(allIDs[mid])
-                        newEncryptionMethodSet = allIDs[mid][1].copy()
-                        newEncryptionMethodSet.update(allIDs[id][1])
-                        #update encryption info in the new node. If both nodes have encryption score before, use the minimum of the two as the new score.
-                        allIDs[mid] = [min(allIDs[mid][0], allIDs[id][0]), newEncryptionMethodSet]
-                        if not previousCopy == len(allIDs[mid]):
-                            newNodes.append(mid)
-                    else:
-                        allIDs[mid] = allIDs[id]
-        remainingNodes = newNodes
+            value = (f.score.value, methods.encode([f.score.encryption_method if f.score.encryption_method else "generic"]))
+            id = f.node['id']
+            initial[id] = (min(initial[id][0], value[0]), initial[id][1] | value[1]) if id in initial else value
+    if not initial:
+        return
+    taintGraph = TaintGraph.from_neo4j(initial.keys(), RELATIONSHIP_TYPES)
+    allIDs = taintGraph.propagate(initial, lambda a, b: (min(a[0], b[0]), a[1] | b[1]))
     print("Finished collecting propagation info for encrypted nodes")
-    #write_source_sink(list(allSourceSinkPair))
-    #print(allIDs)
     #at this point the encryption method for the nodes have converged. Now we put encryption data label and encryption info to the neo4j graph
-
-    count = 1
-    tx = graph.begin()
-    for id in allIDs:
-
-        query = f"""
-        MATCH (n{{id:{id}}})
-        SET n :SECURE
-        SET n.encryption_score = {allIDs[id][0]}, n.encryption_method = {list(allIDs[id][1])}
-        """
-        #print(query)
-        tx.run(query)
-        if count % 1000 == 0 or count == len(allIDs):
-            print(f"Tainted {count} nodes as ENCRYPTED")
-            graph.commit(tx)
-            tx = graph.begin()
-        count += 1
-        # graph.run(cypher=query)
+    rows = [{
+        "id": id,
+        "encryption_score": score,
+        "encryption_method": methods.decode(methodMask)
+    } for id, (score, methodMask) in allIDs.items()]
+    __write_taint_labels("SECURE", "n.encryption_score = row.encryption_score, n.encryption_method = row.encryption_method",
+                         rows)
     print(f"In total, tainted {len(allIDs)} nodes as ENCRYPTED")
 
 
+@_task_access(reads=("AST", "PARENT_OF", "PHP_REACHES"))
 @_preprocess_step(step_name="connect data flows for class properties")
 def __handle_class_properties():
     global classHierarchy
@@ -771,12 +856,19 @@ def __handle_class_properties():
 
 
 @_preprocess_step(step_name="Handle class hierarchy and make CALLS edges and certain data flows")
-def __handle_class_hierarchy():
+def __handle_class_hierarchy() -> Dict[int, List[int]]:
     """
     This function does the following:
         1. connects CALLS edges for certain function calls through objects (it handles cases where objects are of class that implements certain interface)
         2. connects dataflows from class variables to its usage
     Prereq: This call must be run after __php_reach_edges()
+
+    Calls are resolved with a worklist. A receiver's type can depend on the CALLS edges of other calls in the same
+    function (e.g. $a = $b->get(); $a->run();), so when a round resolves calls, the unresolved calls of those
+    functions are tried again in the next round, with the new edges passed to determineObjectType.
+
+    Returns:
+        Dict[int, List[int]]: The newly resolved method calls, mapped to the ids of the methods they call.
     """
     global classHierarchy
     # classHierarchy = ClassHierarchy()
@@ -791,26 +883,48 @@ def __handle_class_hierarchy():
     objectCallQuery = f"""
     MATCH (methodName:AST{{childnum:1}})<-[:PARENT_OF]-(n:AST{{type:'AST_METHOD_CALL'}})-[:PARENT_OF]->(m:AST{{childnum:0}})
     WHERE NOT (n)-[:CALLS]->()
-    RETURN m,methodName.code,n.id
+    RETURN m,methodName.code,n.id,n.funcid
     """
     objectCallResult = graph.run(cypher=objectCallQuery).data()
     callEdgecount = 0
 
-    for obj in progress_bar(objectCallResult):
-        #we first determine the type of the object
-        objType = determineObjectType(obj['m'])
-        methodName = obj['methodName.code']
-        methodCallID = obj['n.id']
-        if objType:
+    pending = {obj['n.id']: obj for obj in objectCallResult}
+    pendingByFunction: Dict[Any, Set[int]] = dict()
+    for obj in objectCallResult:
+        pendingByFunction.setdefault(obj['n.funcid'], set()).add(obj['n.id'])
+    newCalls: Dict[int, List[int]] = dict()
+
+    worklist = set(pending.keys())
+    iteration = 0
+    while worklist:
+        iteration += 1
+        #set a safe bound in case there's an infinite loop
+        if iteration > 200:
+            break
+        resolvedFunctions = set()
+        for methodCallID in progress_bar(sorted(worklist)):
+            obj = pending[methodCallID]
+            #we first determine the type of the object
+            objType = determineObjectType(obj['m'], newCalls)
+            if not objType:
+                continue
             #we then look up the corresponding function given the object type is found
-            methodIDs = classHierarchy.lookUpFunction(objType, methodName)
+            methodIDs = classHierarchy.lookUpFunction(objType, obj['methodName.code'])
+            if not methodIDs:
+                continue
             for methodID in methodIDs:
                 #we then build edges between method call and the method
                 callEdgecount += __add_calls_edge(methodCallID, methodID)
-                #print("call created for "+str(methodCallID)+" to "+str(methodID))
-    print(f"Added {callEdgecount} CALLS edges.")
+            newCalls[methodCallID] = list(methodIDs)
+            del pending[methodCallID]
+            pendingByFunction[obj['n.funcid']].discard(methodCallID)
+            resolvedFunctions.add(obj['n.funcid'])
+        worklist = set()
+        for funcID in resolvedFunctions:
+            worklist.update(pendingByFunction[funcID])
+    print(f"Added {callEdgecount} CALLS edges in {iteration} rounds.")
 
-    return callEdgecount
+    return newCalls
 
 
 @_preprocess_step(step_name="Security/storage detectors")
@@ -823,18 +937,18 @@ def __security_detectors():
 
     This isn't just limited to cryptography and also covers storage, deletion, activation, etc.
     """
-    global SECURITY_DETECTOR_MANAGER
-    if not SECURITY_DETECTOR_MANAGER:
+    if not getSecurityDetectorManager():
         sys.exit(1)
     AbstractDetector.SILENT_INITIALIZATION = True
     print("### Running detectors")
-    SECURITY_DETECTOR_MANAGER.run()
+    with stage("detectors"):
+        getSecurityDetectorManager().run()
     print("### Finished running detectors")
-    SECURITY_DETECTOR_MANAGER.print_results()
+    getSecurityDetectorManager().print_results()
 
     print("By data type:")
     grouped: Dict[str, List[AbstractDetector.Finding]] = {}
-    for f in SECURITY_DETECTOR_MANAGER.allFindings:
+    for f in getSecurityDetectorManager().allFindings:
         if not f.score.get_data_types():
             l = grouped.get("none", [])
             l.append(f)
@@ -855,6 +969,7 @@ def __security_detectors():
             print(s)
 
 
+@_task_access(reads=("AST", "PARENT_OF", "REACHES", "FLOWS_TO"))
 @_preprocess_step(step_name="Connect AST_PARAM edges")
 def __connect_ASTPARAM_to_var():
     """
@@ -890,6 +1005,7 @@ def __connect_ASTPARAM_to_var():
     print(f"Added {count} REACHES edges for AST_PARAM to variables")
 
 
+@_task_access(reads=("AST", "AST_HTML", "PARENT_OF"))
 @_preprocess_step(step_name="Create HTML_TO_PHP_REACHES edges between form inputs and PHP request vars")
 def __html_to_php_reaches():
     count = 0
@@ -976,6 +1092,7 @@ def __label_js_nodes():
     getGraph().run(query)
 
 
+@_task_access(reads=("AST", "AST_JS", "PARENT_OF"), writes=("USEFUL_PHP", "USEFUL_JS"))
 @_preprocess_step(step_name="Build hierarchical data flow edges for php and js")
 def __build_php_js_hierarchical_edges():
     print("Building hierarchical edges for PHP...")
@@ -1209,14 +1326,14 @@ def __remove_wrong_hierarchical_edges():
 def remove_edge_from_key_to_sink():
     print("Removing dataflow edges from keys to data storage sinks", end="", flush=True)
 
-    if not SECURITY_DETECTOR_MANAGER:
+    if not getSecurityDetectorManager():
         return
     graph = getGraph()
     tx = graph.begin()
     count = 0
     count2 = 1
     print()
-    for finding in SECURITY_DETECTOR_MANAGER.allFindings:
+    for finding in getSecurityDetectorManager().allFindings:
         if (hasattr(finding, 'function_annotation') and ((hasattr(finding.function_annotation, 'data_param') and
                                                           (not finding.function_annotation.data_param == -1)) or
                                                          (hasattr(finding.function_annotation, 'key_param') and
@@ -1242,7 +1359,7 @@ def remove_edge_from_key_to_sink():
                 """
             tx.run(query)
             count += 1
-        if (count > 0 and count % 1000 == 0) or count2 == len(SECURITY_DETECTOR_MANAGER.allFindings):
+        if (count > 0 and count % 1000 == 0) or count2 == len(getSecurityDetectorManager().allFindings):
             print(f"Deleted PHP_REACHES edges from key to sink for {count} sinks")
             graph.commit(tx)
             tx = graph.begin()
@@ -1251,6 +1368,7 @@ def remove_edge_from_key_to_sink():
     print(f"Deleted PHP_REACHES edges from keys to storage sinks.")
 
 
+@_task_access(reads=("AST", "PARENT_OF", "CALLS", "PHP_REACHES"), writes=("PHP_REACHES", ))
 @_preprocess_step(step_name="Overtaint Function Calls")
 def __overtaintFunctionCalls():
     #modified: if the function call has CALLS edge, we remove the overtainted edges
@@ -1312,17 +1430,34 @@ def __ast_call_return_edges():
     if __OPTIONS["quick"]:
         print("Skipping __ast_call_return_edges.")
         return
+    return __call_return_edges()
+
+
+def __call_return_edges(calls: Optional[List[Dict[str, int]]] = None) -> int:
+    """Connect the returns of called functions to their call sites.
+
+    Args:
+        calls (Optional[List[Dict[str, int]]], optional): {"call": id, "callee": id} pairs to connect. Defaults to None,
+            which uses every CALLS edge in the graph.
+
+    Returns:
+        int: The number of PHP_REACHES edges added.
+    """
     count = 0
     graph = getGraph()
+    if calls is None:
+        callMatch = "MATCH (call:AST)-[:CALLS]->(function:AST)"
+    else:
+        callMatch = "UNWIND $calls AS c MATCH (call:AST{id:c.call}), (function:AST{id:c.callee})"
     returnQuery = f"""
-    MATCH (call:AST)-[:CALLS]->(function:AST)
+    {callMatch}
     WHERE function.type in ['AST_FUNC_DECL','AST_METHOD']
     WITH function,call
     MATCH (ret:AST{{type:"AST_RETURN"}})
     WHERE ret.funcid = function.id AND NOT (ret)-[:PHP_REACHES]->(call)
     RETURN call.id, COLLECT(DISTINCT ret.id)
     """
-    returnResult = graph.run(cypher=returnQuery).data()
+    returnResult = graph.run(cypher=returnQuery, calls=calls).data()
 
     if not returnResult:
         return
@@ -1337,6 +1472,7 @@ def __ast_call_return_edges():
                 count += f.result()
 
     print(f"Added {count} PHP_REACHES edges.")
+    return count
 
 
 @_preprocess_step(step_name="Create hierarchy PHP_REACHES edges for multiple types of nodes")
@@ -1397,6 +1533,7 @@ def ast_assign_subtask(assigner, assignee):
     return count
 
 
+@_task_access(reads=("AST", "PARENT_OF"))
 @_preprocess_step(step_name="Create AST assign hierarchy PHP_REACHES edges")
 def __ast_assign_function_edges():
     """
@@ -1472,6 +1609,82 @@ def __function_call_edges__subtask(nodeID, resultCalls, resultArgs) -> int:
     return count
 
 
+def __is_useful_node(node_type: Optional[str], flags: Optional[List[str]]) -> bool:
+    return node_type in USEFUL_NODES or (node_type == "AST_BINARY_OP" and "BINARY_CONCAT" in (flags or []))
+
+
+def __function_call_edges__set_based(calls: Optional[List[Dict[str, int]]] = None) -> int:
+    """Compute every (argument, parameter) PHP_REACHES edge of every resolved call with a few set-based queries.
+
+    Arguments are matched to the callee's AST_PARAM with the same childnum, and each argument is reduced to its first
+    tier useful nodes (see eliminateUselessNodes). The reduction descends the argument subtrees one level per query, for
+    every argument at once, so there is no depth limit and the number of queries only grows with the depth of the
+    deepest argument. Edges that already exist in the graph are skipped, so the number returned is the number of new
+    edges.
+
+    Args:
+        calls (Optional[List[Dict[str, int]]], optional): {"call": id, "callee": id} pairs to connect. Defaults to None,
+            which uses every CALLS edge in the graph.
+    """
+    graph = getGraph()
+    if calls is None:
+        callMatch = "MATCH (n:AST)-[:CALLS]->(callee:AST)"
+    else:
+        callMatch = "UNWIND $calls AS c MATCH (n:AST{id:c.call}), (callee:AST{id:c.callee})"
+    query = f"""
+    {callMatch}
+    WHERE n.type IN ['AST_METHOD_CALL','AST_STATIC_CALL','AST_CALL','AST_NEW']
+    MATCH (n)-[:PARENT_OF]->(:AST{{type:'AST_ARG_LIST'}})-[:PARENT_OF]->(arg:AST)
+    MATCH (callee)-[:PARENT_OF]->(:AST{{type:'AST_PARAM_LIST'}})-[:PARENT_OF]->(param:AST{{type:'AST_PARAM'}})
+    WHERE param.childnum = arg.childnum
+    RETURN DISTINCT arg.id AS id, arg.type AS type, arg.flags AS flags, param.id AS param
+    """
+    children_query = """
+    UNWIND $frontier AS f
+    MATCH (:AST{id:f.id})-[:PARENT_OF]->(c:AST)
+    RETURN DISTINCT c.id AS id, c.type AS type, c.flags AS flags, f.param AS param
+    """
+    existing_query = """
+    UNWIND $pairs AS p
+    MATCH (var:AST{id:p.var})-[:PHP_REACHES]->(param:AST{id:p.param})
+    RETURN var.id AS var, param.id AS param
+    """
+
+    pairs: Set[Tuple[int, int]] = set()
+    visited: Set[Tuple[int, int]] = set()
+    rows = graph.run(query, calls=calls).data()
+    while rows:
+        frontier = []
+        for r in rows:
+            if (r["id"], r["param"]) in visited:
+                continue
+            visited.add((r["id"], r["param"]))
+            if __is_useful_node(r["type"], r["flags"]):
+                pairs.add((r["id"], r["param"]))
+            else:
+                frontier.append({"id": r["id"], "param": r["param"]})
+        rows = []
+        for i in range(0, len(frontier), IMPORT_BATCH_SIZE):
+            rows.extend(graph.run(children_query, frontier=frontier[i:i + IMPORT_BATCH_SIZE]).data())
+
+    candidates = [{"var": var, "param": param} for var, param in pairs]
+    for i in range(0, len(candidates), IMPORT_BATCH_SIZE):
+        for r in graph.run(existing_query, pairs=candidates[i:i + IMPORT_BATCH_SIZE]).data():
+            pairs.discard((r["var"], r["param"]))
+
+    edges = [{
+        "start_id": var,
+        "start_label": "AST",
+        "end_id": param,
+        "end_label": "AST",
+        "type": "PHP_REACHES",
+        "var": None
+    } for var, param in sorted(pairs)]
+    count = addEdgeBulk(edges, unique=True)
+    print(f"Added {count} PHP_REACHES edges to function parameters.")
+    return count
+
+
 @_preprocess_step(step_name="Create function call edges")
 def __function_call_edges():
     """Create edges with name PHP_REACHES and attribute of the variable name between a parameter within a function call and the parameter in the function definition
@@ -1483,6 +1696,9 @@ def __function_call_edges():
         print("Skipping __function_call_edges.")
         return
 
+    if SET_BASED_CALL_EDGES:
+        return __function_call_edges__set_based()
+
     graph = getGraph()
 
     count = 0
@@ -1524,6 +1740,7 @@ def __function_call_edges():
     return count
 
 
+@_task_access(reads=("AST", "PARENT_OF", "REACHES"))
 @_preprocess_step(step_name="Create PHP_REACHES edges")
 def __php_reach_edges():
     # Benchmark Adding PHP reaches edges completed. Added 60536 :PHP_REACHES for original REACHES edges.
@@ -1554,18 +1771,19 @@ def __php_reach_edges():
     print(f"Added {count} :PHP_REACHES for original :REACHES edges.")
 
 
+@_task_access(reads=("AST", "AST_SQL", "PARENT_OF", "SQL_OF"))
 @_preprocess_step(step_name="Create source to sink edges")
 def __storage_to_retrieval():
 
     print("Adding storage reaches edges... ", end="", flush=True)
 
-    if not SECURITY_DETECTOR_MANAGER:
+    if not getSecurityDetectorManager():
         return
 
     # First find all nodes that save some information as found in the Encryption Detectors stage.
     storage_nodes: Set[int] = set()
     retrieve_nodes: Set[int] = set()
-    for finding in SECURITY_DETECTOR_MANAGER.allFindings:
+    for finding in getSecurityDetectorManager().allFindings:
         if finding.score.is_storage() and not finding.score.is_database():
             storage_nodes.add(finding.node["id"])
         elif finding.score.is_retrieval() and not finding.score.is_database():
@@ -1583,11 +1801,11 @@ def __storage_to_retrieval():
             retrieve_nodes.add(sql_node)
     print("Finished collecting sql insert, update, and select nodes")
     storage_node_info: Dict[int, List[Union[AbstractDetector.Finding, SQLInfo]]] = {
-        i: list(SECURITY_DETECTOR_MANAGER.lookup_node_id(i))
+        i: list(getSecurityDetectorManager().lookup_node_id(i))
         for i in storage_nodes
     }
     retrieve_node_info: Dict[int, List[Union[AbstractDetector.Finding, SQLInfo]]] = {
-        i: list(SECURITY_DETECTOR_MANAGER.lookup_node_id(i))
+        i: list(getSecurityDetectorManager().lookup_node_id(i))
         for i in retrieve_nodes
     }
     for node_id, findings in storage_node_info.items():
@@ -1643,6 +1861,7 @@ def __storage_to_retrieval():
     print(f"Done adding storage edges. Added {num_added} edges in all.")
 
 
+@_task_access(reads=("AST", "PARENT_OF", "PHP_REACHES"))
 @_preprocess_step(step_name="Create do_action and apply_filter edges")
 def __do_action_to_function():
     count = 0
@@ -1760,11 +1979,13 @@ def __do_action_to_function():
     print(f"Added {count} :PHP_REACHES edges.")
 
 
+@_task_access(reads=("AST", "PARENT_OF", "CALLS", "PHP_REACHES"))
 @_preprocess_step(step_name="Create parent-to-self edges")
 def __parent_self_edges():
     addParentSelfEdges()
 
 
+@_task_access(reads=("AST", "PARENT_OF", "PHP_REACHES"), writes=("AST_SQL", ))
 @_preprocess_step(step_name="Create SQL AST")
 def __add_sql_ast():
     if __OPTIONS.get("skip_sql"):
@@ -1809,6 +2030,7 @@ def __add_sql_ast():
             print(f"The following function calls could not successfully be analyzed for SQL content: {error_calls}")
 
         print(f"Added {count} SQL nodes. {success} out of {total} calls were analyzed successfully.")
+        debug_sql_parse_cache_info()
     else:
         print("No SQL nodes to process.")
 
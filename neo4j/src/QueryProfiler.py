@@ -0,0 +1,213 @@
+# GDPR Checker project
+# Per-template timing of the Cypher queries sent to Neo4j.
+#
+# With QUERY_PROFILE enabled, getGraph() returns a ProfilingGraph. It times every run/evaluate/query call and groups
+# the calls by query template: the query text with string and number literals replaced by "?", so the same f-string
+# query issued for thousands of different nodes counts as a single entry. For each template it keeps the number of
+# calls, the latency of each call (time to consume a cursor included), the rows returned and the functions it was
+# called from.
+
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+# Numbers that are not part of a name, parameter or variable-length bound (*0..10 stays, since it changes the plan).
+_NUMBER_LITERAL = re.compile(r"(?<![\w$.*])-?\d+(?:\.\d+)?\b")
+_LIST_OF_LITERALS = re.compile(r"\[\s*\?(?:\s*,\s*\?)*\s*\]")
+_WHITESPACE = re.compile(r"\s+")
+
+# Wrapper functions that sit between the caller and the graph and should not be reported as the caller.
+_WRAPPER_MODULES = {__name__, "Detectors.Manager"}
+_WRAPPER_FUNCTIONS = {"run", "evaluate", "query", "data", "__iter__"}
+
+
+def normalizeQuery(query: str) -> str:
+    """Turn a query into its template by replacing literals with "?" and collapsing whitespace."""
+    template = _STRING_LITERAL.sub("?", query)
+    template = _NUMBER_LITERAL.sub("?", template)
+    template = _LIST_OF_LITERALS.sub("[?]", template)
+    return _WHITESPACE.sub(" ", template).strip()
+
+
+def _caller() -> str:
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module == __name__ or (module in _WRAPPER_MODULES and frame.f_code.co_name in _WRAPPER_FUNCTIONS):
+            frame = frame.f_back
+            continue
+        return f"{module}.{getattr(frame.f_code, 'co_qualname', frame.f_code.co_name)}"
+    return "?"
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+class QueryStats:
+    """Timings of one query template."""
+
+    def __init__(self, template: str) -> None:
+        self.template = template
+        self.latencies: List[float] = []
+        self.rows = 0
+        self.callers: Counter = Counter()
+
+    @property
+    def calls(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def total(self) -> float:
+        return sum(self.latencies)
+
+    def summary(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        caller, _ = self.callers.most_common(1)[0] if self.callers else ("?", 0)
+        return {
+            "template": self.template,
+            "calls": self.calls,
+            "total seconds": sum(latencies),
+            "p50 ms": _percentile(latencies, 0.5) * 1000,
+            "p99 ms": _percentile(latencies, 0.99) * 1000,
+            "rows": self.rows,
+            "caller": caller,
+        }
+
+
+class QueryProfiler:
+    """Collects QueryStats by template; safe to use from several threads."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats: Dict[str, QueryStats] = dict()
+        self.calls = 0
+
+    def record(self, query: str, seconds: float, rows: int, caller: str) -> Tuple[QueryStats, int]:
+        """Record one call. Returns the stats and the index of the call, for adding the time spent reading results."""
+        template = normalizeQuery(query)
+        with self._lock:
+            stats = self.stats.get(template, None)
+            if stats is None:
+                stats = self.stats[template] = QueryStats(template)
+            stats.latencies.append(seconds)
+            stats.rows += rows
+            stats.callers[caller] += 1
+            self.calls += 1
+            self._local.calls = getattr(self._local, "calls", 0) + 1
+            return stats, len(stats.latencies) - 1
+
+    def thread_calls(self) -> int:
+        """Number of calls recorded from the current thread so far."""
+        return getattr(self._local, "calls", 0)
+
+    def add_to_call(self, stats: QueryStats, index: int, seconds: float, rows: int):
+        with self._lock:
+            stats.latencies[index] += seconds
+            stats.rows += rows
+
+    def report(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Get the summaries of all templates, the ones that took the most time in total first."""
+        with self._lock:
+            summaries = [s.summary() for s in self.stats.values()]
+        summaries.sort(key=lambda s: -s["total seconds"])
+        return summaries[:limit] if limit else summaries
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+            self.calls = 0
+
+
+class _ProfiledCursor:
+    """Cursor wrapper that adds the time spent fetching records, and the number of records, to the query's call."""
+
+    def __init__(self, cursor, profiler: QueryProfiler, stats: QueryStats, index: int) -> None:
+        self._cursor = cursor
+        self._profiler = profiler
+        self._stats = stats
+        self._index = index
+
+    def __iter__(self):
+        iterator = iter(self._cursor)
+        while True:
+            start = time.perf_counter()
+            try:
+                record = next(iterator)
+            except StopIteration:
+                self._profiler.add_to_call(self._stats, self._index, time.perf_counter() - start, 0)
+                return
+            self._profiler.add_to_call(self._stats, self._index, time.perf_counter() - start, 1)
+            yield record
+
+    def data(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = self._cursor.data(*args, **kwargs)
+        self._profiler.add_to_call(self._stats, self._index, time.perf_counter() - start, len(result))
+        return result
+
+    def evaluate(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = self._cursor.evaluate(*args, **kwargs)
+        self._profiler.add_to_call(self._stats, self._index, time.perf_counter() - start, int(result is not None))
+        return result
+
+    def __getattr__(self, name: str):
+        return getattr(self._cursor, name)
+
+
+class ProfilingGraph:
+    """Wrapper around a py2neo Graph that records every query in a QueryProfiler."""
+
+    def __init__(self, graph, profiler: QueryProfiler) -> None:
+        self._graph = graph
+        self.profiler = profiler
+
+    def run(self, cypher, parameters=None, **kwparameters):
+        start = time.perf_counter()
+        cursor = self._graph.run(cypher, parameters, **kwparameters)
+        stats, index = self.profiler.record(str(cypher), time.perf_counter() - start, 0, _caller())
+        return _ProfiledCursor(cursor, self.profiler, stats, index)
+
+    def evaluate(self, cypher, parameters=None, **kwparameters):
+        start = time.perf_counter()
+        result = self._graph.evaluate(cypher, parameters, **kwparameters)
+        self.profiler.record(str(cypher), time.perf_counter() - start, int(result is not None), _caller())
+        return result
+
+    def query(self, cypher, parameters=None, **kwparameters):
+        start = time.perf_counter()
+        result = self._graph.query(cypher, parameters, **kwparameters)
+        self.profiler.record(str(cypher), time.perf_counter() - start, 0, _caller())
+        return result
+
+    def __getattr__(self, name: str):
+        return getattr(self._graph, name)
+
+
+global __QUERY_PROFILER
+__QUERY_PROFILER = QueryProfiler()
+
+
+def getQueryProfiler() -> QueryProfiler:
+    return __QUERY_PROFILER
+
+
+def printQueryProfile(limit: int = 25):
+    """Print the query templates that took the most time in total."""
+    report = getQueryProfiler().report()
+    total = sum(s["total seconds"] for s in report)
+    print(f"### Query profile: {sum(s['calls'] for s in report)} queries, {len(report)} templates, {total:.2f}s")
+    for s in report[:limit]:
+        template = s["template"] if len(s["template"]) <= 160 else s["template"][:157] + "..."
+        print(
+            f"{s['total seconds']:8.2f}s {s['calls']:7d} calls  p50 {s['p50 ms']:8.2f}ms  p99 {s['p99 ms']:8.2f}ms "
+            f"{s['rows']:8d} rows  {s['caller']}\n    {template}"
+        )
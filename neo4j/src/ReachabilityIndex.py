@@ -0,0 +1,292 @@
+# GDPR Checker project
+# Reachability index over the data flow edges, used by DataFlowTracking once preprocessing has finished.
+#
+# The data flow graph is condensed into strongly connected components (see TaintPropagation.TaintGraph). Each component
+# keeps the set of terminal nodes (sources/sinks) it can reach as an int bitset, and a few randomized DFS interval
+# labels (GRAIL) that rule out most unreachable pairs without a traversal.
+
+import random
+import threading
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from NeoGraph import getGraph
+from Settings import REACHABILITY_INDEX
+from TaintPropagation import TaintGraph
+
+# Number of randomized interval labels per component.
+_INTERVAL_LABELS = 3
+
+
+class ReachabilityIndex:
+    """Answers hasDataflowPath, getSources and getSinks queries from memory.
+
+    Terminals follow the Cypher queries in DataFlowTracking: a sink is an AST node without outgoing data flow edges, a
+    source an AST node without incoming ones. Nodes without any data flow edge are not stored; they are their own
+    (only) source and sink.
+    """
+
+    def __init__(self, edges: Iterable[Tuple[int, int]], ast_nodes: Set[int]) -> None:
+        edges = list(edges)
+        self._graph = TaintGraph((), edges)
+        n = len(self._graph)
+        self._forward: List[List[int]] = [[] for _ in range(n)]
+        self._reverse: List[List[int]] = [[] for _ in range(n)]
+        self._self_loop: Set[int] = set()
+        has_out = [False] * n
+        has_in = [False] * n
+        for start, end in edges:
+            i = self._graph.position(start)
+            j = self._graph.position(end)
+            has_out[i] = True
+            has_in[j] = True
+            if i == j:
+                self._self_loop.add(i)
+            else:
+                self._forward[i].append(j)
+                self._reverse[j].append(i)
+        self._ast = [node_id in ast_nodes for node_id in self._graph.ids]
+        self._nodes: Dict[int, Dict[str, Any]] = dict()
+
+        component = self._graph.component
+        members = self._graph.members
+        successors = self._graph.component_successors()
+        predecessors: List[Set[int]] = [set() for _ in members]
+        for c, targets in enumerate(successors):
+            for d in targets:
+                predecessors[d].add(c)
+        self._successors = successors
+
+        # Terminals are singleton components; components are numbered in topological order, so sink sets are
+        # accumulated in reverse order and source sets in order.
+        self._sink_ids: List[int] = []
+        self._source_ids: List[int] = []
+        self._sinks: List[int] = [0] * len(members)
+        self._sources: List[int] = [0] * len(members)
+        for i in range(n):
+            if not self._ast[i]:
+                continue
+            if not has_out[i]:
+                self._sinks[component[i]] |= 1 << len(self._sink_ids)
+                self._sink_ids.append(self._graph.ids[i])
+            if not has_in[i]:
+                self._sources[component[i]] |= 1 << len(self._source_ids)
+                self._source_ids.append(self._graph.ids[i])
+        for c in reversed(range(len(members))):
+            for d in successors[c]:
+                self._sinks[c] |= self._sinks[d]
+        for c in range(len(members)):
+            for d in predecessors[c]:
+                self._sources[c] |= self._sources[d]
+
+        self._intervals = [self._interval_labels(successors, seed) for seed in range(_INTERVAL_LABELS)]
+
+    def __len__(self) -> int:
+        return len(self._graph)
+
+    @staticmethod
+    def _interval_labels(successors: List[Set[int]], seed: int) -> List[Tuple[int, int]]:
+        """Label each component with [lowest post-order rank below it, its post-order rank] for one random DFS.
+
+        If u reaches v then v's interval is contained in u's, so a non-contained interval proves v is unreachable.
+        """
+        rng = random.Random(seed)
+        count = len(successors)
+        rank = [-1] * count
+        low = [0] * count
+        visited = [False] * count
+        next_rank = 0
+        roots = list(range(count))
+        rng.shuffle(roots)
+        for root in roots:
+            if visited[root]:
+                continue
+            visited[root] = True
+            children = list(successors[root])
+            rng.shuffle(children)
+            work = [(root, children)]
+            while work:
+                c, pending = work[-1]
+                if pending:
+                    d = pending.pop()
+                    if not visited[d]:
+                        visited[d] = True
+                        grandchildren = list(successors[d])
+                        rng.shuffle(grandchildren)
+                        work.append((d, grandchildren))
+                    continue
+                work.pop()
+                rank[c] = next_rank
+                next_rank += 1
+                low[c] = min([rank[c]] + [low[d] for d in successors[c]])
+        return [(low[c], rank[c]) for c in range(count)]
+
+    def _may_reach(self, c: int, d: int) -> bool:
+        for labels in self._intervals:
+            if not (labels[c][0] <= labels[d][0] and labels[d][1] <= labels[c][1]):
+                return False
+        return True
+
+    def has_path(self, start_id: int, end_id: int) -> bool:
+        """Whether there is a data flow path of at least one edge from start_id to end_id."""
+        i = self._graph.position(start_id)
+        j = self._graph.position(end_id)
+        if i is None or j is None:
+            return False
+        component = self._graph.component
+        c, d = component[i], component[j]
+        if c == d:
+            return i != j or i in self._self_loop or len(self._graph.members[c]) > 1
+        if d < c or not self._may_reach(c, d):
+            return False
+        stack = [c]
+        seen = {c}
+        while stack:
+            current = stack.pop()
+            for e in self._successors[current]:
+                if e == d:
+                    return True
+                if e in seen or e > d or not self._may_reach(e, d):
+                    continue
+                seen.add(e)
+                stack.append(e)
+        return False
+
+    def terminals(self,
+                  node_id: int,
+                  reverse: bool = False,
+                  max_depth: Optional[int] = None,
+                  include_self: bool = True) -> List[Dict[str, Any]]:
+        """Get the sinks (or, with reverse, the sources) reachable from an AST node.
+
+        Args:
+            node_id (int): The node to start from.
+            reverse (bool, optional): Get sources instead of sinks. Defaults to False.
+            max_depth (Optional[int], optional): Maximum path length; unbounded if None.
+            include_self (bool, optional): Whether node_id itself may be returned. Defaults to True.
+
+        Returns:
+            List[Dict[str, Any]]: The terminal nodes, each once. Bounded queries are ordered by distance.
+        """
+        i = self._graph.position(node_id)
+        if i is None:
+            node = self._node(node_id)
+            return [node] if node and include_self else []
+        if not self._ast[i]:
+            return []
+        masks = self._sources if reverse else self._sinks
+        terminal_ids = self._source_ids if reverse else self._sink_ids
+        component = self._graph.component
+        if max_depth is None:
+            mask = masks[component[i]]
+            output = []
+            while mask:
+                low = mask & -mask
+                terminal_id = terminal_ids[low.bit_length() - 1]
+                if include_self or terminal_id != node_id:
+                    output.append(terminal_id)
+                mask ^= low
+            return [self._node(t) for t in output]
+
+        adjacency = self._reverse if reverse else self._forward
+        has_edge = (lambda v: bool(adjacency[v]) or v in self._self_loop)
+        output = []
+        visited = {i}
+        queue = deque([(i, 0)])
+        while queue:
+            v, depth = queue.popleft()
+            if not has_edge(v):
+                if self._ast[v] and (include_self or v != i):
+                    output.append(self._graph.ids[v])
+                continue
+            if depth >= max_depth:
+                continue
+            for w in adjacency[v]:
+                # Skip branches that cannot reach any terminal.
+                if w not in visited and masks[component[w]]:
+                    visited.add(w)
+                    queue.append((w, depth + 1))
+        return [self._node(t) for t in output]
+
+    def _node(self, node_id: int) -> Dict[str, Any]:
+        node = self._nodes.get(node_id, None)
+        if node is None:
+            result = getGraph().evaluate("MATCH (n:AST{id:$id}) RETURN n", id=node_id)
+            node = dict(result) if result else {}
+            self._nodes[node_id] = node
+        return node
+
+    def prefetch_terminals(self) -> None:
+        """Load the properties of every source and sink with one query."""
+        ids = list(set(self._sink_ids) | set(self._source_ids))
+        query = """
+        UNWIND $ids AS id
+        MATCH (n:AST{id:id})
+        RETURN n
+        """
+        for r in getGraph().run(query, ids=ids):
+            node = dict(r["n"])
+            self._nodes[node["id"]] = node
+
+    @classmethod
+    def from_neo4j(cls, relationship_types: List[str]) -> "ReachabilityIndex":
+        """Build the index from every data flow edge in the graph.
+
+        Args:
+            relationship_types (List[str]): Data flow edge types, e.g. DataFlowTracking.RELATIONSHIP_TYPES.
+        """
+        query = """
+        MATCH (a)-[r]->(b)
+        WHERE type(r) IN $types
+        RETURN a.id AS start, b.id AS end, 'AST' IN labels(a) AS start_ast, 'AST' IN labels(b) AS end_ast
+        """
+        edges = []
+        ast_nodes = set()
+        for r in getGraph().run(query, types=relationship_types):
+            edges.append((r["start"], r["end"]))
+            if r["start_ast"]:
+                ast_nodes.add(r["start"])
+            if r["end_ast"]:
+                ast_nodes.add(r["end"])
+        index = cls(edges, ast_nodes)
+        index.prefetch_terminals()
+        return index
+
+
+global __REACHABILITY_INDEX, __REACHABILITY_INDEX_LOCK
+__REACHABILITY_INDEX: Optional[ReachabilityIndex] = None
+__REACHABILITY_INDEX_LOCK = threading.Lock()
+
+
+def getReachabilityIndex() -> Optional[ReachabilityIndex]:
+    """Get the reachability index, or None if it is disabled or not built yet.
+
+    Callers fall back to the in-memory graph or Neo4j when this returns None.
+    """
+    return __REACHABILITY_INDEX
+
+
+def buildReachabilityIndex(relationship_types: List[str]) -> Optional[ReachabilityIndex]:
+    """Build the reachability index if REACHABILITY_INDEX is enabled.
+
+    Args:
+        relationship_types (List[str]): Data flow edge types, e.g. DataFlowTracking.RELATIONSHIP_TYPES.
+
+    Returns:
+        Optional[ReachabilityIndex]: The index, or None if it is disabled.
+    """
+    global __REACHABILITY_INDEX
+    if not REACHABILITY_INDEX:
+        return None
+    with __REACHABILITY_INDEX_LOCK:
+        print("Building data flow reachability index... ", end="")
+        __REACHABILITY_INDEX = ReachabilityIndex.from_neo4j(relationship_types)
+        print(f"{len(__REACHABILITY_INDEX)} nodes")
+    return __REACHABILITY_INDEX
+
+
+def invalidateReachabilityIndex() -> None:
+    """Drop the reachability index, e.g. after new data flow edges have been committed."""
+    global __REACHABILITY_INDEX
+    with __REACHABILITY_INDEX_LOCK:
+        __REACHABILITY_INDEX = None
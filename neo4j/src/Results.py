@@ -2,18 +2,111 @@
 # Patrick Thomas pwt5ca
 # Created 210101
 
+import atexit
+import os
 import sqlite3
+import threading
 import time
 from datetime import datetime
 from sqlite3.dbapi2 import Connection
-from typing import Iterable, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
-global __DB_TIMEOUT, __PLUGIN_TIME, __PLUGIN_ID, __DETECTOR_COUNTER, __DATABASE_DIR
+from Settings import RESULTS_BATCH_SIZE
+
+global __DB_TIMEOUT, __PLUGIN_TIME, __PLUGIN_ID, __DETECTOR_COUNTER, __DATABASE_DIR, __WRITER, __WRITER_LOCK
 __DB_TIMEOUT = 60  # Length to wait until giving up on sqlite database.
 __PLUGIN_TIME = str(datetime.now())
 __PLUGIN_ID = 0
 __DETECTOR_COUNTER = 0
 __DATABASE_DIR = ""
+__WRITER: Optional["ResultsWriter"] = None
+__WRITER_LOCK = threading.Lock()
+
+
+class ResultsWriter:
+    """One WAL-mode connection to the results database that buffers inserted rows and writes them in batches.
+
+    Rows are flushed with executemany in a single transaction once batch_size rows are buffered, when the results are
+    read back and at exit. WAL lets the processes of a batch run read while another one writes, and writers wait up to
+    __DB_TIMEOUT seconds for each other. A forked process opens its own connection.
+    """
+
+    def __init__(self, path: str, batch_size: int = RESULTS_BATCH_SIZE) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self._lock = threading.RLock()
+        self._conn: Optional[Connection] = None
+        self._pid = 0
+        # Insert statement -> buffered rows, in the order the statements were first used.
+        self._pending: Dict[str, List[tuple]] = dict()
+        self._count = 0
+
+    def connection(self) -> Connection:
+        with self._lock:
+            if self._conn is None or self._pid != os.getpid():
+                self._conn = sqlite3.connect(self.path, timeout=_db_timeout(), check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+                self._pid = os.getpid()
+            return self._conn
+
+    def add(self, statement: str, rows: Iterable[tuple]) -> None:
+        with self._lock:
+            pending = self._pending.setdefault(statement, [])
+            before = len(pending)
+            pending.extend(rows)
+            self._count += len(pending) - before
+            if self._count >= self.batch_size:
+                self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._count:
+                return
+            pending, self._pending, self._count = self._pending, dict(), 0
+            conn = self.connection()
+            with conn:
+                for statement, rows in pending.items():
+                    try:
+                        conn.executemany(statement, rows)
+                    except sqlite3.IntegrityError:
+                        # Keep the rest of the batch when some rows clash with existing ones.
+                        for row in rows:
+                            try:
+                                conn.execute(statement, row)
+                            except sqlite3.IntegrityError as e:
+                                print(f"Could not write result row {row}: {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            self.flush()
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+def _db_timeout() -> int:
+    return __DB_TIMEOUT
+
+
+def get_writer() -> ResultsWriter:
+    """Get the writer for the current results database."""
+    global __WRITER
+    with __WRITER_LOCK:
+        if __WRITER is None or __WRITER.path != __DATABASE_DIR:
+            if __WRITER is not None:
+                __WRITER.close()
+            __WRITER = ResultsWriter(__DATABASE_DIR)
+        return __WRITER
+
+
+def flush_results():
+    """Write all buffered result rows to the database."""
+    if __WRITER is not None:
+        __WRITER.flush()
+
+
+atexit.register(flush_results)
 
 
 def create_table(database_dir: str):
@@ -91,6 +184,19 @@ def create_table(database_dir: str):
                     PRIMARY KEY("plugin ID","source id","sink id")
                 );"""
             )
+            c.execute(
+                """ CREATE TABLE IF NOT EXISTS "QueryProfile" (
+                    "plugin ID" INTEGER NOT NULL,
+                    "template"  TEXT NOT NULL,
+                    "calls" INTEGER,
+                    "total seconds" REAL,
+                    "p50 ms"    REAL,
+                    "p99 ms"    REAL,
+                    "rows"  INTEGER,
+                    "caller"    TEXT,
+                    PRIMARY KEY("plugin ID","template")
+                );"""
+            )
             conn.commit()
             c.execute(
                 """ CREATE VIEW IF NOT EXISTS BatchResults AS
@@ -117,7 +223,9 @@ def register_plugin(database_dir: str, plugin_name: str):
     global __PLUGIN_ID, __PLUGIN_TIME
     if not __PLUGIN_ID:
         create_table(database_dir)
-        with sqlite3.connect(__DATABASE_DIR, timeout=__DB_TIMEOUT) as conn:
+        writer = get_writer()
+        writer.flush()
+        with writer.connection() as conn:
             c = conn.cursor()
             c.execute(
                 """INSERT INTO "Plugins" ("plugin name", "date analyzed") VALUES (?, ?) """,
@@ -144,32 +252,32 @@ def write_plugin_detector_results(
     personal_data: List[str] = None
 ):
     global __DETECTOR_COUNTER
-    print(f"{description},{cryptography_method},{api_endpoint}")
-    with sqlite3.connect(__DATABASE_DIR, timeout=__DB_TIMEOUT) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """INSERT INTO "Detectors"
-        ("detector ID", "plugin ID", "detector name", "detector type", "file name", "line number", "node ID", "description", "cryptography method", "api endpoint","personal data")
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) """,
-            (
-                __DETECTOR_COUNTER,
-                __PLUGIN_ID,
-                detector_name,
-                detector_type,
-                file_name,
-                line_number,
-                node_ID,
-                description,
-                cryptography_method,
-                str(api_endpoint),
-                str(personal_data)
-            ),
-        )
-        conn.commit()
+    writer = get_writer()
+    with __WRITER_LOCK:
+        detector_id = __DETECTOR_COUNTER
         __DETECTOR_COUNTER = __DETECTOR_COUNTER + 1
+    writer.add(
+        """INSERT INTO "Detectors"
+    ("detector ID", "plugin ID", "detector name", "detector type", "file name", "line number", "node ID", "description", "cryptography method", "api endpoint","personal data")
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) """,
+        [(
+            detector_id,
+            __PLUGIN_ID,
+            detector_name,
+            detector_type,
+            file_name,
+            line_number,
+            node_ID,
+            description,
+            cryptography_method,
+            str(api_endpoint),
+            str(personal_data)
+        )],
+    )
 
 
 def get_conn() -> Connection:
+    flush_results()
     return sqlite3.connect(__DATABASE_DIR, timeout=__DB_TIMEOUT)
 
 
@@ -185,28 +293,24 @@ def write_data_flow_path_row(
     line_number: int = -1,
     detector_type: str = "",
 ):
-    global __DETECTOR_COUNTER
-    with sqlite3.connect(__DATABASE_DIR, timeout=__DB_TIMEOUT) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """INSERT INTO "Paths"
-        ("path ID", "plugin ID", "node index", "node ID", "AST type", "variable name", "caller", "callee", "file name", "line number", "detector type")
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) """,
-            (
-                path_id,
-                __PLUGIN_ID,
-                row_num,
-                node_id,
-                ast_type,
-                variable_name,
-                caller,
-                callee,
-                file_name,
-                line_number,
-                detector_type,
-            ),
-        )
-        conn.commit()
+    get_writer().add(
+        """INSERT INTO "Paths"
+    ("path ID", "plugin ID", "node index", "node ID", "AST type", "variable name", "caller", "callee", "file name", "line number", "detector type")
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) """,
+        [(
+            path_id,
+            __PLUGIN_ID,
+            row_num,
+            node_id,
+            ast_type,
+            variable_name,
+            caller,
+            callee,
+            file_name,
+            line_number,
+            detector_type,
+        )],
+    )
 
 
 def write_data_flow_path_row_many(
@@ -225,45 +329,49 @@ def write_data_flow_path_row_many(
         ]
     ]
 ):
-    global __DETECTOR_COUNTER
-    with sqlite3.connect(__DATABASE_DIR, timeout=__DB_TIMEOUT) as conn:
-        cursor = conn.cursor()
-        cursor.executemany(
-            """INSERT INTO "Paths"
-                ("plugin ID", "path ID", "node index", "node ID", "AST type", "variable name", "caller", "callee", "file name", "line number", "detector type")
-            VALUES
-                (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            [(__PLUGIN_ID, *d) for d in data],
-        )
-        conn.commit()
+    get_writer().add(
+        """INSERT INTO "Paths"
+            ("plugin ID", "path ID", "node index", "node ID", "AST type", "variable name", "caller", "callee", "file name", "line number", "detector type")
+        VALUES
+            (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [(__PLUGIN_ID, *d) for d in data],
+    )
 
 def write_source_sink(sourceSinkList:List[Tuple[int,int]]):
-    with sqlite3.connect(__DATABASE_DIR, timeout=__DB_TIMEOUT) as conn:
-        cursor = conn.cursor()
-        cursor.executemany(
-            """
-            INSERT INTO "SourceSink"
-                ("plugin ID", "source id", "sink id")
-            VALUES
-                (?, ?, ?)
-            """,
-            [(__PLUGIN_ID, *d) for d in sourceSinkList],
-        )
-        conn.commit()
+    get_writer().add(
+        """
+        INSERT INTO "SourceSink"
+            ("plugin ID", "source id", "sink id")
+        VALUES
+            (?, ?, ?)
+        """,
+        [(__PLUGIN_ID, *d) for d in sourceSinkList],
+    )
+def write_query_profile(report: List[dict]):
+    """Save the query profile (see QueryProfiler.QueryProfiler.report) of this plugin."""
+    get_writer().add(
+        """
+        INSERT OR REPLACE INTO "QueryProfile"
+            ("plugin ID", "template", "calls", "total seconds", "p50 ms", "p99 ms", "rows", "caller")
+        VALUES
+            (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (__PLUGIN_ID, s["template"], s["calls"], s["total seconds"], s["p50 ms"], s["p99 ms"], s["rows"], s["caller"])
+            for s in report
+        ],
+    )
 def write_path_analyzer_decision(path_analyzer_topic: str, stage: str, compliant: bool):
-    with sqlite3.connect(__DATABASE_DIR, timeout=__DB_TIMEOUT) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO "PathAnalyzerDecision"
-                ("plugin ID", "path analyzer topic", "stage", "compliant")
-            VALUES
-                (?, ?, ?, ?)
-            """,
-            (__PLUGIN_ID, path_analyzer_topic, stage, str(compliant)),
-        )
-        conn.commit()
+    get_writer().add(
+        """
+        INSERT INTO "PathAnalyzerDecision"
+            ("plugin ID", "path analyzer topic", "stage", "compliant")
+        VALUES
+            (?, ?, ?, ?)
+        """,
+        [(__PLUGIN_ID, path_analyzer_topic, stage, str(compliant))],
+    )
 
 
 def write_path_analyzer_log_row(
@@ -275,32 +383,30 @@ def write_path_analyzer_log_row(
     description: str,
     types: Iterable[str],
 ):
-    with sqlite3.connect(__DATABASE_DIR, timeout=__DB_TIMEOUT) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO "PathAnalyzer"
-                ("plugin ID", "path analyzer topic", "path ID", "stage", "node id", "level", "description")
-            VALUES
-                (?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                __PLUGIN_ID,
-                path_analyzer_topic,
-                path_id,
-                stage,
-                node_id,
-                level,
-                ", ".join(types) + " | " + description,
-            ),
-        )
-        conn.commit()
+    get_writer().add(
+        """
+        INSERT INTO "PathAnalyzer"
+            ("plugin ID", "path analyzer topic", "path ID", "stage", "node id", "level", "description")
+        VALUES
+            (?, ?, ?, ?, ?, ?, ?)
+        """,
+        [(
+            __PLUGIN_ID,
+            path_analyzer_topic,
+            path_id,
+            stage,
+            node_id,
+            level,
+            ", ".join(types) + " | " + description,
+        )],
+    )
 
 
 def get_report() -> str:
     if not __PLUGIN_ID:
         return ""
 
+    flush_results()
     with sqlite3.connect(__DATABASE_DIR, timeout=__DB_TIMEOUT) as conn:
         plugin_name = ""
         c = conn.cursor()
@@ -6,10 +6,13 @@ import re
 from typing import Any, Dict, List, Optional, Set, Tuple
 from NodeEdgeManager import *
 import os
-from Settings import SRC_DIR,ROOT_DIR
+from Settings import SRC_DIR,ROOT_DIR,SQL_PARSE_CACHE_PERSISTENT,SQL_PARSE_CACHE_VERSION,VALUE_CACHE_PATH
+from ValueCache import MISSING, ValueCache
 
-from Naked.toolshed.shell import muterun_js
+from preprocessing.utils.NodeWorkerPool import runJS
 import json
+import atexit
+import threading
 
 
 SQLParentNodes: Set[int] = set()
@@ -243,40 +246,107 @@ def SQLToAST1(nodeID: int) -> bool:
         query_childnum = int(results)+1
     return parseSQL(sql,query_childnum,query_lineno,nodeID)
     
+def normalizeSQL(sqlStatement: str) -> str:
+    """Normalize a statement for the parse cache; statements that only differ in whitespace parse the same."""
+    return re.sub(r"\s+", " ", sqlStatement).strip()
+
+
+def __runSQLParser(sqlStatement: str) -> Optional[List[Tuple[str, str, Tuple[str, ...]]]]:
+    response = runJS(os.path.join(SRC_DIR,"sqlparser.js"), [sqlStatement])
+    response = response.stdout.decode("utf-8")
+    if not response:
+        return None
+    nodeList = json.loads(response)
+    tableInfo = nodeList['tables']
+    tableInfo = [i.split("::") for i in tableInfo]
+    # print(tableInfo)
+    columnInfo = nodeList['columns']
+    columnInfo = [i.split("::") for i in columnInfo]
+    # print(columnInfo)
+    parsed = []
+    for t in tableInfo:
+        operation = t[0]
+        table = t[2]
+        columns = []
+        for c in columnInfo:
+            operation_temp = c[0]
+            table_temp = c[1]
+            column = c[2]
+            column.replace("(.*)","*")
+            #if the table name for the column cannot be matched, assume it's the table name matched outside in the table info.
+            if operation_temp==operation and (table_temp==table or table_temp=='null'):
+                columns.append(column)
+        parsed.append((operation, table, tuple(columns)))
+    return parsed
+
+
+SQL_PARSE_CACHE: Dict[str, Optional[List[Tuple[str, str, Tuple[str, ...]]]]] = dict()
+SQL_PARSE_CACHE_STATS: Dict[str, int] = {"hits": 0, "disk hits": 0, "misses": 0}
+__SQL_PARSE_CACHE_LOCK = threading.Lock()
+__SQL_PARSE_DISK_CACHE: Optional[ValueCache] = None
+
+
+def parseSQLStatement(sqlStatement: str) -> Optional[List[Tuple[str, str, Tuple[str, ...]]]]:
+    """Parse a statement into (operation, table, columns) tuples, one per table it touches.
+
+    Results are cached by normalized statement text, and with SQL_PARSE_CACHE_PERSISTENT also on disk across plugins.
+    Failed parses are only cached in memory, since the parser may fail for reasons other than the statement itself
+    (e.g. a node worker that could not be started).
+
+    Args:
+        sqlStatement (str): The SQL statement.
+
+    Returns:
+        Optional[List[Tuple[str, str, Tuple[str, ...]]]]: The parsed tuples, or None if the statement cannot be parsed.
+    """
+    global __SQL_PARSE_DISK_CACHE
+    key = normalizeSQL(sqlStatement)
+    with __SQL_PARSE_CACHE_LOCK:
+        if key in SQL_PARSE_CACHE:
+            SQL_PARSE_CACHE_STATS["hits"] += 1
+            return SQL_PARSE_CACHE[key]
+        if SQL_PARSE_CACHE_PERSISTENT and __SQL_PARSE_DISK_CACHE is None:
+            __SQL_PARSE_DISK_CACHE = ValueCache(VALUE_CACHE_PATH)
+            atexit.register(__SQL_PARSE_DISK_CACHE.flush)
+    disk = __SQL_PARSE_DISK_CACHE
+    fingerprint = f"sql:{SQL_PARSE_CACHE_VERSION}"
+    parsed = disk.get(fingerprint, "parseSQLStatement", key) if disk is not None else MISSING
+    stat = "disk hits"
+    if parsed is MISSING:
+        stat = "misses"
+        parsed = __runSQLParser(sqlStatement)
+        if disk is not None and parsed is not None:
+            disk.put(fingerprint, "parseSQLStatement", key, parsed)
+    with __SQL_PARSE_CACHE_LOCK:
+        SQL_PARSE_CACHE_STATS[stat] += 1
+        SQL_PARSE_CACHE[key] = parsed
+    return parsed
+
+
+def debug_sql_parse_cache_info():
+    """Print how often parsed SQL statements were reused."""
+    hits = SQL_PARSE_CACHE_STATS["hits"]
+    disk_hits = SQL_PARSE_CACHE_STATS["disk hits"]
+    misses = SQL_PARSE_CACHE_STATS["misses"]
+    total = max(hits + disk_hits + misses, 1)
+    print(
+        f"SQL parse cache: {len(SQL_PARSE_CACHE)} statements, {hits} hits, {disk_hits} disk hits, {misses} misses "
+        f"({(hits + disk_hits) / total:.1%} hit rate)"
+    )
+
+
 def parseSQL(sqlStatement: str, query_childnum: int, query_lineno: int,parent_nodeID: int) -> None:
     nodeCount=0
     edgeCount = 0
-    response = None
-    sqlstring = sqlStatement.replace("'","\\'")
-    sqlstring = f"$'{sqlstring}'"
-    response = muterun_js(os.path.join(SRC_DIR,"sqlparser.js"), arguments=f"""{sqlstring}""")
-    response = response.stdout.decode("utf-8")
-    if response:
-        nodeList = json.loads(response)
-        tableInfo = nodeList['tables']
-        tableInfo = [i.split("::") for i in tableInfo]
-        # print(tableInfo)
-        columnInfo = nodeList['columns']
-        columnInfo = [i.split("::") for i in columnInfo]
-        # print(columnInfo)
+    parsed = parseSQLStatement(sqlStatement)
+    if parsed is not None:
         current_childnum = query_childnum
-        for t in tableInfo:
-            operation = t[0]
-            table = t[2]
-            columns = []
-            for c in columnInfo:
-                operation_temp = c[0]
-                table_temp = c[1]
-                column = c[2]
-                column.replace("(.*)","*")
-                #if the table name for the column cannot be matched, assume it's the table name matched outside in the table info.
-                if operation_temp==operation and (table_temp==table or table_temp=='null'):
-                    columns.append(column)
+        for operation, table, columns in parsed:
             # print("SQL parsed result:")
             # print("==operation:"+operation)
             # print("==table:"+table)
             # print("==columns:"+str(columns))
-            newID = addSQLNode("AST_SQL",operation,table,columns,query_lineno,sqlStatement,current_childnum)
+            newID = addSQLNode("AST_SQL",operation,table,list(columns),query_lineno,sqlStatement,current_childnum)
             nodeCount+=1
             current_childnum+=1
             edgeCount+=addEdge(parent_nodeID,"AST",newID,"AST_SQL","PARENT_OF")
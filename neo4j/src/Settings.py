@@ -1,15 +1,18 @@
 import collections
 import json
 import os
-from typing import Any, OrderedDict
+from typing import Any, Dict, List, Optional, OrderedDict
 
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "1")
-NEO4J_BOLT_PORT = "7687"
+NEO4J_BOLT_PORT = os.getenv("NEO4J_BOLT_PORT", "7687")
 NEO4J_HTTP_PORT = "7474"
-NEO4J_HOST = "localhost"
+NEO4J_HOST = os.getenv("NEO4J_HOST", "localhost")
 NEO4J_BOLT_CONNECTION_STRING = f"bolt://{NEO4J_HOST}:{NEO4J_BOLT_PORT}"
+# Used by the offline importer (NodeEdgeManager.offlineImport, see OFFLINE_IMPORT).
+NEO4J_HOME = os.getenv("NEO4J_HOME", "")
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE", "neo4j")
 
 # ROOT_DIR_FAYSAL = "/home/faysal/code/jhu/gdpr/GDPR-CCPA-violation-checker/"
 # ROOT_DIR_JERRY = "/Users/jerrysu/Documents/GDPR-CCPA-violation-checker/"
@@ -44,7 +47,8 @@ FN_SENSITIVITY_INFO_PATH = 'PluginFunctionSensitivity.csv'
 MINIMUM_ROW_NUMBER = 10000
 
 NAVEX_DOCKER_DIR = ROOT_DIR + "navex_docker/"
-RESULT_DIR = NAVEX_DOCKER_DIR + "result/results/"
+# Directory with the NAVEX exports (nodes.csv, edges.csv, cpg_edges.csv) of the plugin being analyzed.
+RESULT_DIR = os.path.join(os.getenv("NAVEX_RESULT_DIR", NAVEX_DOCKER_DIR + "result/results/"), "")
 NODES_CSV_FILE_LOC = RESULT_DIR + "nodes.csv"
 NODES_CSV_MODIFIED_FILE_LOC = RESULT_DIR + "nodes_w.csv"
 EDGES_CSV_FILE_LOC = RESULT_DIR + "edges.csv"
@@ -127,21 +131,43 @@ MSG_NODE_NOT_FOUND = "NODE NOT FOUND"
 TAG_PHP_EXT = ".php"
 
 ENCRYPTION_PARALLEL = True  # Should encryption detectors be ran in parallel.
+RESULTS_BATCH_SIZE = int(os.getenv("RESULTS_BATCH_SIZE", "500"))  # Result rows buffered before writing them to SQLite
+DETECTOR_WORKERS = int(os.getenv("DETECTOR_WORKERS", "0")) or None  # Threads for the detectors; None picks a default
+DETECTOR_FAIL_FAST = os.getenv("DETECTOR_FAIL_FAST", "0") == "1"  # Stop the analysis when a detector raises
 
-f = None
 __function_info_path = os.path.join(SRC_DIR, "Detectors", "wordpress_functions.json")
-with open(
-    os.path.join(os.path.dirname(os.path.realpath(__file__)), __function_info_path), "r"
-) as f:
-    s = f.read()
-    ALL_WORDPRESS_FUNCTIONS: OrderedDict[str, Any] = json.JSONDecoder(
-        object_pairs_hook=collections.OrderedDict
-    ).decode(s)
-del f, s
-
-ALL_WORDPRESS_FUNCTION_RETURN_TYPES = {
-    k: v.get("returns", {}).get("types", []) for k, v in ALL_WORDPRESS_FUNCTIONS.items()
-}
+
+global __ALL_WORDPRESS_FUNCTIONS, __ALL_WORDPRESS_FUNCTION_RETURN_TYPES
+__ALL_WORDPRESS_FUNCTIONS: Optional[OrderedDict[str, Any]] = None
+__ALL_WORDPRESS_FUNCTION_RETURN_TYPES: Optional[Dict[str, List[str]]] = None
+
+
+def getWordpressFunctions() -> OrderedDict[str, Any]:
+    """Get the WordPress function information from wordpress_functions.json, parsed on first use."""
+    global __ALL_WORDPRESS_FUNCTIONS
+    if __ALL_WORDPRESS_FUNCTIONS is None:
+        with open(__function_info_path, "r") as f:
+            __ALL_WORDPRESS_FUNCTIONS = json.JSONDecoder(object_pairs_hook=collections.OrderedDict).decode(f.read())
+    return __ALL_WORDPRESS_FUNCTIONS
+
+
+def getWordpressFunctionReturnTypes() -> Dict[str, List[str]]:
+    """Get the documented return types of every WordPress function."""
+    global __ALL_WORDPRESS_FUNCTION_RETURN_TYPES
+    if __ALL_WORDPRESS_FUNCTION_RETURN_TYPES is None:
+        __ALL_WORDPRESS_FUNCTION_RETURN_TYPES = {
+            k: v.get("returns", {}).get("types", []) for k, v in getWordpressFunctions().items()
+        }
+    return __ALL_WORDPRESS_FUNCTION_RETURN_TYPES
+
+
+def __getattr__(name: str):
+    # ALL_WORDPRESS_FUNCTIONS and ALL_WORDPRESS_FUNCTION_RETURN_TYPES used to be parsed at import time.
+    if name == "ALL_WORDPRESS_FUNCTIONS":
+        return getWordpressFunctions()
+    if name == "ALL_WORDPRESS_FUNCTION_RETURN_TYPES":
+        return getWordpressFunctionReturnTypes()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 DATA_TYPE_ATTACHMENT = frozenset({"attachment", "attachment_meta"})
 DATA_TYPE_ATTACHMENT_META = frozenset({"attachment_meta"})
@@ -185,7 +211,48 @@ DATA_TYPE_PHONE = frozenset({'phone'})
 EVALUATE_EXPRESSION_IGNORED = "AST_EMPTY"
 
 LRU_CACHE_SIZE = None
+# Memory bound and eviction policy ("lru" or "arc") of the node/children cache in NeoHelper (see NodeCache.py).
+NODE_CACHE_MAX_BYTES = int(os.getenv("NODE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+NODE_CACHE_POLICY = os.getenv("NODE_CACHE_POLICY", "lru")
+NODE_CACHE_PREFETCH = os.getenv("NODE_CACHE_PREFETCH", "1") == "1"  # Fetch nearby nodes along with a missed one
+# Keep resolved values and concatenated code across runs of the same plugin graph (see ValueCache.py).
+VALUE_CACHE = os.getenv("VALUE_CACHE", "0") == "1"
+VALUE_CACHE_PATH = os.getenv("VALUE_CACHE_PATH", os.path.join(ROOT_DIR, "results", "value_cache.sqlite"))
+VALUE_CACHE_VERSION = "2"  # Bump when the value resolver or concatTree change what they return
+# Also keep parsed SQL statements in the value cache file, shared by all plugins (see SQLParser.parseSQLStatement).
+SQL_PARSE_CACHE_PERSISTENT = os.getenv("SQL_PARSE_CACHE_PERSISTENT", "0") == "1"
+SQL_PARSE_CACHE_VERSION = "1"  # Bump when sqlparser.js or the parsed tuples change
+# Budget of one evaluateExpression call: nodes visited, and seconds. Past it the partial value is returned.
+VALUE_RESOLVER_MAX_VISITS = int(os.getenv("VALUE_RESOLVER_MAX_VISITS", "5000"))
+VALUE_RESOLVER_TIMEOUT = float(os.getenv("VALUE_RESOLVER_TIMEOUT", "60"))
+# Memory bound of the sub-expression values the resolver keeps between evaluateExpression calls.
+VALUE_RESOLVER_CACHE_MAX_BYTES = int(os.getenv("VALUE_RESOLVER_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
 MAX_NODE_CODE_LENGTH = 300  # Maximum length for a Neo4j node's code field -- limited by index
+IMPORT_BATCH_SIZE = 10000  # Rows sent per parameterized UNWIND query when importing preprocessed nodes/edges
+# Replay preprocessing steps saved by an earlier run. The database must not have those steps yet: reload it from the
+# NAVEX exports first (a step that is already fully in the graph is skipped, a partly imported one stops the run).
+PREPROCESS_RESUME = os.getenv("PREPROCESS_RESUME", "0") == "1"
+# Rebuild the database from the NAVEX exports with `neo4j-admin import` before preprocessing. Neo4j is stopped and
+# started with $NEO4J_HOME/bin/neo4j around the import, so this needs a local server that only this run uses.
+OFFLINE_IMPORT = os.getenv("OFFLINE_IMPORT", "0") == "1"
+OFFLINE_IMPORT_START_TIMEOUT = float(os.getenv("OFFLINE_IMPORT_START_TIMEOUT", "120"))  # Seconds to wait for Neo4j
+PREPROCESS_STEP_VERSION = "1"  # Bump when code called by the preprocessing steps changes what they write
+CLASS_HIERARCHY_VERSION = "1"  # Bump when ClassHierarchy or its snapshot format change
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", "1"))  # Tasks of one preprocessing step run concurrently
+SET_BASED_CALL_EDGES = os.getenv("SET_BASED_CALL_EDGES", "1") == "1"  # Build call argument edges with one query
+
+# Answer node/children/path lookups from an in-process copy of the graph (see MemoryGraph.py) instead of Neo4j.
+IN_MEMORY_GRAPH = os.getenv("IN_MEMORY_GRAPH", "0") == "1"
+# Answer data flow reachability/source/sink queries from an index built after preprocessing (see ReachabilityIndex.py).
+REACHABILITY_INDEX = os.getenv("REACHABILITY_INDEX", "1") == "1"
+# Match the detectors' call name patterns against an in-memory index of all calls (see CallNameIndex.py).
+CALL_NAME_INDEX = os.getenv("CALL_NAME_INDEX", "1") == "1"
+# Time every Cypher query by template and print a report at the end of the run (see QueryProfiler.py).
+QUERY_PROFILE = os.getenv("QUERY_PROFILE", "0") == "1"
+# Also save the query profile to the QueryProfile table of the results database.
+QUERY_PROFILE_DB = os.getenv("QUERY_PROFILE_DB", "0") == "1"
+# If set, the time, query count and peak memory of each analysis stage are written to this JSON file at exit.
+STAGE_METRICS_PATH = os.getenv("STAGE_METRICS_PATH", "")
 
 USEFUL_NODES = {
     "AST_VAR",
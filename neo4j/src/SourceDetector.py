@@ -6,7 +6,7 @@ from typing import Any, Dict, List, Optional, Set
 
 from ActionHook import ActionHook
 from DataFlows import DataNode
-from Detectors.Runtime import SECURITY_DETECTOR_MANAGER
+from Detectors.Runtime import getSecurityDetectorManager
 from Errors import DetectorManagerUninitializedException, SourceDetectorException
 from NeoGraph import getGraph
 from NeoHelper import (
@@ -51,15 +51,15 @@ class SinkDetector:
 
     @staticmethod
     def locateThirdPartySink():
-        if not SECURITY_DETECTOR_MANAGER:
+        if not getSecurityDetectorManager():
             raise DetectorManagerUninitializedException()
-        PHPCurlParty_detector = SECURITY_DETECTOR_MANAGER.get_detector("PhpCurlDetector")
+        PHPCurlParty_detector = getSecurityDetectorManager().get_detector("PhpCurlDetector")
         if PHPCurlParty_detector:
 
             for finding in PHPCurlParty_detector.findings:
                 print(finding)
 
-        WPRemote_detector = SECURITY_DETECTOR_MANAGER.get_detector("WordPressRemoteDetector")
+        WPRemote_detector = getSecurityDetectorManager().get_detector("WordPressRemoteDetector")
         if WPRemote_detector:
             for finding in WPRemote_detector.findings:
                 print(finding)
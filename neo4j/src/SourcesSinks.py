@@ -4,7 +4,7 @@
 
 from typing import Any, List, Set, Tuple
 
-from Detectors.Runtime import SECURITY_DETECTOR_MANAGER
+from Detectors.Runtime import getSecurityDetectorManager
 from Errors import DetectorManagerUninitializedException, SourceDetectorException
 from NeoGraph import getGraph
 from SQLParser import SQLParentNodeOperations
@@ -13,7 +13,7 @@ from SourceDetector import SourceDetector
 
 class SourceSinkManager:
     def __init__(self, include_sourcedetector: bool = True):
-        if not SECURITY_DETECTOR_MANAGER:
+        if not getSecurityDetectorManager():
             raise DetectorManagerUninitializedException()
 
         self.__sinks: Set[int] = set()
@@ -22,7 +22,7 @@ class SourceSinkManager:
         self.__personal: Set[int] = set()
 
         # Get sources and sinks from the detector manager.
-        for finding in SECURITY_DETECTOR_MANAGER.allFindings:
+        for finding in getSecurityDetectorManager().allFindings:
             if finding.score.is_source():
                 self.__sources.add(finding.node["id"])
             elif finding.score.is_sink():
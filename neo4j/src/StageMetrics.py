@@ -0,0 +1,79 @@
+# GDPR Checker project
+# Time, Cypher query count and peak memory of each stage of an analysis run, used by benchmark/Benchmark.py.
+#
+# Stages are marked with `with stage(name):`. They may be nested (the detectors run inside a preprocessing step) and
+# are recorded in the order they finish. Query counts come from the QueryProfiler, so they are only non-zero when
+# QUERY_PROFILE is enabled. Peak RSS is the process' high-water mark at the end of the stage.
+
+import atexit
+import json
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+from QueryProfiler import getQueryProfiler
+from Settings import STAGE_METRICS_PATH
+
+global __STAGES, __STAGES_LOCK
+__STAGES: List[Dict[str, Any]] = []
+__STAGES_LOCK = threading.Lock()
+__DEPTH = threading.local()
+
+
+def peakRSS() -> float:
+    """Get the peak resident set size of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+@contextmanager
+def stage(name: str):
+    """Record the time, queries and memory of the code run inside this context."""
+    depth = getattr(__DEPTH, "value", 0)
+    __DEPTH.value = depth + 1
+    queries = getQueryProfiler().calls
+    rss = peakRSS()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        __DEPTH.value = depth
+        record = {
+            "stage": name,
+            "depth": depth,
+            "seconds": time.perf_counter() - start,
+            "queries": getQueryProfiler().calls - queries,
+            "peak rss mb": peakRSS(),
+            "rss growth mb": peakRSS() - rss,
+        }
+        with __STAGES_LOCK:
+            __STAGES.append(record)
+
+
+def getStages() -> List[Dict[str, Any]]:
+    with __STAGES_LOCK:
+        return list(__STAGES)
+
+
+def writeStages(path: str = STAGE_METRICS_PATH):
+    """Write the recorded stages, the overall peak memory and the query profile to a JSON file."""
+    if not path:
+        return
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "stages": getStages(),
+                "peak rss mb": peakRSS(),
+                "queries": getQueryProfiler().calls,
+                "query profile": getQueryProfiler().report(limit=50),
+            },
+            f,
+            indent=2,
+        )
+
+
+atexit.register(writeStages)
@@ -0,0 +1,219 @@
+# GDPR Checker project
+# Propagation of taint labels (personal data types, encryption info) along data flow edges.
+#
+# The data flow subgraph reachable from the seed nodes is loaded once, its strongly connected components are collapsed
+# (every node of a cycle ends up with the same taint), and values are pushed through the resulting DAG in topological
+# order, so each edge is visited once instead of re-expanding the subgraph of every seed until the values converge.
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar
+
+from NeoGraph import getGraph
+
+T = TypeVar("T")
+
+
+class TaintGraph:
+    """Data flow graph reachable from a set of seed nodes, condensed into its strongly connected components.
+
+    Nodes are numbered densely in insertion order; `component[i]` is the component of node i, and components are
+    numbered in topological order (edges only go from lower to higher component numbers).
+    """
+
+    def __init__(self, seeds: Iterable[int], edges: Iterable[Tuple[int, int]]) -> None:
+        self.ids: List[int] = []
+        self._index: Dict[int, int] = dict()
+        self.seeds: List[int] = []
+        for s in seeds:
+            if s not in self._index:
+                self.seeds.append(s)
+            self._node(s)
+        adjacency: List[List[int]] = [[] for _ in self.ids]
+        for start, end in edges:
+            i = self._node(start)
+            j = self._node(end)
+            while len(adjacency) < len(self.ids):
+                adjacency.append([])
+            if i != j:
+                adjacency[i].append(j)
+        self._adjacency = adjacency
+        self.component: List[int] = []
+        self.members: List[List[int]] = []
+        self._condense()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def position(self, node_id: int) -> Optional[int]:
+        """Get the dense index of a node, or None if the node is not in the graph."""
+        return self._index.get(node_id, None)
+
+    def _node(self, node_id: int) -> int:
+        i = self._index.get(node_id, None)
+        if i is None:
+            i = len(self.ids)
+            self._index[node_id] = i
+            self.ids.append(node_id)
+        return i
+
+    def _condense(self) -> None:
+        """Tarjan's algorithm, iterative since data flow chains can be deeper than the recursion limit."""
+        n = len(self.ids)
+        adjacency = self._adjacency
+        index = [-1] * n
+        low = [0] * n
+        on_stack = [False] * n
+        stack: List[int] = []
+        emitted: List[List[int]] = []
+        counter = 0
+        for root in range(n):
+            if index[root] != -1:
+                continue
+            work = [(root, 0)]
+            while work:
+                v, child = work.pop()
+                if child == 0:
+                    index[v] = low[v] = counter
+                    counter += 1
+                    stack.append(v)
+                    on_stack[v] = True
+                recurse = False
+                successors = adjacency[v]
+                while child < len(successors):
+                    w = successors[child]
+                    child += 1
+                    if index[w] == -1:
+                        work.append((v, child))
+                        work.append((w, 0))
+                        recurse = True
+                        break
+                    elif on_stack[w]:
+                        low[v] = min(low[v], index[w])
+                if recurse:
+                    continue
+                if low[v] == index[v]:
+                    members = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        members.append(w)
+                        if w == v:
+                            break
+                    emitted.append(members)
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[v])
+        # Tarjan emits a component only after every component reachable from it, i.e. in reverse topological order.
+        emitted.reverse()
+        self.members = emitted
+        self.component = [0] * n
+        for c, members in enumerate(emitted):
+            for v in members:
+                self.component[v] = c
+
+    def component_successors(self) -> List[Set[int]]:
+        """Get the edges of the condensed DAG: the set of successor components of every component."""
+        successors: List[Set[int]] = [set() for _ in self.members]
+        for v, targets in enumerate(self._adjacency):
+            cv = self.component[v]
+            for w in targets:
+                cw = self.component[w]
+                if cw != cv:
+                    successors[cv].add(cw)
+        return successors
+
+    def propagate(self, values: Dict[int, T], join: Callable[[T, T], T]) -> Dict[int, T]:
+        """Compute, for every node, the join of the values of all seeds that reach it (including itself).
+
+        Args:
+            values (Dict[int, T]): Initial values, keyed by node id (normally the seeds).
+            join (Callable[[T, T], T]): Associative, commutative and idempotent merge of two values.
+
+        Returns:
+            Dict[int, T]: Value of every node reached by at least one initial value, keyed by node id.
+        """
+        component_values: List[Optional[T]] = [None] * len(self.members)
+        for node_id, value in values.items():
+            i = self._index.get(node_id, None)
+            if i is None:
+                continue
+            c = self.component[i]
+            current = component_values[c]
+            component_values[c] = value if current is None else join(current, value)
+
+        successors = self.component_successors()
+        for c in range(len(self.members)):
+            value = component_values[c]
+            if value is None:
+                continue
+            for d in successors[c]:
+                current = component_values[d]
+                component_values[d] = value if current is None else join(current, value)
+
+        result: Dict[int, T] = dict()
+        for c, members in enumerate(self.members):
+            value = component_values[c]
+            if value is None:
+                continue
+            for v in members:
+                result[self.ids[v]] = value
+        return result
+
+    @classmethod
+    def from_neo4j(cls, seeds: Iterable[int], relationship_types: List[str]) -> "TaintGraph":
+        """Load the data flow subgraph reachable from the seeds with a single query.
+
+        Args:
+            seeds (Iterable[int]): IDs of the seed nodes.
+            relationship_types (List[str]): Edge types to follow, e.g. DataFlowTracking.RELATIONSHIP_TYPES.
+        """
+        seeds = list(seeds)
+        relationship_filter = ">|".join(relationship_types) + ">"
+        query = """
+        MATCH (s) WHERE s.id IN $seeds
+        WITH collect(s) AS seeds
+        CALL apoc.path.subgraphNodes(seeds, {relationshipFilter: $filter}) YIELD node
+        MATCH (node)-[r]->(m)
+        WHERE type(r) IN $types
+        RETURN node.id AS start, m.id AS end
+        """
+        edges = []
+        if seeds:
+            result = getGraph().run(query, seeds=seeds, filter=relationship_filter, types=relationship_types)
+            edges = [(r["start"], r["end"]) for r in result]
+        return cls(seeds, edges)
+
+
+class BitSet:
+    """Maps a universe of hashable values to bit positions so that sets of them can be stored as Python ints.
+
+    Sets stored as ints are immutable and cheap to union (|), and equal sets propagated along a chain of nodes share
+    one object, which keeps the per-node `sources` sets of large plugins compact.
+    """
+
+    def __init__(self, universe: Iterable[Any] = ()) -> None:
+        self.values: List[Any] = []
+        self._bits: Dict[Any, int] = dict()
+        for v in universe:
+            self.bit(v)
+
+    def bit(self, value: Any) -> int:
+        b = self._bits.get(value, None)
+        if b is None:
+            b = len(self.values)
+            self._bits[value] = b
+            self.values.append(value)
+        return b
+
+    def encode(self, values: Iterable[Any]) -> int:
+        mask = 0
+        for v in values:
+            mask |= 1 << self.bit(v)
+        return mask
+
+    def decode(self, mask: int) -> List[Any]:
+        out = []
+        while mask:
+            low = mask & -mask
+            out.append(self.values[low.bit_length() - 1])
+            mask ^= low
+        return out
@@ -0,0 +1,177 @@
+# GDPR Checker project
+# Optional on-disk cache of resolved expression values and concatenated code.
+#
+# Results are stored in a SQLite file next to results.sqlite, keyed by a fingerprint of the plugin's input graph (see
+# NodeEdgeManager.computeInputHash), so analyzing the same plugin version again can skip value resolution and tree
+# concatenation. Nothing is read or written until a fingerprint has been set.
+#
+# Only calls on nodes of the input graph itself are cached. Nodes added by preprocessing get their ids from thread pools
+# and per-thread id blocks, so the same id can be a different node in the next run.
+
+import atexit
+import functools
+import os
+import pickle
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from Settings import VALUE_CACHE, VALUE_CACHE_PATH, VALUE_CACHE_VERSION
+
+# Number of new entries buffered before they are written.
+_FLUSH_EVERY = 1000
+
+MISSING = object()
+
+
+class Uncached(Exception):
+    """Raised by a function decorated with persistent_cache (and lru_cache) to return a value that must not be cached.
+
+    Use it for partial or failed results. Neither decorator stores a call that raises, so a public wrapper catches this
+    and returns `value`.
+    """
+
+    def __init__(self, value: Any) -> None:
+        super().__init__()
+        self.value = value
+
+
+class ValueCache:
+    """SQLite-backed key-value store, one table row per (fingerprint, function, arguments)."""
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS value_cache (
+                fingerprint TEXT NOT NULL,
+                function TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                PRIMARY KEY (fingerprint, function, key)
+            )""")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, str, str], bytes] = dict()
+        self.hits: Dict[str, int] = dict()
+        self.misses: Dict[str, int] = dict()
+
+    def get(self, fingerprint: str, function: str, key: str) -> Any:
+        with self._lock:
+            value = self._pending.get((fingerprint, function, key), None)
+            if value is None:
+                row = self._conn.execute(
+                    "SELECT value FROM value_cache WHERE fingerprint = ? AND function = ? AND key = ?",
+                    (fingerprint, function, key),
+                ).fetchone()
+                value = row[0] if row is not None else None
+        if value is None:
+            self.misses[function] = self.misses.get(function, 0) + 1
+            return MISSING
+        self.hits[function] = self.hits.get(function, 0) + 1
+        return pickle.loads(value)
+
+    def put(self, fingerprint: str, function: str, key: str, value: Any) -> None:
+        with self._lock:
+            self._pending[(fingerprint, function, key)] = pickle.dumps(value)
+            if len(self._pending) >= _FLUSH_EVERY:
+                self._flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        self._conn.executemany("INSERT OR REPLACE INTO value_cache VALUES (?, ?, ?, ?)",
+                               [(*k, v) for k, v in self._pending.items()])
+        self._conn.commit()
+        self._pending = dict()
+
+
+global __VALUE_CACHE, __FINGERPRINT, __MAX_NODE_ID, __VALUE_CACHE_LOCK
+__VALUE_CACHE: Optional[ValueCache] = None
+__FINGERPRINT: Optional[str] = None
+__MAX_NODE_ID: Optional[int] = None
+__VALUE_CACHE_LOCK = threading.Lock()
+
+
+def setCacheFingerprint(fingerprint: Optional[str], max_node_id: Optional[int]) -> None:
+    """Enable the disk cache (if VALUE_CACHE is set) for the plugin graph with this fingerprint.
+
+    Args:
+        fingerprint (Optional[str]): Fingerprint of the input graph, or None to disable the cache.
+        max_node_id (Optional[int]): Largest node id of the input graph (see NodeEdgeManager.computeInputMaxId). Calls
+            on larger ids, i.e. on nodes added by preprocessing, are not cached. None disables the cache.
+    """
+    global __VALUE_CACHE, __FINGERPRINT, __MAX_NODE_ID
+    if not VALUE_CACHE:
+        return
+    with __VALUE_CACHE_LOCK:
+        if __VALUE_CACHE is None:
+            __VALUE_CACHE = ValueCache(VALUE_CACHE_PATH)
+            atexit.register(__VALUE_CACHE.flush)
+        else:
+            __VALUE_CACHE.flush()
+        __FINGERPRINT = f"{VALUE_CACHE_VERSION}:{fingerprint}" if fingerprint and max_node_id is not None else None
+        if __FINGERPRINT is None:
+            print("Value cache disabled: the NAVEX exports of the input graph are not available to fingerprint it.")
+        __MAX_NODE_ID = max_node_id
+
+
+def getValueCache() -> Optional[ValueCache]:
+    return __VALUE_CACHE
+
+
+def isStableNodeId(node_id: Any) -> bool:
+    """Whether a node id belongs to the fingerprinted input graph, so it names the same node in every run."""
+    max_node_id = __MAX_NODE_ID
+    return isinstance(node_id, int) and max_node_id is not None and node_id <= max_node_id
+
+
+def persistent_cache(function: Optional[Callable] = None, *, persist_if: Optional[Callable[[Any], bool]] = None):
+    """Decorator that looks a call up in the disk cache before running it, and stores its result afterwards.
+
+    Put it below @lru_cache so repeated calls within a process stay in memory. The first argument must be a node id;
+    calls on nodes that are not in the input graph bypass the disk cache (see isStableNodeId). The other arguments
+    must have stable reprs. Calls that raise, e.g. Uncached, are not stored.
+
+    Args:
+        persist_if (Optional[Callable[[Any], bool]], optional): Only store results for which this returns True, e.g.
+            results that do not refer to unstable node ids.
+    """
+    if function is None:
+        return functools.partial(persistent_cache, persist_if=persist_if)
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def _wrapper(*args, **kwargs):
+        cache = __VALUE_CACHE
+        fingerprint = __FINGERPRINT
+        if cache is None or fingerprint is None or not args or not isStableNodeId(args[0]):
+            return function(*args, **kwargs)
+        key = repr((args, sorted(kwargs.items())))
+        value = cache.get(fingerprint, name, key)
+        if value is not MISSING:
+            return value
+        value = function(*args, **kwargs)
+        if persist_if is None or persist_if(value):
+            cache.put(fingerprint, name, key, value)
+        return value
+
+    return _wrapper
+
+
+def debug_value_cache_info() -> None:
+    """Print the disk cache hit rates per function."""
+    cache = __VALUE_CACHE
+    if cache is None:
+        return
+    for name in sorted(set(cache.hits) | set(cache.misses)):
+        hits = cache.hits.get(name, 0)
+        misses = cache.misses.get(name, 0)
+        print(f"{name}: {hits} disk cache hits, {misses} misses ({hits / max(hits + misses, 1):.1%} hit rate)")
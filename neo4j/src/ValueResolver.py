@@ -1,6 +1,13 @@
 from dataclasses import replace
 from typing import Any, Dict, List, Optional, Set, Tuple
-from Settings import LRU_CACHE_SIZE, MAX_NODE_CODE_LENGTH, ROOT_DIR
+from Settings import (
+    LRU_CACHE_SIZE,
+    MAX_NODE_CODE_LENGTH,
+    ROOT_DIR,
+    VALUE_RESOLVER_CACHE_MAX_BYTES,
+    VALUE_RESOLVER_MAX_VISITS,
+    VALUE_RESOLVER_TIMEOUT,
+)
 from functools import lru_cache
 from NeoHelper import cacheAllNodeChildren,getNode,concatTree,getNodeChildren,isUrlValid
 from DataFlowTracking import reverseTrackDataFlowToAssignNoRecord,getMaxTraversalLength
@@ -10,21 +17,54 @@ from json import dumps, loads
 from DataFlowTracking import getSources
 
 from NeoGraph import getGraph
+from NodeCache import BoundedCache
+from ValueCache import Uncached, isStableNodeId, persistent_cache
 
-import signal
-global _evaluateExpressionScopes
-_evaluateExpressionScopes: Set[int] = set()
+import time
 
-class TimeoutExceptionValueResolver(Exception):   # Custom exception class
-    print("Timeout in resolving values")
 
-def timeout_handler_value_resolver(signum, frame):   # Custom signal handler
-    raise TimeoutExceptionValueResolver
+class ResolutionBudget:
+    """Cooperative limit on the work done by one expression evaluation.
+
+    Every node visited by evaluateExpressionUnjoined is charged to the budget. Once the visit count or the deadline is
+    exceeded, the remaining nodes evaluate to nothing, so the caller gets the partial value resolved so far. Unlike a
+    SIGALRM timeout this works in any thread. The budget also holds the nodes already being evaluated, which stops
+    infinite recursion through data flow cycles.
+    """
+
+    def __init__(self, max_visits: int = VALUE_RESOLVER_MAX_VISITS, timeout: float = VALUE_RESOLVER_TIMEOUT):
+        self.max_visits = max_visits
+        self.deadline = time.monotonic() + timeout
+        self.visits = 0
+        self.exhausted = False
+        self.scopes: Set[int] = set()
+
+    def charge(self) -> bool:
+        """Charge one node visit. Returns False once the budget is exhausted."""
+        if not self.exhausted:
+            self.visits += 1
+            self.exhausted = self.visits > self.max_visits or time.monotonic() > self.deadline
+        return not self.exhausted
+
+
+# Results of evaluateExpressionUnjoined that were computed without running out of budget.
+global __UNJOINED_CACHE
+__UNJOINED_CACHE = BoundedCache(VALUE_RESOLVER_CACHE_MAX_BYTES)
+
+
+def clearValueResolverCache() -> None:
+    """Drop the cached sub-expression values, e.g. after new data flow edges have been committed."""
+    __UNJOINED_CACHE.clear()
+
+
+def _join(values: List[str], sources: Set[int]) -> Tuple[Optional[str], Set[int]]:
+    if values:
+        return ("".join(values), sources)
+    return (None, set())
 
-# Change the behavior of SIGALRM
-signal.signal(signal.SIGALRM, timeout_handler_value_resolver)
 
 @lru_cache(maxsize=LRU_CACHE_SIZE)
+@persistent_cache
 def evaluateURLExpression(expression_id:int) -> List[str]:
     """Attempt to statically evaluate an expression for URL
     The output of this function is cached for speed at the expense of memory.
@@ -49,13 +89,21 @@ def evaluateURLExpression(expression_id:int) -> List[str]:
                 urls.append(i['code'])
     return urls
 
-@lru_cache(maxsize=LRU_CACHE_SIZE)
 def evaluateExpressionSQL(
     expression_id: int, node_label: str = "AST"
 ) -> Tuple[Optional[str], Set[int]]:
     """Attempt to statically evaluate a SQL expression.
     This function is identical to evaluationExpression() apart from a special handling for tracking wpdb->prepare() statement
     """
+    try:
+        return _evaluateExpressionSQL(expression_id, node_label)
+    except Uncached as e:
+        return e.value
+
+
+@lru_cache(maxsize=LRU_CACHE_SIZE)
+def _evaluateExpressionSQL(expression_id: int, node_label: str) -> Tuple[Optional[str], Set[int]]:
+    """Cached part of evaluateExpressionSQL. Raises Uncached with a partial or failed result."""
     graph = getGraph()
     query = f"""
     MATCH (n:{node_label}{{id:{expression_id}}})<-[:PHP_REACHES{getMaxTraversalLength()}]-(m:AST{{type:'AST_METHOD_CALL'}})
@@ -65,16 +113,18 @@ def evaluateExpressionSQL(
     result = graph.evaluate(cypher=query)
     # print(result)
     if result:
-        return (evaluateExpression(result)[0], set())
+        try:
+            return (_evaluateExpression(result, "AST")[0], set())
+        except Uncached as e:
+            raise Uncached((e.value[0], set()))
     else:
-        return evaluateExpression(expression_id)
+        return _evaluateExpression(expression_id, "AST")
 
-@lru_cache(maxsize=LRU_CACHE_SIZE)
 def evaluateExpression(
     expression_id: int, node_label: str = "AST"
 ) -> Tuple[Optional[str], Set[int]]:
     """Attempt to statically evaluate an expression.
-    The output of this function is cached for speed at the expense of memory.
+    The output of this function is cached for speed at the expense of memory, unless the evaluation failed.
     Usage example: use this on the right-hand side of an AST_ASSIGN statement to try and statically
     resolve the resulting value of the variable.
     Args:
@@ -83,46 +133,73 @@ def evaluateExpression(
             Union[int, str]: An integer, string, or None depending on the value of the expression.
             Set[int]: List of sources for the expression that aren't constants (ints, strings, etc.)
     """
-    global _evaluateExpressionScopes
-    _evaluateExpressionScopes = set()
+    try:
+        return _evaluateExpression(expression_id, node_label)
+    except Uncached as e:
+        return e.value
+
+
+def _hasStableSources(result: Tuple[Optional[str], Set[int]]) -> bool:
+    return all(isStableNodeId(s) for s in result[1])
+
+
+@lru_cache(maxsize=LRU_CACHE_SIZE)
+@persistent_cache(persist_if=_hasStableSources)
+def _evaluateExpression(expression_id: int, node_label: str) -> Tuple[Optional[str], Set[int]]:
+    """Cached part of evaluateExpression. Raises Uncached with the result of a failed or cut short evaluation."""
     cacheAllNodeChildren(expression_id)
 
-    signal.alarm(60)   
+    budget = ResolutionBudget()
     try:
-        values, sources = evaluateExpressionUnjoined(expression_id, node_label)
+        values, sources = evaluateExpressionUnjoined(expression_id, node_label, budget)
     except:
-        return (None, set())
-    else:
-        signal.alarm(0)
-        if values:
-            return ("".join(values), sources)
-        else:
-            return (None, set())
+        raise Uncached((None, set()))
+    if budget.exhausted:
+        print(f"evaluateExpression: gave up on node {expression_id} after {budget.visits} nodes, using the partial value.")
+        raise Uncached(_join(values, sources))
+    return _join(values, sources)
 
 
-@lru_cache(maxsize=LRU_CACHE_SIZE)
 def evaluateExpressionUnjoined(
-    expression_id: int, node_label: str = "AST"
+    expression_id: int, node_label: str = "AST", budget: Optional[ResolutionBudget] = None
 ) -> Tuple[List[str], Set[int]]:
     """Attempt to statically evaluate an expression.
-    The output of this function is cached for speed at the expense of memory.
+    The output of this function is cached for speed at the expense of memory, unless it was cut short by the budget.
     Usage example: use this on the right-hand side of an AST_ASSIGN statement to try and statically
     resolve the resulting value of the variable.
     Args:
             expression_id (int): The root of the expression tree to evaluate.
+            budget (Optional[ResolutionBudget]): Budget shared by the whole evaluation. A new one is used if None.
     Returns:
             Union[int, str]: An integer, string, or None depending on the value of the expression.
             Set[int]: List of sources for the expression that aren't constants (ints, strings, etc.)
     """
+    key = (expression_id, node_label)
+    cached = __UNJOINED_CACHE.get(key)
+    if cached is not None:
+        return cached
+    if budget is None:
+        budget = ResolutionBudget()
 
     # Stop infinite recursion at the cost of accuracy.
-    global _evaluateExpressionScopes
-    if expression_id in _evaluateExpressionScopes:
+    if expression_id in budget.scopes:
         # print("evaluateExpression error: stopping infinite recursion.")
         return [], set()
-    else:
-        _evaluateExpressionScopes.add(expression_id)
+    budget.scopes.add(expression_id)
+
+    # Out of budget: return what has been resolved so far.
+    if not budget.charge():
+        return [], set()
+
+    result = __evaluateNode(expression_id, node_label, budget)
+    if not budget.exhausted:
+        values, sources = result
+        __UNJOINED_CACHE.put(key, result, size=200 + sum(len(v) for v in values) + 64 * len(sources))
+    return result
+
 
+def __evaluateNode(expression_id: int, node_label: str, budget: ResolutionBudget) -> Tuple[List[str], Set[int]]:
+    """Evaluate one node of an expression tree for evaluateExpressionUnjoined."""
     cacheAllNodeChildren(expression_id, node_label=node_label)
 
     n = getNode(expression_id)
@@ -159,7 +236,7 @@ def evaluateExpressionUnjoined(
             return [concatTree(expression_id)], {n["id"]}
         var = var['id']
         # Evaluate the RHS of the assignment.
-        value, sources = evaluateExpressionUnjoined(var)
+        value, sources = evaluateExpressionUnjoined(var, budget=budget)
         # If could not be resolved, return the variable's name rather than nothing.
         if not value and not sources:
             return [concatTree(expression_id)], {n["id"]}
@@ -199,7 +276,7 @@ def evaluateExpressionUnjoined(
         if not children or len(children) < 2:
             return [], set()
         rhs = children[1]
-        value, sources = evaluateExpressionUnjoined(rhs["id"])
+        value, sources = evaluateExpressionUnjoined(rhs["id"], budget=budget)
         return value, sources
 
     elif n.get("type", "") == "AST_CONDITIONAL":
@@ -210,7 +287,7 @@ def evaluateExpressionUnjoined(
         output_values = list()
         output_sources = set()
         for c in children[1:]:
-            v, s = evaluateExpressionUnjoined(c["id"])
+            v, s = evaluateExpressionUnjoined(c["id"], budget=budget)
             output_sources.update(s)
             output_values.extend(v)
         return output_values, output_sources
@@ -230,7 +307,7 @@ def evaluateExpressionUnjoined(
         output_values = list()
         output_sources = set()
         for c in children:
-            v, s = evaluateExpressionUnjoined(c["id"])
+            v, s = evaluateExpressionUnjoined(c["id"], budget=budget)
             output_sources.update(s)
             output_values.extend(v)
         #print("value")
@@ -258,7 +335,7 @@ def evaluateExpressionUnjoined(
         output_values = list()
         output_sources = set()
         for c in children:
-            v, s = evaluateExpressionUnjoined(c["id"])
+            v, s = evaluateExpressionUnjoined(c["id"], budget=budget)
             output_sources.update(s)
             output_values.extend(v)
         return output_values, output_sources
@@ -279,7 +356,7 @@ def evaluateExpressionUnjoined(
             args = getNodeChildren(children[1].get("id", -1))
             if not args:
                 return [], set()
-            return evaluateExpressionUnjoined(args[0]["id"])
+            return evaluateExpressionUnjoined(args[0]["id"], budget=budget)
         else:
             return [concatTree(expression_id)], set()
     elif n.get("type", "") == "AST_METHOD_CALL":
@@ -296,7 +373,7 @@ def evaluateExpressionUnjoined(
         result = graph.evaluate(cypher=query)
         # print(result)
         if result:
-            values = [evaluateExpression(i)[0] for i in result]
+            values = [_join(*evaluateExpressionUnjoined(i, budget=budget))[0] for i in result]
             # print(values)
             sql = values[0]
             del values[0]
@@ -332,8 +409,8 @@ def evaluateExpressionUnjoined(
 
         output_value = ""
         output_sources = set()
-        container_values, container_sources = evaluateExpressionUnjoined(children[0]["id"])
-        key_values, key_sources = evaluateExpressionUnjoined(children[1]["id"])
+        container_values, container_sources = evaluateExpressionUnjoined(children[0]["id"], budget=budget)
+        key_values, key_sources = evaluateExpressionUnjoined(children[1]["id"], budget=budget)
         output_sources.update(container_sources)
         output_sources.update(key_sources)
         output_value = f"""{"".join(container_values)}_{"".join(key_values)}"""
@@ -341,11 +418,12 @@ def evaluateExpressionUnjoined(
 
     elif n.get("type", "") == "AST_PROP":
         #use data flow to determine if there is a single value that flows to this AST_PROP
+        #a single source reached through several paths counts as one, whichever backend getSources uses
 
         sources = getSources(expression_id)
 
         if sources and len(sources)==1 and not sources[0]['id']==expression_id:
-            value,source = evaluateExpressionUnjoined(sources[0]['id'])
+            value,source = evaluateExpressionUnjoined(sources[0]['id'], budget=budget)
 
             return value,source
         # Simply return the strings concatenated together.
@@ -355,8 +433,8 @@ def evaluateExpressionUnjoined(
 
         output_value = ""
         output_sources = set()
-        container_values, container_sources = evaluateExpressionUnjoined(children[0]["id"])
-        key_values, key_sources = evaluateExpressionUnjoined(children[1]["id"])
+        container_values, container_sources = evaluateExpressionUnjoined(children[0]["id"], budget=budget)
+        key_values, key_sources = evaluateExpressionUnjoined(children[1]["id"], budget=budget)
         output_sources.update(container_sources)
         output_sources.update(key_sources)
         output_value = f"""{"".join(container_values)}_{"".join(key_values)}"""
@@ -371,7 +449,7 @@ def evaluateExpressionUnjoined(
         output_values_dict = dict()
         output_sources = set()
         for child in children:
-            container_values, container_sources = evaluateExpressionUnjoined(child["id"])
+            container_values, container_sources = evaluateExpressionUnjoined(child["id"], budget=budget)
             try:
                 vals = loads(container_values[0])
                 if len(vals) == 2:
@@ -394,7 +472,7 @@ def evaluateExpressionUnjoined(
         output_values = []
         output_sources = set()
         for child in children:
-            container_values, container_sources = evaluateExpressionUnjoined(child["id"])
+            container_values, container_sources = evaluateExpressionUnjoined(child["id"], budget=budget)
             if container_values:
                 output_values.append(container_values[0])
             output_sources.update(container_sources)
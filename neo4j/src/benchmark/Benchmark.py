@@ -0,0 +1,186 @@
+# GDPR Checker project
+# Benchmark the analysis on synthetic plugins of increasing size.
+#
+# Each plugin is generated with SyntheticPlugin.py, loaded into a graph store by the given load command (the same
+# command BatchRun.py takes, e.g. the NAVEX export and Neo4j import) and analyzed by Main.py in its own process with
+# QUERY_PROFILE enabled. Main.py writes the time, query count and peak RSS of every stage (see StageMetrics.py), which
+# are collected into one JSON file per benchmark run. Two such files can be compared with --compare.
+#
+#   python benchmark/Benchmark.py --scales 1 4 16 -c "./load-plugin.sh {path} {port}" -o before.json
+#   python benchmark/Benchmark.py --compare before.json after.json
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")))
+
+from BatchRun import GraphStore, PluginJob, run_plugin
+from Settings import NEO4J_BOLT_PORT, NEO4J_DATABASE, NEO4J_HOST, ROOT_DIR, SRC_DIR
+from benchmark.SyntheticPlugin import PluginSize, generate_plugin
+
+# Bumped whenever the layout of the output changes, so old and new files are not compared by accident.
+BENCHMARK_FORMAT = 1
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=SRC_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    scales: List[int],
+    store: GraphStore,
+    work_dir: str,
+    load_command: str,
+    in_memory: bool = False,
+    timeout: Optional[float] = None,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """Generate and analyze one synthetic plugin per scale.
+
+    Args:
+        scales (List[int]): Plugin sizes, see PluginSize.scaled.
+        store (GraphStore): Graph store the plugins are loaded into.
+        work_dir (str): Directory for the generated plugins, logs and results database.
+        load_command (str): Command that loads a plugin into the store, see BatchRun.run_plugin. Without it every
+            scale would analyze whatever graph the store already holds.
+        in_memory (bool, optional): Answer graph lookups from the in-memory graph. Defaults to False.
+        timeout (Optional[float], optional): Seconds allowed per plugin. Defaults to no limit.
+        seed (int, optional): Seed of the plugin generator. Defaults to 0.
+
+    Returns:
+        Dict[str, Any]: The benchmark results, as written to the JSON file.
+    """
+    if not load_command:
+        raise ValueError("a load command is needed to load each synthetic plugin into the store")
+    plugins_dir = os.path.join(work_dir, "plugins")
+    logs_dir = os.path.join(work_dir, "logs")
+    os.makedirs(plugins_dir, exist_ok=True)
+    os.makedirs(logs_dir, exist_ok=True)
+    database = os.path.join(work_dir, "results.sqlite")
+
+    runs: List[Dict[str, Any]] = []
+    for scale in scales:
+        name = f"synthetic-{scale}"
+        size = PluginSize.scaled(scale)
+        generated = generate_plugin(plugins_dir, name, size, seed=seed)
+        metrics_path = os.path.join(logs_dir, f"{name}_stages.json")
+        if os.path.exists(metrics_path):
+            os.remove(metrics_path)
+        env = {
+            "QUERY_PROFILE": "1",
+            "STAGE_METRICS_PATH": metrics_path,
+            "IN_MEMORY_GRAPH": "1" if in_memory else "0",
+        }
+        print(f"Running {name} ({generated['php lines']} PHP lines, {generated['js lines']} JS lines)... ", end="")
+        sys.stdout.flush()
+        result = run_plugin(
+            PluginJob(name, os.path.join(plugins_dir, name)), store, database, logs_dir, timeout, 0, load_command, env
+        )
+        print(f"{result.status} in {result.seconds:.1f}s")
+
+        metrics: Dict[str, Any] = dict()
+        if os.path.exists(metrics_path):
+            with open(metrics_path, "r") as f:
+                metrics = json.load(f)
+        runs.append({
+            "plugin": name,
+            "scale": scale,
+            "size": size._asdict(),
+            "generated": generated,
+            "status": result.status,
+            "seconds": result.seconds,
+            "queries": metrics.get("queries", 0),
+            "peak rss mb": metrics.get("peak rss mb", 0),
+            "stages": metrics.get("stages", []),
+            "query profile": metrics.get("query profile", []),
+            "log": result.log,
+        })
+
+    return {
+        "format": BENCHMARK_FORMAT,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "backend": "memory" if in_memory else "neo4j",
+        "seed": seed,
+        "runs": runs,
+    }
+
+
+def compare(before: Dict[str, Any], after: Dict[str, Any]):
+    """Print the time and query count of every stage of two benchmark results side by side."""
+    if before.get("format") != after.get("format"):
+        print(f"Warning: comparing benchmark formats {before.get('format')} and {after.get('format')}")
+    print(f"before: {before.get('commit')} ({before.get('backend')}), after: {after.get('commit')} ({after.get('backend')})")
+    after_runs = {r["plugin"]: r for r in after["runs"]}
+    for old in before["runs"]:
+        new = after_runs.get(old["plugin"], None)
+        if new is None:
+            continue
+        print(f"\n{old['plugin']}: {old['status']} -> {new['status']}")
+        print(f"{'stage':<60} {'before':>9} {'after':>9} {'ratio':>6} {'queries':>17} {'peak rss':>17}")
+        rows = [("total", old, new)]
+        new_stages = {s["stage"]: s for s in new["stages"]}
+        rows.extend(
+            ("  " * s["depth"] + s["stage"], s, new_stages[s["stage"]]) for s in old["stages"] if s["stage"] in new_stages
+        )
+        for label, a, b in rows:
+            ratio = b["seconds"] / a["seconds"] if a["seconds"] else float("nan")
+            label = label if len(label) <= 60 else label[:57] + "..."
+            print(
+                f"{label:<60} {a['seconds']:8.2f}s {b['seconds']:8.2f}s {ratio:5.2f}x "
+                f"{a['queries']:>8}/{b['queries']:<8} {a['peak rss mb']:>7.0f}/{b['peak rss mb']:<7.0f}MB"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analysis on synthetic WordPress plugins.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 4, 16], help="Sizes of the generated plugins.")
+    parser.add_argument("-g", "--graph", default="", help="Graph store as [host][:port][/database].")
+    parser.add_argument(
+        "-c", "--load-command", help="Shell command that loads a plugin's graph into the store; required unless --compare."
+    )
+    parser.add_argument("--in-memory", action="store_true", help="Answer graph lookups from the in-memory graph.")
+    parser.add_argument("-t", "--timeout", type=float, default=None, help="Seconds allowed per plugin.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the plugin generator.")
+    parser.add_argument("-w", "--work-dir", default=None, help="Directory for the generated plugins and logs.")
+    parser.add_argument(
+        "-o", "--output", default=os.path.join(ROOT_DIR, "results", "benchmark.json"), help="Output JSON file."
+    )
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Compare two benchmark results.")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], "r") as f:
+            before = json.load(f)
+        with open(args.compare[1], "r") as f:
+            after = json.load(f)
+        compare(before, after)
+        return
+    if not args.load_command:
+        parser.error("-c/--load-command is required to load each synthetic plugin into the store")
+
+    store = GraphStore.parse(args.graph) if args.graph else GraphStore(NEO4J_HOST, NEO4J_BOLT_PORT, NEO4J_DATABASE)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="gdpr-benchmark-")
+    results = run_benchmark(args.scales, store, work_dir, args.load_command, args.in_memory, args.timeout, args.seed)
+    os.makedirs(os.path.dirname(os.path.realpath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
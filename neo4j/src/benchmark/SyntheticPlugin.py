@@ -0,0 +1,371 @@
+# GDPR Checker project
+# Generator for synthetic WordPress plugins of a controllable size, used by Benchmark.py.
+#
+# A generated plugin has the parts the analysis spends its time on: classes with an inheritance chain, action and
+# filter hooks, $wpdb tables with inserts and prepared queries, user meta, HTML forms with personal data fields, the
+# jQuery AJAX calls that submit them, hashing and remote API calls. Only some stores register a personal data exporter
+# or eraser, so the path analyzer also has violations to report. The output depends only on the size and the seed.
+
+import os
+import random
+import re
+from typing import Dict, List, NamedTuple
+
+PII_FIELDS = ["email", "first_name", "last_name", "phone", "address", "city", "zipcode", "birthday", "username"]
+
+
+class PluginSize(NamedTuple):
+    classes: int = 2
+    methods_per_class: int = 4
+    hooks: int = 4
+    tables: int = 1
+    forms: int = 1
+    pii_fields: int = 4
+
+    @classmethod
+    def scaled(cls, scale: int) -> "PluginSize":
+        """A plugin that grows linearly with scale; scale 1 is a few hundred lines of PHP."""
+        return cls(
+            classes=2 * scale,
+            methods_per_class=4,
+            hooks=4 * scale,
+            tables=max(1, scale // 2),
+            forms=scale,
+            pii_fields=min(len(PII_FIELDS), 3 + scale // 4),
+        )
+
+
+def _fill(template: str, **values) -> str:
+    """Replace @@name@@ placeholders; PHP and JS use both $ and braces, so str.format/Template do not fit."""
+    return re.sub(r"@@(\w+)@@", lambda m: str(values[m.group(1)]), template)
+
+
+_MAIN_FILE = """<?php
+/**
+ * Plugin Name: @@title@@
+ * Description: Synthetic plugin generated for benchmarking.
+ * Version: 1.0.0
+ */
+
+defined( 'ABSPATH' ) || exit;
+
+@@requires@@
+
+register_activation_hook( __FILE__, '@@prefix@@_install' );
+
+function @@prefix@@_install() {
+	global $wpdb;
+	require_once ABSPATH . 'wp-admin/includes/upgrade.php';
+	$charset_collate = $wpdb->get_charset_collate();
+@@create_tables@@
+}
+
+function @@prefix@@_enqueue_scripts() {
+@@enqueue@@
+}
+add_action( 'wp_enqueue_scripts', '@@prefix@@_enqueue_scripts' );
+
+@@shortcodes@@
+
+@@instances@@
+"""
+
+_CREATE_TABLE = """	$table_name = $wpdb->prefix . '@@table@@';
+	$sql = "CREATE TABLE $table_name (
+		id mediumint(9) NOT NULL AUTO_INCREMENT,
+@@columns@@
+		created datetime DEFAULT '0000-00-00 00:00:00' NOT NULL,
+		PRIMARY KEY  (id)
+	) $charset_collate;";
+	dbDelta( $sql );
+"""
+
+_ENQUEUE = """	wp_enqueue_script( '@@slug@@-form-@@i@@', plugins_url( 'assets/js/form-@@i@@.js', __FILE__ ), array( 'jquery' ), '1.0.0', true );
+	wp_localize_script( '@@slug@@-form-@@i@@', '@@prefix@@_ajax_@@i@@', array(
+		'ajaxurl' => admin_url( 'admin-ajax.php' ),
+		'nonce'   => wp_create_nonce( '@@prefix@@_save_@@i@@' ),
+	) );
+"""
+
+_SHORTCODE = """function @@prefix@@_form_@@i@@_shortcode() {
+	ob_start();
+	include plugin_dir_path( __FILE__ ) . 'templates/form-@@i@@.php';
+	return ob_get_clean();
+}
+add_shortcode( '@@slug@@_form_@@i@@', '@@prefix@@_form_@@i@@_shortcode' );
+"""
+
+_BASE_CLASS = """<?php
+
+interface @@class_prefix@@_Storage {
+	public function save();
+	public function get_entries( $email );
+}
+
+abstract class @@class_prefix@@_Base_Store implements @@class_prefix@@_Storage {
+	protected $table;
+	protected $meta_prefix = '@@prefix@@_';
+
+	public function __construct( $table ) {
+		global $wpdb;
+		$this->table = $wpdb->prefix . $table;
+	}
+
+	protected function clean( $value ) {
+		return sanitize_text_field( wp_unslash( $value ) );
+	}
+
+	public function get_entries( $email ) {
+		global $wpdb;
+		return $wpdb->get_results( $wpdb->prepare( "SELECT * FROM {$this->table} WHERE email = %s", $email ), ARRAY_A );
+	}
+
+	public function delete_entries( $email ) {
+		global $wpdb;
+		return $wpdb->delete( $this->table, array( 'email' => $email ) );
+	}
+}
+"""
+
+_STORE_CLASS = """<?php
+
+class @@class_name@@ extends @@parent@@ {
+	private $remote_url = 'https://api.example-@@i@@.com/v1/subscribe';
+
+	public function __construct() {
+		parent::__construct( '@@table@@' );
+		add_action( 'wp_ajax_@@prefix@@_save_@@form@@', array( $this, 'save' ) );
+		add_action( 'wp_ajax_nopriv_@@prefix@@_save_@@form@@', array( $this, 'save' ) );
+@@privacy_hooks@@
+	}
+
+	public function save() {
+		global $wpdb;
+		check_ajax_referer( '@@prefix@@_save_@@form@@', 'nonce' );
+@@read_fields@@
+		$wpdb->insert( $this->table, array(
+@@insert_fields@@
+			'created' => current_time( 'mysql' ),
+		) );
+		$user_id = get_current_user_id();
+		if ( $user_id ) {
+			update_user_meta( $user_id, $this->meta_prefix . '@@meta_field@@', $@@meta_field@@ );
+		}
+		$token = wp_hash( $email . wp_salt() );
+		update_option( $this->meta_prefix . 'last_token_@@i@@', md5( $token ) );
+		wp_remote_post( $this->remote_url, array( 'body' => array( 'email' => $email, 'token' => $token ) ) );
+		wp_send_json_success( array( 'id' => $wpdb->insert_id ) );
+	}
+@@exporter@@
+@@methods@@
+}
+"""
+
+_EXPORTER = """
+	public function register_exporter( $exporters ) {
+		$exporters['@@prefix@@-@@i@@'] = array(
+			'exporter_friendly_name' => '@@title@@ @@i@@',
+			'callback'               => array( $this, 'export' ),
+		);
+		return $exporters;
+	}
+
+	public function export( $email, $page = 1 ) {
+		$data = array();
+		foreach ( $this->get_entries( $email ) as $row ) {
+			$data[] = array(
+				'group_id'    => '@@prefix@@_@@i@@',
+				'group_label' => '@@title@@',
+				'item_id'     => 'entry-' . $row['id'],
+				'data'        => array( array( 'name' => 'Email', 'value' => $row['email'] ) ),
+			);
+		}
+		return array( 'data' => $data, 'done' => true );
+	}
+
+	public function register_eraser( $erasers ) {
+		$erasers['@@prefix@@-@@i@@'] = array(
+			'eraser_friendly_name' => '@@title@@ @@i@@',
+			'callback'             => array( $this, 'erase' ),
+		);
+		return $erasers;
+	}
+
+	public function erase( $email, $page = 1 ) {
+		$removed = $this->delete_entries( $email );
+		return array( 'items_removed' => (bool) $removed, 'items_retained' => false, 'messages' => array(), 'done' => true );
+	}
+"""
+
+_PRIVACY_HOOKS = """		add_filter( 'wp_privacy_personal_data_exporters', array( $this, 'register_exporter' ) );
+		add_filter( 'wp_privacy_personal_data_erasers', array( $this, 'register_eraser' ) );"""
+
+_METHOD = """
+	public function format_@@m@@( $input ) {
+		$value = $this->clean( $input );
+		$parts = explode( ' ', $value );
+		$result = implode( '-', array_map( 'strtolower', $parts ) );
+		return apply_filters( '@@prefix@@_format_@@i@@_@@m@@', $result, $input );
+	}
+"""
+
+_HOOK = """
+function @@prefix@@_hook_@@h@@( $user_id ) {
+	$value = get_user_meta( $user_id, '@@prefix@@_@@field@@', true );
+	if ( ! empty( $value ) ) {
+		do_action( '@@prefix@@_@@field@@_seen', $user_id, $value );
+		set_transient( '@@prefix@@_seen_' . $user_id, sanitize_text_field( $value ), DAY_IN_SECONDS );
+	}
+	return $value;
+}
+add_action( '@@action@@', '@@prefix@@_hook_@@h@@' );
+"""
+
+_FORM = """<form id="@@slug@@-form-@@i@@" class="@@slug@@-form" method="post">
+@@inputs@@
+	<button type="submit"><?php echo esc_html__( 'Submit', '@@slug@@' ); ?></button>
+</form>
+"""
+
+_FORM_INPUT = """	<p>
+		<label for="@@slug@@-@@i@@-@@field@@"><?php echo esc_html( '@@label@@' ); ?></label>
+		<input type="@@type@@" id="@@slug@@-@@i@@-@@field@@" name="@@field@@" value="" />
+	</p>"""
+
+_SCRIPT = """jQuery(document).ready(function ($) {
+	$('#@@slug@@-form-@@i@@').on('submit', function (event) {
+		event.preventDefault();
+		var form = $(this);
+		$.post(@@prefix@@_ajax_@@i@@.ajaxurl, {
+			action: '@@prefix@@_save_@@i@@',
+			nonce: @@prefix@@_ajax_@@i@@.nonce,
+@@fields@@
+		}, function (response) {
+			form.find('input').val('');
+		});
+	});
+});
+"""
+
+_UNINSTALL = """<?php
+
+if ( ! defined( 'WP_UNINSTALL_PLUGIN' ) ) {
+	exit;
+}
+
+global $wpdb;
+@@drops@@
+delete_option( '@@prefix@@_settings' );
+"""
+
+_HOOK_ACTIONS = ["user_register", "profile_update", "wp_login", "show_user_profile", "personal_options_update"]
+
+
+def generate_plugin(directory: str, name: str, size: PluginSize, seed: int = 0) -> Dict[str, int]:
+    """Write a synthetic plugin to directory/name.
+
+    Args:
+        directory (str): Parent directory of the plugin.
+        name (str): Plugin slug, used for the directory, file, function and table names.
+        size (PluginSize): How many classes, hooks, tables and forms to generate.
+        seed (int, optional): Seed for the choices of fields and hooks. Defaults to 0.
+
+    Returns:
+        Dict[str, int]: Number of files and lines written, by language.
+    """
+    rng = random.Random(seed)
+    slug = re.sub(r"[^a-z0-9-]", "-", name.lower())
+    prefix = slug.replace("-", "_")
+    class_prefix = "_".join(p.capitalize() for p in prefix.split("_"))
+    title = " ".join(p.capitalize() for p in prefix.split("_"))
+    fields = PII_FIELDS[: size.pii_fields]
+    tables = [f"{prefix}_t{k}" for k in range(size.tables)]
+    forms = max(1, size.forms)
+    common = dict(slug=slug, prefix=prefix, class_prefix=class_prefix, title=title)
+
+    files: Dict[str, str] = dict()
+    files["includes/class-base-store.php"] = _fill(_BASE_CLASS, **common)
+
+    requires: List[str] = ["require_once plugin_dir_path( __FILE__ ) . 'includes/class-base-store.php';"]
+    instances: List[str] = []
+    for i in range(size.classes):
+        form = i % forms
+        class_name = f"{class_prefix}_Store_{i}"
+        # Every third store extends the previous one, giving the class hierarchy some depth.
+        parent = f"{class_prefix}_Store_{i - 1}" if i % 3 == 2 else f"{class_prefix}_Base_Store"
+        with_exporter = i % 2 == 0
+        methods = "".join(_fill(_METHOD, m=m, i=i, **common) for m in range(size.methods_per_class))
+        files[f"includes/class-store-{i}.php"] = _fill(
+            _STORE_CLASS,
+            class_name=class_name,
+            parent=parent,
+            i=i,
+            form=form,
+            table=tables[i % len(tables)],
+            meta_field=rng.choice(fields),
+            privacy_hooks=_PRIVACY_HOOKS if with_exporter else "",
+            exporter=_fill(_EXPORTER, i=i, **common) if with_exporter else "",
+            read_fields="\n".join(
+                f"\t\t${f} = isset( $_POST['{f}'] ) ? $this->clean( $_POST['{f}'] ) : '';" for f in fields
+            ).replace("$this->clean( $_POST['email'] )", "sanitize_email( $_POST['email'] )"),
+            insert_fields="\n".join(f"\t\t\t'{f}' => ${f}," for f in fields),
+            methods=methods,
+            **common,
+        )
+        requires.append(f"require_once plugin_dir_path( __FILE__ ) . 'includes/class-store-{i}.php';")
+        instances.append(f"${prefix}_store_{i} = new {class_name}();")
+
+    hooks = []
+    for h in range(size.hooks):
+        hooks.append(_fill(_HOOK, h=h, field=rng.choice(fields), action=rng.choice(_HOOK_ACTIONS), **common))
+    files["includes/hooks.php"] = "<?php\n" + "".join(hooks)
+    requires.append("require_once plugin_dir_path( __FILE__ ) . 'includes/hooks.php';")
+
+    columns = "\n".join(f"\t\t{f} varchar(255) DEFAULT '' NOT NULL," for f in fields)
+    files[f"{slug}.php"] = _fill(
+        _MAIN_FILE,
+        requires="\n".join(requires),
+        create_tables="".join(_fill(_CREATE_TABLE, table=t, columns=columns) for t in tables),
+        enqueue="".join(_fill(_ENQUEUE, i=i, **common) for i in range(forms)),
+        shortcodes="\n".join(_fill(_SHORTCODE, i=i, **common) for i in range(forms)),
+        instances="\n".join(instances),
+        **common,
+    )
+
+    for i in range(forms):
+        inputs = "\n".join(
+            _fill(
+                _FORM_INPUT,
+                i=i,
+                field=f,
+                label=f.replace("_", " ").title(),
+                type="email" if f == "email" else "text",
+                **common,
+            )
+            for f in fields
+        )
+        files[f"templates/form-{i}.php"] = _fill(_FORM, i=i, inputs=inputs, **common)
+        files[f"assets/js/form-{i}.js"] = _fill(
+            _SCRIPT,
+            i=i,
+            fields="\n".join(f"\t\t\t{f}: form.find('input[name={f}]').val()," for f in fields),
+            **common,
+        )
+
+    # Only half of the tables are dropped on uninstall.
+    files["uninstall.php"] = _fill(
+        _UNINSTALL,
+        drops="\n".join(f"$wpdb->query( \"DROP TABLE IF EXISTS {{$wpdb->prefix}}{t}\" );" for t in tables[::2]),
+        **common,
+    )
+
+    stats = {"files": 0, "php lines": 0, "js lines": 0}
+    root = os.path.join(directory, slug)
+    for path, content in files.items():
+        full_path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w") as f:
+            f.write(content)
+        stats["files"] += 1
+        stats["js lines" if path.endswith(".js") else "php lines"] += content.count("\n")
+    return stats
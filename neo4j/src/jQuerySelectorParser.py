@@ -3,7 +3,7 @@ from NeoGraph import getGraph
 import re
 import json
 from Settings import SRC_DIR
-from Naked.toolshed.shell import muterun_js
+from preprocessing.utils.NodeWorkerPool import runJS
 import os
 
 def getSelectedHTMLFormInputs(selector_statement:str):
@@ -118,9 +118,7 @@ def parseJQuerySelector(selector_statement:str):
     return allProperties
 
 def parseSelectorWithParsel(selector:str):
-    selectorString = selector.replace("'","\\'")
-    selectorString = f"$'{selectorString}'"
-    response = muterun_js(os.path.join(SRC_DIR,"selectorParser.js"), arguments=f"""{selectorString}""")
+    response = runJS(os.path.join(SRC_DIR,"selectorParser.js"), [selector])
     response = response.stdout.decode("utf-8")
     if not response:
         return []
@@ -0,0 +1,87 @@
+// GDPR Checker project
+// Long-lived Node.js worker for NodeWorkerPool.py.
+//
+// Reads one JSON request per line from stdin, {"id": ..., "script": ..., "args": [...]}, runs the script (e.g.
+// sqlparser.js or htmlparser.js) in this process as if it had been started with `node script args...`, and writes
+// {"id": ..., "stdout": ..., "stderr": ..., "exitcode": ...} as one line to stdout. Only output written synchronously
+// is captured; anything a script writes later goes to stderr so it cannot corrupt the responses, and NodeWorkerPool.py
+// reruns a script that succeeded without output in its own process. Dependencies stay loaded between requests.
+
+const path = require("path");
+const readline = require("readline");
+const util = require("util");
+
+class ScriptExit extends Error {
+    constructor(code) {
+        super(`exit ${code}`);
+        this.code = code;
+    }
+}
+
+const writeResponse = process.stdout.write.bind(process.stdout);
+const nodeArgv = process.argv.slice(0, 1);
+
+// Output outside of runScript, e.g. from a script's callbacks, must not end up between the responses.
+process.stdout.write = process.stderr.write.bind(process.stderr);
+console.log = console.error;
+
+function runScript(script, args) {
+    const stdout = [];
+    const stderr = [];
+    const saved = {
+        argv: process.argv,
+        exit: process.exit,
+        stdoutWrite: process.stdout.write,
+        stderrWrite: process.stderr.write,
+        log: console.log,
+        error: console.error,
+        warn: console.warn,
+    };
+    process.argv = nodeArgv.concat([script], args);
+    process.exit = (code) => {
+        throw new ScriptExit(code || 0);
+    };
+    process.stdout.write = (chunk) => stdout.push(String(chunk)) > 0;
+    process.stderr.write = (chunk) => stderr.push(String(chunk)) > 0;
+    console.log = (...a) => stdout.push(util.format(...a) + "\n");
+    console.error = console.warn = (...a) => stderr.push(util.format(...a) + "\n");
+
+    let exitcode = 0;
+    try {
+        const resolved = require.resolve(path.resolve(script));
+        delete require.cache[resolved];
+        require(resolved);
+    } catch (e) {
+        if (e instanceof ScriptExit) {
+            exitcode = e.code;
+        } else {
+            stderr.push(String(e && e.stack ? e.stack : e) + "\n");
+            exitcode = 1;
+        }
+    } finally {
+        process.argv = saved.argv;
+        process.exit = saved.exit;
+        process.stdout.write = saved.stdoutWrite;
+        process.stderr.write = saved.stderrWrite;
+        console.log = saved.log;
+        console.error = saved.error;
+        console.warn = saved.warn;
+    }
+    return { stdout: stdout.join(""), stderr: stderr.join(""), exitcode: exitcode };
+}
+
+readline.createInterface({ input: process.stdin, terminal: false }).on("line", (line) => {
+    if (!line.trim()) {
+        return;
+    }
+    let request;
+    try {
+        request = JSON.parse(line);
+    } catch (e) {
+        writeResponse(JSON.stringify({ id: null, stdout: "", stderr: `bad request: ${e}`, exitcode: 1 }) + "\n");
+        return;
+    }
+    const response = runScript(request.script, request.args || []);
+    response.id = request.id;
+    writeResponse(JSON.stringify(response) + "\n");
+});
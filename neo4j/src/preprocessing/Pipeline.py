@@ -1,9 +1,11 @@
 from .Preprocessor import Preprocessor
+from .utils.NodeIdGenerator import NodeIdGenerator
 from py2neo import Graph
 
 
 class Pipeline:
     def trigger(self, graph: Graph) -> Graph:
+        NodeIdGenerator.use_graph(graph)
         for processor in self._processors:
             graph = processor.preprocess(graph)
         return graph
@@ -1,7 +1,7 @@
 from ..Preprocessor import Preprocessor
 from ..utils.NodeIdGenerator import NodeIdGenerator
+from ..utils.NodeWorkerPool import runJS
 
-from Naked.toolshed.shell import muterun_js
 from py2neo import Graph, Relationship, Node, Subgraph
 
 from collections import defaultdict
@@ -83,7 +83,7 @@ class PHPAsHTMLPreprocessor(Preprocessor):
 
     def _parse_html(self, path):
         """Parse an HTML file into a json object using htmlparser2 library."""
-        response = muterun_js(str(HTML_PARSER), arguments=f'{path} -from_file')
+        response = runJS(str(HTML_PARSER), [str(path), '-from_file'])
         if response.exitcode != 0:
             print(f'error. failed to parse {path}', file=sys.stderr)
             print(response.stderr, file=sys.stderr)
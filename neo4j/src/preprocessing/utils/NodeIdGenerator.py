@@ -1,9 +1,73 @@
-import random
+from typing import Callable, Optional
+import threading
+
+
+class IdAllocator:
+    """Hands out node ids above the largest id in the graph.
+
+    Each thread reserves a contiguous block of ids at a time and hands them out without locking, so the nodes one
+    thread creates get neighbouring ids and concurrent threads never collide.
+    """
+
+    def __init__(self, block_size: int = 256):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._start_provider: Optional[Callable[[], Optional[int]]] = None
+        self._next: Optional[int] = None
+        self._floor = 0
+        # Bumped whenever outstanding blocks may overlap ids that are in use, which makes threads drop their block.
+        self._generation = 0
+
+    def use_start_provider(self, provider: Callable[[], Optional[int]]):
+        """Set the function that returns the largest id in use, called once before the first id is handed out."""
+        with self._lock:
+            if self._next is None:
+                self._start_provider = provider
+
+    def reserve(self, count: int) -> range:
+        """Reserve a contiguous range of count ids."""
+        return self._reserve(count)[0]
+
+    def _reserve(self, count: int):
+        with self._lock:
+            if self._next is None:
+                max_id = self._start_provider() if self._start_provider else None
+                self._next = max((max_id if max_id is not None else -1) + 1, self._floor)
+            start = self._next
+            self._next += count
+            return range(start, start + count), self._generation
+
+    def next_id(self) -> int:
+        local = self._local
+        if getattr(local, 'generation', None) != self._generation or local.next >= local.end:
+            block, generation = self._reserve(self.block_size)
+            local.next, local.end, local.generation = block.start, block.stop, generation
+        local.next += 1
+        return local.next - 1
+
+    def reserve_above(self, max_id: int):
+        """Make sure no id up to max_id is handed out, e.g. after nodes were imported from elsewhere."""
+        with self._lock:
+            self._floor = max(self._floor, max_id + 1)
+            if self._next is not None and self._next <= max_id:
+                self._next = max_id + 1
+                self._generation += 1
+
+    @property
+    def started(self) -> bool:
+        return self._next is not None
 
 
 class NodeIdGenerator:
 
+    allocator = IdAllocator()
+
     @staticmethod
     def generate_id():
-        return random.getrandbits(32)
+        return NodeIdGenerator.allocator.next_id()
 
+    @staticmethod
+    def use_graph(graph):
+        """Start the ids after the largest node id of this graph (looked up when the first id is needed)."""
+        NodeIdGenerator.allocator.use_start_provider(lambda: graph.evaluate('MATCH (n) RETURN MAX(n.id)'))
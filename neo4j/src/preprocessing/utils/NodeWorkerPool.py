@@ -0,0 +1,256 @@
+"""Pool of long-lived Node.js processes that run the JavaScript parsers (sqlparser.js, htmlparser.js, ...).
+
+Starting node for every SQL statement or HTML file costs 50-100 ms and passes the input through a shell command line,
+which limits its length. The workers (parserworker.js) instead take newline-delimited JSON requests on stdin and answer
+on stdout, so a script's dependencies are only loaded once per worker. A worker that crashes or hangs is restarted and
+its requests are retried once; if node cannot be started at all, scripts run through muterun_js. Workers only capture
+output written synchronously, so a successful run without any output is repeated through muterun_js as well.
+"""
+
+from Naked.toolshed.shell import muterun_js
+
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+import atexit
+import itertools
+import json
+import os
+import shlex
+import subprocess
+import threading
+
+WORKER_JS = Path(__file__).resolve().parents[2] / 'parserworker.js'
+
+NODE_WORKER_POOL = os.getenv("NODE_WORKER_POOL", "1") == "1"
+NODE_WORKERS = int(os.getenv("NODE_WORKERS", str(min(4, os.cpu_count() or 1))))
+NODE_WORKER_TIMEOUT = float(os.getenv("NODE_WORKER_TIMEOUT", "120"))  # Seconds before a stuck worker is restarted
+# Requests in flight per worker before submit() blocks.
+_MAX_IN_FLIGHT = 32
+
+
+class NodeResponse(NamedTuple):
+    """Output of a script, with the same fields callers use from muterun_js's response."""
+    stdout: bytes
+    stderr: bytes
+    exitcode: int
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+class _NodeWorker:
+    """One node process; a reader thread matches response lines to the futures of their requests."""
+
+    def __init__(self) -> None:
+        self._proc = subprocess.Popen(
+            ["node", str(WORKER_JS)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+        )
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Future] = dict()
+        self._ids = itertools.count()
+        self.alive = True
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def submit(self, script: str, args: Sequence[str]) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if not self.alive:
+                raise WorkerCrashed("worker is not running")
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            try:
+                self._proc.stdin.write(json.dumps({"id": request_id, "script": script, "args": list(args)}) + "\n")
+                self._proc.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                self._pending.pop(request_id, None)
+                raise WorkerCrashed(str(e))
+        return future
+
+    def _read(self) -> None:
+        for line in self._proc.stdout:
+            try:
+                response = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(response, dict):
+                continue
+            with self._lock:
+                future = self._pending.pop(response.get("id"), None)
+            if future is not None:
+                future.set_result(
+                    NodeResponse(
+                        response.get("stdout", "").encode("utf-8"),
+                        response.get("stderr", "").encode("utf-8"),
+                        int(response.get("exitcode", 1)),
+                    ))
+        # EOF: the process exited. Fail whatever it had not answered yet.
+        with self._lock:
+            self.alive = False
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            future.set_exception(WorkerCrashed("node worker exited"))
+
+    def stop(self) -> None:
+        with self._lock:
+            self.alive = False
+        try:
+            self._proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+
+    def kill(self) -> None:
+        self._proc.kill()
+
+
+class NodeWorkerPool:
+    """Fixed number of node workers. Requests go to the least loaded worker, and submitting blocks while every worker
+    has _MAX_IN_FLIGHT requests outstanding."""
+
+    def __init__(self, size: int = NODE_WORKERS, timeout: float = NODE_WORKER_TIMEOUT) -> None:
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size * _MAX_IN_FLIGHT)
+        self._workers: List[Optional[_NodeWorker]] = [None] * self.size
+        self.requests = 0
+        self.restarts = 0
+
+    def _worker(self) -> Tuple[int, _NodeWorker]:
+        with self._lock:
+            for i, worker in enumerate(self._workers):
+                if worker is None or not worker.alive:
+                    if worker is not None:
+                        self.restarts += 1
+                    self._workers[i] = _NodeWorker()
+            i = min(range(self.size), key=lambda i: len(self._workers[i]))
+            return i, self._workers[i]
+
+    def _restart(self, worker: _NodeWorker) -> None:
+        worker.kill()
+        with self._lock:
+            for i, w in enumerate(self._workers):
+                if w is worker:
+                    self._workers[i] = None
+                    self.restarts += 1
+
+    def _submit(self, script: str, args: Sequence[str]) -> Tuple[_NodeWorker, Future]:
+        self._slots.acquire()
+        try:
+            _, worker = self._worker()
+            future = worker.submit(script, args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return worker, future
+
+    def _result(self, worker: _NodeWorker, future: Future) -> NodeResponse:
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # The script is stuck; only a new process gets the worker back.
+            self._restart(worker)
+            raise
+
+    def run(self, script: str, args: Sequence[str]) -> NodeResponse:
+        """Run a script with the given arguments, retrying once on a new worker if the worker crashes."""
+        return self.run_many(script, [args])[0]
+
+    def run_many(self, script: str, batch: Sequence[Sequence[str]]) -> List[NodeResponse]:
+        """Run a script once per argument list. The requests are spread over the workers and run concurrently."""
+        self.requests += len(batch)
+        submitted = [self._submit(script, args) for args in batch]
+        output: List[NodeResponse] = []
+        for args, (worker, future) in zip(batch, submitted):
+            try:
+                output.append(self._result(worker, future))
+            except (WorkerCrashed, FutureTimeoutError):
+                worker, future = self._submit(script, args)
+                output.append(self._result(worker, future))
+        return output
+
+    def close(self) -> None:
+        with self._lock:
+            workers = [w for w in self._workers if w is not None]
+            self._workers = [None] * self.size
+        for worker in workers:
+            worker.stop()
+
+
+global __NODE_WORKER_POOL, __NODE_WORKER_POOL_LOCK, __NODE_WORKER_POOL_FAILED
+__NODE_WORKER_POOL: Optional[NodeWorkerPool] = None
+__NODE_WORKER_POOL_LOCK = threading.Lock()
+__NODE_WORKER_POOL_FAILED = False
+
+
+def getNodeWorkerPool() -> Optional[NodeWorkerPool]:
+    """Get the worker pool, starting it on first use. None if NODE_WORKER_POOL is off or node cannot be started."""
+    global __NODE_WORKER_POOL, __NODE_WORKER_POOL_FAILED
+    if not NODE_WORKER_POOL or __NODE_WORKER_POOL_FAILED:
+        return None
+    with __NODE_WORKER_POOL_LOCK:
+        if __NODE_WORKER_POOL is None:
+            pool = NodeWorkerPool()
+            try:
+                pool._worker()
+            except OSError as e:
+                print(f"Could not start node workers ({e}); falling back to one node process per script run.")
+                __NODE_WORKER_POOL_FAILED = True
+                return None
+            atexit.register(pool.close)
+            __NODE_WORKER_POOL = pool
+    return __NODE_WORKER_POOL
+
+
+def runJS(script: str, args: Sequence[str]) -> NodeResponse:
+    """Run a JavaScript file like `node script args...` and return its output.
+
+    Args:
+        script (str): Path of the script.
+        args (Sequence[str]): Arguments, passed as they are (no shell quoting needed).
+
+    Returns:
+        NodeResponse: The script's stdout, stderr and exit code.
+    """
+    return runJSMany(script, [args])[0]
+
+
+def runJSMany(script: str, batch: Sequence[Sequence[str]]) -> List[NodeResponse]:
+    """Run a JavaScript file once for each list of arguments; see runJS."""
+    pool = getNodeWorkerPool()
+    if pool is not None:
+        try:
+            output = pool.run_many(script, batch)
+        except (WorkerCrashed, FutureTimeoutError) as e:
+            print(f"Node worker failed twice running {script} ({e!r}); running it in a separate process.")
+        else:
+            # A script that writes its output asynchronously (after a callback or promise) exits 0 in the worker
+            # before printing anything; run it on its own so the output is not lost.
+            return [
+                _runProcess(script, args) if response.exitcode == 0 and not response.stdout.strip() else response
+                for args, response in zip(batch, output)
+            ]
+    return [_runProcess(script, args) for args in batch]
+
+
+def _runProcess(script: str, args: Sequence[str]) -> NodeResponse:
+    response = muterun_js(script, arguments=" ".join(shlex.quote(a) for a in args))
+    return NodeResponse(response.stdout, response.stderr, response.exitcode)
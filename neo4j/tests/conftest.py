@@ -6,8 +6,12 @@ import requests
 
 from pathlib import Path
 import random, string
+import os, sys
 import uuid
 
+# Modules in src import each other by their bare names (e.g. "from Settings import ..."), as when running src/Main.py.
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
 SERVICE_NAME = 'neo4j'
 BOLT_PORT = 7687
 REST_PORT = 7474
@@ -1,6 +1,43 @@
-from src.preprocessing.utils.NodeIdGenerator import NodeIdGenerator
+from src.preprocessing.utils.NodeIdGenerator import IdAllocator, NodeIdGenerator
+
+import threading
 
 
 def test_generate_node():
     nid = NodeIdGenerator.generate_id()
     assert type(nid) is int
+
+
+def test_allocator_starts_after_max_id():
+    allocator = IdAllocator(block_size=4)
+    allocator.use_start_provider(lambda: 41)
+    assert [allocator.next_id() for _ in range(6)] == [42, 43, 44, 45, 46, 47]
+
+
+def test_allocator_threads_get_unique_contiguous_ids():
+    allocator = IdAllocator(block_size=10)
+    allocator.use_start_provider(lambda: None)
+    ids = {}
+
+    def allocate(name):
+        ids[name] = [allocator.next_id() for _ in range(100)]
+
+    threads = [threading.Thread(target=allocate, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    all_ids = [i for thread_ids in ids.values() for i in thread_ids]
+    assert len(set(all_ids)) == 400
+    assert sorted(all_ids) == list(range(400))
+    for thread_ids in ids.values():
+        assert thread_ids[:10] == list(range(thread_ids[0], thread_ids[0] + 10))
+
+
+def test_allocator_reserve_above():
+    allocator = IdAllocator(block_size=16)
+    allocator.use_start_provider(lambda: 0)
+    assert allocator.next_id() == 1
+    allocator.reserve_above(100)
+    assert allocator.next_id() == 101
@@ -0,0 +1,73 @@
+import CallNameIndex as call_name_index
+from CallNameIndex import CallEntry, CallNameIndex, cypherPatternToPython
+
+import random
+import re
+
+
+def entry(call_id, name, class_name=None):
+    return CallEntry({"id": call_id}, {"code": name}, class_name)
+
+
+def test_cypher_pattern_to_python():
+    # Patterns as they appear between the quotes of `=~ "..."` in a Cypher query.
+    assert cypherPatternToPython(r"wp\\.insert") == r"wp\.insert"
+    assert cypherPatternToPython(r"(?i)\\w+_meta") == r"(?i)\w+_meta"
+    assert cypherPatternToPython(r"a\tb\nc") == "a\tb\nc"
+    assert cypherPatternToPython(r"say \"hi\" or \'bye\'") == "say \"hi\" or 'bye'"
+    assert cypherPatternToPython(r"\\\\") == "\\\\"
+    assert re.fullmatch(cypherPatternToPython(r"wp\\.insert"), "wp.insert")
+    assert not re.fullmatch(cypherPatternToPython(r"wp\\.insert"), "wpxinsert")
+
+
+def test_match_call_ids_matches_brute_force():
+    rng = random.Random(8)
+    names = ["get_option", "update_option", "add_option", "wp_insert_post", "wp_mail", "encrypt", "Encrypt", "md5"]
+    classes = ["WP_User", "Crypto", None]
+    entries = [entry(i, rng.choice(names), rng.choice(classes)) for i in range(200)]
+    index = CallNameIndex(entries)
+    for pattern in [r".*_option", r"(?i)encrypt", r"wp_.*", r"md", r"Crypto", r"WP_\\w+", r"get_option|md5"]:
+        regex = re.compile(cypherPatternToPython(pattern))
+        expected = {
+            e.call["id"]
+            for e in entries
+            if regex.fullmatch(e.name["code"]) or (e.class_name is not None and regex.fullmatch(e.class_name))
+        }
+        found = index.match_call_ids(pattern)
+        assert len(found) == len(set(found))
+        assert set(found) == expected
+
+
+def test_match_is_a_full_match():
+    index = CallNameIndex([entry(1, "get_option"), entry(2, "get_options")])
+    assert [e.call["id"] for e in index.match("get_option")] == [1]
+    assert index.match_call_ids("option") == []
+
+
+def test_unsupported_pattern_returns_none():
+    index = CallNameIndex([entry(1, "get_option")])
+    assert index.match("(?<name>get)_option") is None
+    assert index.match_call_ids("(?<name>get)_option") is None
+
+
+def test_static_calls_match_by_method_and_class_name(monkeypatch):
+    queries = []
+
+    class FakeGraph:
+        def run(self, query, **parameters):
+            queries.append(query)
+            # Crypto::encrypt($data) and a plain call.
+            return [
+                {"call": {"id": 1, "type": "AST_STATIC_CALL"}, "name": {"id": 4, "code": "encrypt"}, "class_name": "Crypto"},
+                {"call": {"id": 2, "type": "AST_CALL"}, "name": {"id": 6, "code": "md5"}, "class_name": None},
+            ]
+
+    monkeypatch.setattr(call_name_index, "getGraph", lambda: FakeGraph())
+    index = CallNameIndex.from_neo4j()
+    # The method name of a static call is its string child 1; the class is the AST_NAME child 0.
+    assert re.search(r'AST_STATIC_CALL"}\)-\[:PARENT_OF\]->\s*\(name:AST{type:"string", childnum:1}\)', queries[0])
+    assert re.search(r'AST_NAME", childnum:0}\)-\[:PARENT_OF\]->\s*\(class:AST', queries[0])
+    assert list(index.by_class) == ["Crypto"]
+    assert index.match_call_ids("encrypt") == [1]
+    assert index.match_call_ids("Crypto") == [1]
+    assert index.match_call_ids("md5|Crypto") == [2, 1]
@@ -0,0 +1,112 @@
+import DataFlowTracking
+import ReachabilityIndex as reachability
+from MemoryGraph import MemoryGraph
+from ReachabilityIndex import ReachabilityIndex
+
+import pytest
+import random
+import re
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def data(self):
+        return self.rows
+
+
+class CypherGraph:
+    """Answers the getSources/getSinks queries like Neo4j: one row per path, where a path never reuses an edge."""
+
+    def __init__(self, edges, ast_nodes):
+        self.edges = edges
+        self.ast_nodes = ast_nodes
+
+    def evaluate(self, query, id=None):
+        return {"id": id}
+
+    def run(self, cypher, **parameters):
+        variable, start = re.search(r"\((\w):AST\{id:(\d+)\}\)", cypher).groups()
+        reverse = variable == "m"
+        bound = re.search(r"\*0\.\.(\d+)", cypher)
+        min_length, max_length = (0, int(bound.group(1))) if bound else (1, len(self.edges))
+        start = int(start)
+        if start not in self.ast_nodes:
+            return FakeResult([])
+        outgoing = [(b, a) if reverse else (a, b) for a, b in self.edges]
+        rows = []
+
+        def walk(node, used, length):
+            if length >= min_length and node in self.ast_nodes and not any(a == node for a, _ in outgoing):
+                rows.append({"n" if reverse else "m": {"id": node}})
+            if length == max_length:
+                return
+            for i, (a, b) in enumerate(outgoing):
+                if a == node and i not in used:
+                    walk(b, used | {i}, length + 1)
+
+        walk(start, frozenset(), 0)
+        return FakeResult(rows)
+
+
+def random_case(rng):
+    edges = [(rng.randrange(10), rng.randrange(10)) for _ in range(rng.randrange(5, 14))]
+    nodes = {n for edge in edges for n in edge}
+    ast_nodes = {n for n in nodes if rng.random() < 0.8}
+    return edges, nodes, ast_nodes
+
+
+def memory_graph(edges, nodes, ast_nodes):
+    graph = MemoryGraph()
+    for n in nodes:
+        graph.add_node(n, ["AST"] if n in ast_nodes else ["AST_HTML"], dict())
+    for a, b in edges:
+        graph.add_edge(a, b, DataFlowTracking.RELATIONSHIP_TYPES[0])
+    return graph
+
+
+def results(start):
+    return (
+        [n["id"] for n in DataFlowTracking.getSources(start)],
+        [n["id"] for n in DataFlowTracking.getSources(start, no_constraint=True)],
+        [n["id"] for n in DataFlowTracking.getSinks(start)],
+    )
+
+
+@pytest.fixture(autouse=True)
+def short_paths(monkeypatch):
+    monkeypatch.setattr(DataFlowTracking, "maxTraversalLength", 3)
+
+
+def test_backends_return_the_same_terminals(monkeypatch):
+    rng = random.Random(7)
+    for _ in range(60):
+        edges, nodes, ast_nodes = random_case(rng)
+        cypher = CypherGraph(edges, ast_nodes)
+        monkeypatch.setattr(DataFlowTracking, "getGraph", lambda: cypher)
+        monkeypatch.setattr(reachability, "getGraph", lambda: cypher)
+
+        monkeypatch.setattr(DataFlowTracking, "getReachabilityIndex", lambda: None)
+        monkeypatch.setattr(DataFlowTracking, "getMemoryGraph", lambda: None)
+        from_cypher = {start: results(start) for start in nodes}
+
+        graph = memory_graph(edges, nodes, ast_nodes)
+        monkeypatch.setattr(DataFlowTracking, "getMemoryGraph", lambda: graph)
+        from_memory = {start: results(start) for start in nodes}
+
+        index = ReachabilityIndex(edges, ast_nodes)
+        monkeypatch.setattr(DataFlowTracking, "getReachabilityIndex", lambda: index)
+        from_index = {start: results(start) for start in nodes}
+
+        assert from_cypher == from_memory
+        assert from_cypher == from_index
+
+
+def test_a_source_reached_by_several_paths_is_returned_once(monkeypatch):
+    edges = [(1, 2), (1, 3), (2, 4), (3, 4)]
+    cypher = CypherGraph(edges, {1, 2, 3, 4})
+    monkeypatch.setattr(DataFlowTracking, "getGraph", lambda: cypher)
+    monkeypatch.setattr(DataFlowTracking, "getReachabilityIndex", lambda: None)
+    monkeypatch.setattr(DataFlowTracking, "getMemoryGraph", lambda: None)
+    assert [n["id"] for n in DataFlowTracking.getSources(4)] == [1]
@@ -0,0 +1,69 @@
+from Detectors.Manager import _FindingTree
+
+import random
+
+
+def random_forest(rng, size, roots):
+    """Edges (parent, child) of a random forest over the nodes 0..size-1."""
+    edges = []
+    for node in range(roots, size):
+        edges.append((rng.randrange(node), node))
+    rng.shuffle(edges)
+    return edges
+
+
+def ancestors(parent, node):
+    """The node itself and its ancestors, nearest first."""
+    output = [node]
+    while output[-1] in parent:
+        output.append(parent[output[-1]])
+    return output
+
+
+def test_enclosing_findings_match_parent_chains():
+    rng = random.Random(0)
+    for _ in range(20):
+        edges = random_forest(rng, 60, 3)
+        parent = {child: parent for parent, child in edges}
+        findings = {n: [f"finding-{n}"] for n in rng.sample(range(60), 12)}
+        tree = _FindingTree(findings, edges)
+        for node in range(60):
+            expected = [f for a in ancestors(parent, node) for f in findings.get(a, [])]
+            assert tree.enclosing_findings(node) == expected
+
+
+def test_nearest_contained_finding_is_the_shallowest_strict_descendant():
+    rng = random.Random(1)
+    for _ in range(20):
+        edges = random_forest(rng, 60, 3)
+        parent = {child: parent for parent, child in edges}
+        depth = {n: len(ancestors(parent, n)) - 1 for n in range(60)}
+        findings = {n: [f"finding-{n}"] for n in rng.sample(range(60), 12)}
+        tree = _FindingTree(findings, edges)
+        for node in range(60):
+            below = [n for n in findings if n != node and node in ancestors(parent, n)]
+            if not below:
+                assert tree.nearest_contained_finding(node) is None
+                continue
+            # Ties between findings at the same depth go to the one visited first.
+            best = min(below, key=lambda n: (depth[n], tree.enter[n]))
+            assert tree.nearest_contained_finding(node) == findings[best][0]
+
+
+def test_non_ast_nodes_have_no_findings():
+    edges = [(0, 1), (1, 2), (2, 3)]
+    findings = {1: ["outer"], 3: ["inner"]}
+    tree = _FindingTree(findings, edges, non_ast={2})
+    assert tree.enclosing_findings(2) == []
+    assert tree.nearest_contained_finding(2) is None
+    assert tree.enclosing_findings(3) == ["inner", "outer"]
+    assert tree.nearest_contained_finding(0) == "outer"
+
+
+def test_second_parents_and_self_loops_are_ignored():
+    edges = [(0, 1), (1, 1), (0, 2), (2, 1)]
+    findings = {1: ["finding"]}
+    tree = _FindingTree(findings, edges)
+    assert tree.enclosing_findings(1) == ["finding"]
+    assert tree.nearest_contained_finding(0) == "finding"
+    assert tree.nearest_contained_finding(2) is None
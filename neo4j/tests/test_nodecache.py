@@ -0,0 +1,92 @@
+from NodeCache import BoundedCache
+
+from collections import OrderedDict
+import pytest
+import random
+
+
+def test_lru_matches_reference_model():
+    rng = random.Random(6)
+    cache = BoundedCache(8, "lru")
+    model = OrderedDict()
+    hits = 0
+    for step in range(5000):
+        key = rng.randrange(20)
+        if rng.random() < 0.5:
+            expected = model.get(key, None)
+            if key in model:
+                model.move_to_end(key)
+                hits += 1
+            assert cache.get(key) == expected
+        else:
+            model.pop(key, None)
+            model[key] = step
+            while len(model) > 8:
+                model.popitem(last=False)
+            cache.put(key, step, size=1)
+        assert len(cache) == len(model)
+    assert cache.hits == hits
+    assert all(key in cache for key in model)
+
+
+@pytest.mark.parametrize("policy", ["lru", "arc"])
+def test_values_are_never_stale_and_size_is_bounded(policy):
+    rng = random.Random(7)
+    cache = BoundedCache(100, policy)
+    latest = dict()
+    for step in range(5000):
+        key = rng.randrange(60)
+        action = rng.random()
+        if action < 0.5:
+            value = cache.get(key)
+            assert value is None or value == latest[key]
+        elif action < 0.9:
+            latest[key] = step
+            cache.put(key, step, size=rng.randrange(1, 20))
+        else:
+            cache.discard(key)
+            assert key not in cache
+        assert cache.bytes <= 100
+
+
+def test_arc_keeps_frequently_used_entries_during_a_scan():
+    caches = {policy: BoundedCache(10, policy) for policy in ("lru", "arc")}
+    for cache in caches.values():
+        for key in range(5):
+            cache.put(key, key, size=1)
+        for key in range(5):
+            cache.get(key)
+        for key in range(100, 200):
+            cache.put(key, key, size=1)
+    assert all(key in caches["arc"] for key in range(5))
+    assert not any(key in caches["lru"] for key in range(5))
+
+
+def test_on_evict_is_called_with_evicted_keys():
+    evicted = []
+    cache = BoundedCache(3, "lru", on_evict=evicted.append)
+    for key in range(5):
+        cache.put(key, key, size=1)
+    assert evicted == [0, 1]
+    assert cache.evictions == 2
+
+
+def test_entry_larger_than_the_bound_is_kept_alone():
+    cache = BoundedCache(10, "lru")
+    cache.put("a", "a", size=5)
+    cache.put("b", "b", size=50)
+    assert "a" not in cache
+    assert cache.get("b") == "b"
+
+
+def test_clear():
+    cache = BoundedCache(10, "arc")
+    for key in range(20):
+        cache.put(key, key, size=1)
+    cache.clear()
+    assert len(cache) == 0 and cache.bytes == 0
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        BoundedCache(10, "fifo")
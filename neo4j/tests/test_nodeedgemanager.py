@@ -0,0 +1,94 @@
+import NodeEdgeManager
+
+import csv
+import subprocess
+
+
+def write_tab_file(path, rows):
+    # The NAVEX exports start with a header line.
+    with open(path, "w") as f:
+        f.write("header\n")
+        for row in rows:
+            f.write("\t".join(row) + "\n")
+
+
+def read_admin_file(path):
+    with open(path, newline="") as f:
+        return list(csv.reader(f))
+
+
+def test_base_csv_leaves_missing_fields_empty(tmp_path, monkeypatch):
+    nodes = tmp_path / "nodes.csv"
+    edges = tmp_path / "edges.csv"
+    cpg_edges = tmp_path / "cpg_edges.csv"
+    write_tab_file(nodes, [
+        ["1", "AST", "AST_CALL", "", "3", '""', "0", "7", "''", "", "", "", ""],
+        ["2", "AST", "string", "", "3", "foo", "0", "7", "", "", "", "", ""],
+    ])
+    write_tab_file(edges, [["1", "2", "PARENT_OF"]])
+    write_tab_file(cpg_edges, [["1", "2", "REACHES", "$x"]])
+    monkeypatch.setattr(NodeEdgeManager, "NODES_CSV_FILE_LOC", str(nodes))
+    monkeypatch.setattr(NodeEdgeManager, "EDGES_CSV_FILE_LOC", str(edges))
+    monkeypatch.setattr(NodeEdgeManager, "CPG_EDGES_CSV_FILE_LOC", str(cpg_edges))
+    monkeypatch.setattr(NodeEdgeManager, "getResultsPath", lambda: str(tmp_path / "results"))
+
+    directory = NodeEdgeManager.writeBaseCSV()
+    rows = read_admin_file(f"{directory}/{NodeEdgeManager.NODE_FILE_NAME}")
+    assert rows[0] == NodeEdgeManager.ADMIN_NODE_HEADER
+    # The quoted empty code and classname are missing values for isFieldNull, so neo4j-admin must skip them too.
+    assert rows[1] == ["1", "AST", "AST_CALL", "", "3", "", "0", "7", "", "", "", "", ""]
+    assert rows[2][5] == "foo"
+    cpg_rows = read_admin_file(f"{directory}/{NodeEdgeManager.CPG_EDGE_FILE_NAME}")
+    assert cpg_rows[1] == ["1", "2", "REACHES", "$x", "", "", ""]
+
+
+def test_offline_import_skips_empty_strings(tmp_path, monkeypatch):
+    commands = []
+
+    def run(command, **kwargs):
+        commands.append(command)
+        return subprocess.CompletedProcess(command, 0, "", "")
+
+    monkeypatch.setattr(NodeEdgeManager.subprocess, "run", run)
+    monkeypatch.setattr(NodeEdgeManager, "writeBaseCSV", lambda: str(tmp_path))
+    monkeypatch.setattr(NodeEdgeManager, "getResultsPath", lambda: str(tmp_path / "results"))
+    (tmp_path / NodeEdgeManager.NODE_FILE_NAME).write_text("")
+
+    assert NodeEdgeManager.offlineImport("plugin", up_to_step=0)
+    assert "--ignore-empty-strings=true" in commands[0]
+    assert "--database=plugin" in commands[0]
+    assert f"--nodes={tmp_path / NodeEdgeManager.NODE_FILE_NAME}" in commands[0]
+
+
+def test_offline_load_restarts_neo4j_around_the_import(monkeypatch):
+    calls = []
+
+    class FakeGraph:
+        def evaluate(self, query):
+            calls.append("query")
+            return 1
+
+    def run(command, **kwargs):
+        calls.append(command[1])
+        return subprocess.CompletedProcess(command, 0, "", "")
+
+    monkeypatch.setattr(NodeEdgeManager.subprocess, "run", run)
+    monkeypatch.setattr(NodeEdgeManager, "offlineImport", lambda *a, **k: calls.append("import") or True)
+    monkeypatch.setattr(NodeEdgeManager, "getGraph", lambda: FakeGraph())
+
+    assert NodeEdgeManager.offlineLoadBaseGraph("plugin")
+    assert calls == ["stop", "import", "start", "query"]
+
+
+def test_input_max_id_needs_the_navex_exports(tmp_path, monkeypatch):
+    nodes = tmp_path / "nodes.csv"
+    write_tab_file(nodes, [["1", "AST"], ["12", "AST"], ["5", "AST"]])
+    monkeypatch.setattr(NodeEdgeManager, "NODES_CSV_FILE_LOC", str(nodes))
+    monkeypatch.setattr(NodeEdgeManager, "EDGES_CSV_FILE_LOC", str(tmp_path / "edges.csv"))
+    monkeypatch.setattr(NodeEdgeManager, "CPG_EDGES_CSV_FILE_LOC", str(tmp_path / "cpg_edges.csv"))
+    # Without every export the input hash is only a summary of Neo4j, so the value cache must not be enabled.
+    assert NodeEdgeManager.computeInputMaxId() is None
+
+    write_tab_file(tmp_path / "edges.csv", [])
+    write_tab_file(tmp_path / "cpg_edges.csv", [])
+    assert NodeEdgeManager.computeInputMaxId() == 12
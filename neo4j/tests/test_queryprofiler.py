@@ -0,0 +1,52 @@
+from QueryProfiler import ProfilingGraph, QueryProfiler, normalizeQuery
+
+
+def test_normalize_query_replaces_literals():
+    assert normalizeQuery("MATCH (n:AST{id:42}) RETURN n") == "MATCH (n:AST{id:?}) RETURN n"
+    assert normalizeQuery("MATCH (n{code:'it\\'s', name:\"x\\\"y\"}) RETURN n") == "MATCH (n{code:?, name:?}) RETURN n"
+    assert normalizeQuery("WHERE n.id IN [1, 2, -3] AND n.x > 1.5") == "WHERE n.id IN [?] AND n.x > ?"
+    assert normalizeQuery("WHERE n.type IN ['AST_CALL', 'AST_NEW']") == "WHERE n.type IN [?]"
+
+
+def test_normalize_query_keeps_identifiers_and_structure():
+    assert normalizeQuery("MATCH (n1:AST)-[:PARENT_OF*0..10]->(m) RETURN n1") == \
+        "MATCH (n1:AST)-[:PARENT_OF*0..10]->(m) RETURN n1"
+    assert normalizeQuery("RETURN $param2, n.prop3") == "RETURN $param2, n.prop3"
+    assert normalizeQuery("MATCH (n)\n\n    RETURN   n") == "MATCH (n) RETURN n"
+
+
+def test_same_template_for_different_nodes():
+    queries = [f"MATCH (n:AST{{id:{i}}})-[:PARENT_OF]->(c) WHERE c.code = '{i}' RETURN c" for i in range(100)]
+    assert len({normalizeQuery(q) for q in queries}) == 1
+
+
+class FakeCursor(list):
+
+    def data(self):
+        return list(self)
+
+
+class FakeGraph:
+
+    def run(self, cypher, parameters=None, **kwparameters):
+        return FakeCursor([1, 2, 3])
+
+    def evaluate(self, cypher, parameters=None, **kwparameters):
+        return None
+
+
+def test_profiling_graph_records_calls_and_rows():
+    profiler = QueryProfiler()
+    graph = ProfilingGraph(FakeGraph(), profiler)
+    for i in range(3):
+        list(graph.run(f"MATCH (n{{id:{i}}}) RETURN n"))
+    graph.run("MATCH (n{id:9}) RETURN n").data()
+    graph.evaluate("MATCH (n{id:1}) RETURN n.code")
+
+    report = {s["template"]: s for s in profiler.report()}
+    assert report["MATCH (n{id:?}) RETURN n"]["calls"] == 4
+    assert report["MATCH (n{id:?}) RETURN n"]["rows"] == 12
+    assert report["MATCH (n{id:?}) RETURN n.code"]["rows"] == 0
+    assert profiler.calls == 5
+    profiler.reset()
+    assert profiler.report() == [] and profiler.calls == 0
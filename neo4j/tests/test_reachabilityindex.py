@@ -0,0 +1,100 @@
+import ReachabilityIndex as reachability
+from ReachabilityIndex import ReachabilityIndex
+
+from collections import deque
+import pytest
+import random
+
+
+class FakeGraph:
+    def evaluate(self, query, id=None):
+        return {"id": id}
+
+    def run(self, query, **parameters):
+        return []
+
+
+@pytest.fixture(autouse=True)
+def fake_graph(monkeypatch):
+    monkeypatch.setattr(reachability, "getGraph", lambda: FakeGraph())
+
+
+def distances(edges, start):
+    """Length of the shortest path of at least one edge from start to every node it reaches."""
+    adjacency = dict()
+    for a, b in edges:
+        adjacency.setdefault(a, []).append(b)
+    output = dict()
+    queue = deque((b, 1) for b in adjacency.get(start, []))
+    while queue:
+        node, depth = queue.popleft()
+        if node in output:
+            continue
+        output[node] = depth
+        queue.extend((b, depth + 1) for b in adjacency.get(node, []))
+    return output
+
+
+def random_case(rng):
+    edges = [(rng.randrange(30), rng.randrange(30)) for _ in range(rng.randrange(10, 60))]
+    nodes = {n for edge in edges for n in edge}
+    ast_nodes = {n for n in nodes if rng.random() < 0.8}
+    return edges, nodes, ast_nodes
+
+
+def test_has_path_matches_brute_force():
+    rng = random.Random(3)
+    for _ in range(100):
+        edges, nodes, ast_nodes = random_case(rng)
+        index = ReachabilityIndex(edges, ast_nodes)
+        for start in nodes:
+            reached = distances(edges, start)
+            for end in nodes:
+                assert index.has_path(start, end) == (end in reached)
+    assert not index.has_path(1000, 1001)
+
+
+def test_unbounded_terminals_match_brute_force():
+    rng = random.Random(4)
+    for _ in range(100):
+        edges, nodes, ast_nodes = random_case(rng)
+        sinks = {n for n in ast_nodes if not any(a == n for a, _ in edges)}
+        sources = {n for n in ast_nodes if not any(b == n for _, b in edges)}
+        reversed_edges = [(b, a) for a, b in edges]
+        index = ReachabilityIndex(edges, ast_nodes)
+        for start in ast_nodes:
+            expected_sinks = (set(distances(edges, start)) | {start}) & sinks
+            expected_sources = (set(distances(reversed_edges, start)) | {start}) & sources
+            found_sinks = [n["id"] for n in index.terminals(start)]
+            found_sources = [n["id"] for n in index.terminals(start, reverse=True)]
+            assert sorted(found_sinks) == sorted(expected_sinks)
+            assert sorted(found_sources) == sorted(expected_sources)
+            assert [n["id"] for n in index.terminals(start, include_self=False)] == \
+                [n for n in found_sinks if n != start]
+
+
+def test_bounded_terminals_match_brute_force():
+    rng = random.Random(5)
+    for _ in range(100):
+        edges, nodes, ast_nodes = random_case(rng)
+        sinks = {n for n in ast_nodes if not any(a == n for a, _ in edges)}
+        index = ReachabilityIndex(edges, ast_nodes)
+        for start in ast_nodes:
+            reached = distances(edges, start)
+            reached[start] = 0
+            for max_depth in (0, 1, 3):
+                expected = {n for n in sinks if n in reached and reached[n] <= max_depth}
+                found = [n["id"] for n in index.terminals(start, max_depth=max_depth)]
+                assert sorted(found) == sorted(expected)
+                assert [reached[n] for n in found] == sorted(reached[n] for n in found)
+
+
+def test_terminals_of_node_without_edges_is_itself():
+    index = ReachabilityIndex([(1, 2)], {1, 2})
+    assert index.terminals(7) == [{"id": 7}]
+    assert index.terminals(7, include_self=False) == []
+
+
+def test_terminals_of_non_ast_node_are_empty():
+    index = ReachabilityIndex([(1, 2)], {2})
+    assert index.terminals(1) == []
@@ -0,0 +1,69 @@
+from TaintPropagation import BitSet, TaintGraph
+
+import random
+
+
+def reachable(edges, start):
+    seen = {start}
+    stack = [start]
+    while stack:
+        node = stack.pop()
+        for a, b in edges:
+            if a == node and b not in seen:
+                seen.add(b)
+                stack.append(b)
+    return seen
+
+
+def random_graph(rng, nodes, edge_count):
+    return [(rng.randrange(nodes), rng.randrange(nodes)) for _ in range(edge_count)]
+
+
+def test_cycle_is_one_component():
+    graph = TaintGraph([1], [(1, 2), (2, 3), (3, 1), (3, 4)])
+    components = {graph.component[graph.position(i)] for i in (1, 2, 3)}
+    assert len(components) == 1
+    assert graph.component[graph.position(4)] not in components
+
+
+def test_components_are_topologically_ordered():
+    rng = random.Random(1)
+    for _ in range(50):
+        graph = TaintGraph([0], random_graph(rng, 30, 60))
+        for c, successors in enumerate(graph.component_successors()):
+            assert all(c < d for d in successors)
+
+
+def test_propagate_matches_brute_force():
+    rng = random.Random(2)
+    for _ in range(100):
+        edges = random_graph(rng, 25, rng.randrange(10, 60))
+        seeds = rng.sample(range(25), 4)
+        graph = TaintGraph(seeds, edges)
+        values = {s: frozenset([s]) for s in seeds}
+
+        result = graph.propagate(values, lambda a, b: a | b)
+
+        expected = dict()
+        for s in seeds:
+            for node in reachable(edges, s):
+                expected[node] = expected.get(node, frozenset()) | {s}
+        assert result == expected
+
+
+def test_propagate_ignores_unknown_nodes():
+    graph = TaintGraph([1], [(1, 2)])
+    assert graph.propagate({1: 1, 99: 2}, max) == {1: 1, 2: 1}
+
+
+def test_deep_chain_does_not_recurse():
+    graph = TaintGraph([0], [(i, i + 1) for i in range(20000)])
+    assert graph.propagate({0: True}, lambda a, b: a or b)[20000] is True
+
+
+def test_bitset_round_trip():
+    bits = BitSet(["a", "b"])
+    mask = bits.encode(["c", "a", "c"])
+    assert sorted(bits.decode(mask)) == ["a", "c"]
+    assert bits.decode(mask | bits.encode(["b"])) == ["a", "b", "c"]
+    assert bits.decode(0) == []